@@ -0,0 +1,213 @@
+"""Semantic cache of agent answers per contract.
+
+Questions are embedded locally with chromadb's default ONNX embedding model
+and compared by cosine similarity against the questions previously answered
+for the same contract, held in a small NumPy matrix per contract. A match
+above ``ANSWER_CACHE_THRESHOLD`` is answered from the cache without running
+the agent. Entries of a contract are dropped when its fill result or
+validation report changes, and expire after ``ANSWER_CACHE_TTL_SECONDS``.
+
+Only the first question of a chat is looked up and stored. A follow up like
+"and the second one?" depends on the earlier turns of its chat, so its
+answer is not reused for the same words in another chat.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+from langchain.messages import AnyMessage
+
+from connectors.cache_tier import CacheTier
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("AGENT_ANSWER_CACHE_THRESHOLD", 0.92))
+ANSWER_CACHE_MAX_CONTRACTS = int(os.environ.get("AGENT_ANSWER_CACHE_MAX_CONTRACTS", 1024))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("AGENT_ANSWER_CACHE_MAX_ENTRIES", 256))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("AGENT_ANSWER_CACHE_TTL", 3600))
+# contracts whose last invalidation is remembered for answers still being generated
+ANSWER_CACHE_MAX_INVALIDATIONS = int(os.environ.get("AGENT_ANSWER_CACHE_MAX_INVALIDATIONS", 10000))
+
+# namespace of answer_cache invalidations in the shared tier
+TIER_NAMESPACE = "answers"
+
+
+@dataclass
+class ContractAnswers:
+    """Normalized question embeddings of a contract, row aligned with the answers."""
+    embeddings: Optional[np.ndarray] = None
+    questions: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    stored_at: List[float] = field(default_factory=list)
+
+    def drop_expired(self, expired_before: float):
+        """Drops the rows stored before expired_before, rows are in store order."""
+        keep = 0
+        while keep < len(self.stored_at) and self.stored_at[keep] < expired_before:
+            keep += 1
+        if keep == 0:
+            return
+        self.questions = self.questions[keep:]
+        self.answers = self.answers[keep:]
+        self.stored_at = self.stored_at[keep:]
+        self.embeddings = self.embeddings[keep:] if self.questions else None
+
+
+def is_first_turn(messages: Sequence[AnyMessage], history_summary: Optional[str] = None) -> bool:
+    """True if a question starts its chat, only those answers are cached."""
+    if history_summary:
+        return False
+    return not any(msg.type != "system" for msg in messages)
+
+
+class AnswerCache:
+    """Per-contract cosine similarity index of answered questions."""
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_contracts: int = ANSWER_CACHE_MAX_CONTRACTS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_invalidations: int = ANSWER_CACHE_MAX_INVALIDATIONS,
+    ):
+        self.threshold = threshold
+        self.max_contracts = max_contracts
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_invalidations = max_invalidations
+        self.hits = 0
+        self.misses = 0
+        self._contracts: "OrderedDict[str, ContractAnswers]" = OrderedDict()
+        # invalidations are numbered; contract_id -> number of its last one,
+        # the least recent are forgotten beyond max_invalidations
+        self._invalidations: "OrderedDict[str, int]" = OrderedDict()
+        self._sequence = 0
+        # number of the last forgotten invalidation
+        self._forgotten = 0
+        self._embedding_function = None
+        self._lock = threading.Lock()
+        self.tier: Optional[CacheTier] = None
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embeds the text locally and normalizes it to unit length."""
+        if self._embedding_function is None:
+            self._embedding_function = DefaultEmbeddingFunction()
+        vector = np.asarray(self._embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, contract_id: str, question: str) -> Optional[str]:
+        """
+        Returns the answer of the most similar question asked about the contract,
+        if its similarity reaches the threshold.
+        """
+        with self._lock:
+            entry = self._contracts.get(contract_id)
+            if entry is None or entry.embeddings is None:
+                self.misses += 1
+                return None
+
+        query = self.embed(question)
+
+        with self._lock:
+            entry = self._contracts.get(contract_id)
+            if entry is not None:
+                entry.drop_expired(time.monotonic() - self.ttl_seconds)
+            if entry is None or entry.embeddings is None:
+                self.misses += 1
+                return None
+
+            scores = entry.embeddings @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._contracts.move_to_end(contract_id)
+            self.hits += 1
+            logger.debug(
+                f"answer cache hit for contract_id: {contract_id} (similarity {scores[best]:.3f})"
+            )
+            return entry.answers[best]
+
+    def generation(self, contract_id: str) -> int:
+        """The number of the last invalidation, taken before a run for the contract starts."""
+        with self._lock:
+            return self._sequence
+
+    def _invalidated_since(self, contract_id: str, generation: int) -> bool:
+        # caller holds self._lock; a forgotten invalidation may have been of
+        # this contract, so answers started before it are treated as stale
+        return self._invalidations.get(contract_id, self._forgotten) > generation
+
+    def store(self, contract_id: str, question: str, answer: str, generation: Optional[int] = None):
+        """
+        Adds an answered question of the contract, evicting the oldest entries when full.
+
+        Args:
+            generation: The generation of the contract when the answer was started.
+                The answer is dropped if the contract was invalidated meanwhile.
+        """
+        vector = self.embed(question)
+
+        with self._lock:
+            if generation is not None and self._invalidated_since(contract_id, generation):
+                logger.debug(f"dropping stale answer for contract_id: {contract_id}")
+                return
+
+            entry = self._contracts.setdefault(contract_id, ContractAnswers())
+            self._contracts.move_to_end(contract_id)
+
+            if entry.embeddings is None:
+                entry.embeddings = vector[np.newaxis, :]
+            else:
+                entry.embeddings = np.vstack([entry.embeddings, vector])
+            entry.questions.append(question)
+            entry.answers.append(answer)
+            entry.stored_at.append(time.monotonic())
+
+            if len(entry.answers) > self.max_entries:
+                entry.embeddings = entry.embeddings[-self.max_entries :]
+                entry.questions = entry.questions[-self.max_entries :]
+                entry.answers = entry.answers[-self.max_entries :]
+                entry.stored_at = entry.stored_at[-self.max_entries :]
+
+            while len(self._contracts) > self.max_contracts:
+                self._contracts.popitem(last=False)
+
+    def invalidate(self, contract_id: str):
+        """Drops the cached answers of a contract, e.g. after it was filled or validated again."""
+        self._drop(contract_id)
+        if self.tier is not None:
+            self.tier.invalidate(TIER_NAMESPACE, [contract_id], stored=False)
+
+    def _drop(self, contract_id: str):
+        with self._lock:
+            self._sequence += 1
+            self._invalidations[contract_id] = self._sequence
+            self._invalidations.move_to_end(contract_id)
+            while len(self._invalidations) > self.max_invalidations:
+                _, self._forgotten = self._invalidations.popitem(last=False)
+            if self._contracts.pop(contract_id, None) is not None:
+                logger.debug(f"invalidated answer cache for contract_id: {contract_id}")
+
+    def use_tier(self, tier: CacheTier):
+        """
+        Takes invalidations from other instances. Answers are matched by
+        embedding similarity, not by key, so they are not stored in the tier.
+        """
+        self.tier = tier
+        tier.on_invalidate(TIER_NAMESPACE, self._drop)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,186 @@
+"""Data Access Layer utilities for agent documents on the async Firestore client.
+
+Mirrors agent.dal for handlers running on the event loop. Messages are
+still persisted by agent.writer on the sync client.
+"""
+
+import asyncio
+
+from typing import List
+from agent.dal import contruct_message, message_to_dict
+from agent.schemas import Agent
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore import AsyncClient
+from langchain.messages import AnyMessage
+from usage import io_ledger
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def create_agent_document(db: AsyncClient, agent: Agent) -> str:
+    """
+    Creates a new agent document in Firestore.
+
+    Args:
+        agent: The agent to create.
+
+    Returns:
+        The ID of the created agent document.
+    """
+    doc_ref = db.collection("agents").document(str(agent.agent_id))
+
+    # messages are stored in a subcollection
+    agent_dict = agent.model_dump(mode="json")
+    agent_dict.pop("messages", None)
+    await doc_ref.set(agent_dict)
+    io_ledger.record_firestore_writes()
+    return doc_ref.id
+
+
+async def get_agent_document(db: AsyncClient, agent_id: str) -> Agent:
+    """
+    Retrieves an agent document from Firestore. The document and its
+    messages are read concurrently.
+
+    Args:
+        agent_id: The ID of the agent to retrieve.
+
+    Returns:
+        The retrieved agent document.
+
+    Raises:
+        ValueError: If the agent document does not exist.
+    """
+    doc_ref = db.collection("agents").document(agent_id)
+
+    async def read_messages():
+        return [msg async for msg in doc_ref.collection("messages").stream()]
+
+    doc, msg_docs = await asyncio.gather(doc_ref.get(), read_messages())
+    io_ledger.record_firestore_reads("agents", agent_id)
+    io_ledger.record_firestore_reads(f"agents/{agent_id}/messages", count=len(msg_docs))
+    if not doc.exists:  # type: ignore
+        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
+
+    messages: list[AnyMessage] = list(contruct_message(iter(msg_docs)))
+
+    # sort messages by created_at timestamp
+    messages.sort(key=lambda x: x.additional_kwargs["created_at"])  # type: ignore
+
+    # remove ToolMessages and ToolCalls
+    messages = [message for message in messages if message.type != 'tool' or (message.type == 'ai' and len(message.tool_calls) > 0)]
+    agent = Agent(**doc.to_dict())  # type: ignore
+    agent.messages = messages
+    return agent
+
+
+async def get_selected_contract(db: AsyncClient, agent_id: str) -> str:
+    """
+    Reads the selected contract of an agent without loading its messages.
+
+    Raises:
+        ValueError: If the agent document does not exist.
+    """
+    doc = await db.collection("agents").document(agent_id).get(field_paths=["selected_contract"])
+    io_ledger.record_firestore_reads("agents", agent_id)
+    if not doc.exists:  # type: ignore
+        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
+    return doc.get("selected_contract")
+
+
+async def delete_agent_document(db: AsyncClient, agent_id: str) -> None:
+    """Deletes an agent document from Firestore."""
+    await db.collection("agents").document(agent_id).delete()
+    io_ledger.record_firestore_writes()
+
+
+async def get_all_agent_documents(db: AsyncClient, user_id: str) -> list[Agent]:
+    """Retrieves the agent documents of a user from Firestore."""
+    query = db.collection("agents").where("user_id", "==", user_id)
+    agents = [Agent(**doc.to_dict()) async for doc in query.stream()]  # type: ignore
+    io_ledger.record_firestore_reads("agents", count=len(agents))
+    return agents
+
+
+async def add_messages(db: AsyncClient, agent_id: str, messages: list[AnyMessage]):
+    """Updates the messages of an agent document in Firestore."""
+    msg_ref = db.collection("agents").document(agent_id).collection("messages")
+
+    batch = db.batch()
+    for msg in messages:
+        batch.set(msg_ref.document(), message_to_dict(msg))
+
+    await batch.commit()
+    io_ledger.record_firestore_writes(len(messages))
+
+
+async def write_message_batch(db: AsyncClient, items: list[tuple[str, str, dict]]):
+    """
+    Writes serialized messages of one or more agents in a single batch.
+    Setting messages by a fixed document ID makes retrying a batch idempotent.
+
+    Args:
+        items: (agent_id, message document ID, serialized message) tuples, at most 500.
+    """
+    batch = db.batch()
+    for agent_id, doc_id, msg_dict in items:
+        doc_ref = (
+            db.collection("agents")
+            .document(agent_id)
+            .collection("messages")
+            .document(doc_id)
+        )
+        batch.set(doc_ref, msg_dict)
+
+    await batch.commit()
+    io_ledger.record_firestore_writes(len(items))
+
+
+async def update_agent_document(db: AsyncClient, agent_id: str, fields: dict):
+    """
+    Updates fields of an existing agent document in one round trip. update()
+    carries the exists=True precondition, so a missing agent fails the write.
+
+    Raises:
+        ValueError: If the agent document does not exist.
+    """
+    try:
+        await db.collection("agents").document(agent_id).update(fields)
+        io_ledger.record_firestore_writes()
+    except NotFound:
+        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
+
+
+async def add_contracts_to_agent(db: AsyncClient, agent_id: str, contract_id: str):
+    """Updates the selected contract of an agent document in Firestore."""
+    # selecting a single contract ends a cross-contract selection
+    await update_agent_document(
+        db, agent_id, {"selected_contract": contract_id, "selected_contracts": []}
+    )
+
+
+async def set_agent_contracts(db: AsyncClient, agent_id: str, contract_ids: List[str]):
+    """
+    Sets the contracts a cross-contract agent queries. The first one becomes
+    the selected contract.
+    """
+    await update_agent_document(
+        db,
+        agent_id,
+        {"selected_contract": contract_ids[0], "selected_contracts": contract_ids},
+    )
+
+
+async def save_history_summary(db: AsyncClient, agent_id: str, summary: str, summarized_until: float):
+    """Stores the rolling summary of an agent's history and the timestamp of the last folded message."""
+    await db.collection("agents").document(agent_id).set(
+        {"history_summary": summary, "summarized_until": summarized_until}, merge=True
+    )
+    io_ledger.record_firestore_writes()
+
+
+async def rename_agent(db: AsyncClient, agent_id: str, new_name: str):
+    """Renames an agent document in Firestore."""
+    await update_agent_document(db, agent_id, {"name": new_name})
@@ -0,0 +1,287 @@
+"""Contract context resolution and prompt prefix caching for agents.
+
+The contract an agent works on is referenced by ``Agent.selected_contract`` and
+resolved on every call, so the markdown is never copied into the agent's
+message history. The system prompt and the contract text form a stable prompt
+prefix which is registered with a context cache, letting repeated turns on the
+same contract reuse cached input tokens.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from google import genai
+from google.genai import types
+from google.cloud.firestore import Client
+from google.cloud.storage import Bucket
+from langchain.messages import SystemMessage
+from langchain.tools import BaseTool
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai._function_utils import (
+    convert_to_genai_function_declarations,
+)
+
+from agent import prompts as agent_prompts
+from connectors import gcs_connector
+from contracts import dal as contracts_dal
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("AGENT_CONTEXT_CACHE_TTL", 3600))
+
+# stop handing out a cache entry slightly before the model side expires it
+CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS = 60
+
+# a prefix that could not be registered, e.g. below the model's minimum
+# cacheable size, is not tried again for this long
+CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS = float(
+    os.environ.get("AGENT_CONTEXT_CACHE_FAILURE_BACKOFF", 600)
+)
+
+
+def load_contract_text(db: Client, bucket: Bucket, contract_id: str) -> str:
+    """
+    Resolves the markdown of a contract by its ID.
+
+    Args:
+        db: Firestore client.
+        bucket: Storage bucket holding the contract markdown.
+        contract_id: The ID of the contract.
+
+    Returns:
+        The markdown of the contract.
+
+    Raises:
+        ValueError: If the contract does not exist or has no markdown.
+    """
+    contract = contracts_dal.get_contract_unvalidated(db, contract_id)
+    if contract is None:
+        raise ValueError(f"Contract with ID {contract_id} does not exist.")
+
+    if not contract.md_uri:
+        raise ValueError(f"Contract with ID {contract_id} does not have a valid md_uri.")
+
+    return gcs_connector.download_file(bucket, contract.md_uri).decode("utf-8")
+
+
+def build_context_prefix(contract_text: str) -> List[SystemMessage]:
+    """Builds the stable prompt prefix sent ahead of the agent's history."""
+    return [
+        SystemMessage(content=agent_prompts.agent_system_prompt),
+        SystemMessage(
+            content=agent_prompts.contract_context_prompt.format(
+                contract_text=contract_text
+            )
+        ),
+    ]
+
+
+def context_key(model_name: str, contract_text: str, tools: List[BaseTool]) -> str:
+    """Hashes everything that makes up a prompt prefix into a cache key."""
+    digest = hashlib.sha256()
+    for part in (
+        model_name,
+        agent_prompts.agent_system_prompt,
+        contract_text,
+        *sorted(tool.name for tool in tools),
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedContext:
+    name: str
+    expires_at: float
+
+
+class ContextCache(ABC):
+    """
+    Registry of prompt prefixes keyed by their content hash.
+
+    Subclasses implement ``_create`` to register a prefix and return its name.
+    ``model_side`` tells callers whether the name can be handed to the model in
+    place of the inline prefix.
+    """
+
+    model_side = False
+
+    def __init__(
+        self,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        failure_backoff_seconds: float = CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.failure_backoff_seconds = failure_backoff_seconds
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._entries: Dict[str, CachedContext] = {}
+        # key -> time until which registering the prefix is not retried
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(
+        self, model_name: str, contract_text: str, tools: List[BaseTool]
+    ) -> Optional[str]:
+        """
+        Returns the name of the cached prefix, registering it on a miss.
+
+        Returns:
+            The cache name, or None if the prefix could not be cached. A
+            failed registration is not retried for failure_backoff_seconds.
+        """
+        entry = self.get_or_create_entry(model_name, contract_text, tools)
+        return entry.name if entry is not None else None
+
+    def get_or_create_entry(
+        self, model_name: str, contract_text: str, tools: List[BaseTool]
+    ) -> Optional[CachedContext]:
+        """Like get_or_create, with the time the cached prefix stops being handed out."""
+        key = context_key(model_name, contract_text, tools)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self.hits += 1
+                return entry
+            if self._failed.get(key, 0) > now:
+                return None
+            self.misses += 1
+
+        name = self._create(key, model_name, contract_text, tools)
+        if name is None:
+            with self._lock:
+                self.failures += 1
+                self._failed = {k: until for k, until in self._failed.items() if until > now}
+                self._failed[key] = now + self.failure_backoff_seconds
+            return None
+
+        entry = CachedContext(
+            name=name,
+            expires_at=now + self.ttl_seconds - CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS,
+        )
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failed.clear()
+
+    @abstractmethod
+    def _create(
+        self, key: str, model_name: str, contract_text: str, tools: List[BaseTool]
+    ) -> Optional[str]:
+        """Registers the prefix under key, returning its name or None when it could not be cached."""
+
+
+class LocalContextCache(ContextCache):
+    """In-process stand-in for the model-side cache, used for tests and local runs."""
+
+    def _create(
+        self, key: str, model_name: str, contract_text: str, tools: List[BaseTool]
+    ) -> Optional[str]:
+        return f"local/{key}"
+
+
+class VertexContextCache(ContextCache):
+    """Registers prompt prefixes as Gemini cached contents."""
+
+    model_side = True
+
+    def __init__(
+        self,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        failure_backoff_seconds: float = CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS,
+    ):
+        super().__init__(ttl_seconds, failure_backoff_seconds)
+        self._client: Optional[genai.Client] = None
+
+    def _create(
+        self, key: str, model_name: str, contract_text: str, tools: List[BaseTool]
+    ) -> Optional[str]:
+        if self._client is None:
+            self._client = genai.Client()
+
+        # system instruction and tool declarations are not allowed on requests
+        # that use cached content, so they are cached alongside the contract
+        try:
+            cached = self._client.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"agent-context-{key[:16]}",
+                    system_instruction=agent_prompts.agent_system_prompt,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                types.Part(
+                                    text=agent_prompts.contract_context_prompt.format(
+                                        contract_text=contract_text
+                                    )
+                                )
+                            ],
+                        )
+                    ],
+                    tools=[convert_to_genai_function_declarations(tools)],
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as exc:
+            # contracts below the model's minimum cacheable size end up here
+            logger.warning(
+                "context cache registration failed, using inline prefix",
+                exc_info=exc,
+            )
+            return None
+
+        logger.debug(f"registered context cache {cached.name}")
+        return cached.name
+
+
+class CachedContextChatModel(ChatGoogleGenerativeAI):
+    """Chat model that leaves tool declarations to its cached content when set."""
+
+    def bind_tools(self, tools, *args, **kwargs):  # type: ignore[override]
+        if self.cached_content is None:
+            return super().bind_tools(tools, *args, **kwargs)
+        return self.bind()
+
+
+_context_cache: Optional[ContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    """
+    Returns the process wide context cache.
+
+    ``AGENT_CONTEXT_CACHE`` selects the implementation: ``vertex`` (default)
+    registers prefixes with the model, ``local`` keeps them in process.
+    """
+    global _context_cache
+    with _context_cache_lock:
+        if _context_cache is None:
+            if os.environ.get("AGENT_CONTEXT_CACHE", "vertex") == "local":
+                _context_cache = LocalContextCache()
+            else:
+                _context_cache = VertexContextCache()
+        return _context_cache
+
+
+def set_context_cache(cache: ContextCache):
+    """Replaces the process wide context cache, e.g. with a LocalContextCache in tests."""
+    global _context_cache
+    with _context_cache_lock:
+        _context_cache = cache
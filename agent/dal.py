@@ -2,7 +2,9 @@
 
 from typing import Dict, Iterator, List
 from agent.schemas import Agent
+from google.api_core.exceptions import NotFound
 from google.cloud.firestore import Client
+from usage import io_ledger
 from langchain.messages import AnyMessage
 from langchain.messages import (
     SystemMessage,
@@ -53,6 +55,7 @@ def create_agent_document(db: Client, agent: Agent) -> str:
     agent_dict = agent.model_dump(mode="json")
     agent_dict.pop("messages", None)
     doc_ref.set(agent_dict)
+    io_ledger.record_firestore_writes()
     return doc_ref.id
 
 
@@ -71,15 +74,17 @@ def get_agent_document(db: Client, agent_id: str) -> Agent:
     """
     doc_ref = db.collection("agents").document(agent_id)
     doc = doc_ref.get()
+    io_ledger.record_firestore_reads("agents", agent_id)
     if not doc.exists:  # type: ignore
         raise ValueError(f"Agent document with ID {agent_id} does not exist.")
 
     # get all messages
     msg_ref: CollectionReference = doc_ref.collection("messages")
 
-    msg_stream = msg_ref.stream()
+    msg_docs = list(msg_ref.stream())
+    io_ledger.record_firestore_reads(f"agents/{agent_id}/messages", count=len(msg_docs))
 
-    messages: list[AnyMessage] = list(contruct_message(msg_stream))
+    messages: list[AnyMessage] = list(contruct_message(iter(msg_docs)))
     
     # sort messages by created_at timestamp
     messages.sort(key=lambda x: x.additional_kwargs["created_at"])  # type: ignore
@@ -91,19 +96,42 @@ def get_agent_document(db: Client, agent_id: str) -> Agent:
     return agent
 
 
+def get_selected_contract(db: Client, agent_id: str) -> str:
+    """
+    Reads the selected contract of an agent without loading its messages.
+
+    Raises:
+        ValueError: If the agent document does not exist.
+    """
+    doc = db.collection("agents").document(agent_id).get(field_paths=["selected_contract"])
+    io_ledger.record_firestore_reads("agents", agent_id)
+    if not doc.exists:  # type: ignore
+        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
+    return doc.get("selected_contract")
+
+
 def delete_agent_document(db: Client, agent_id: str) -> None:
     """Deletes an agent document from Firestore."""
     doc_ref = db.collection("agents").document(agent_id)
     doc_ref.delete()
+    io_ledger.record_firestore_writes()
 
 
 def get_all_agent_documents(db: Client, user_id: str) -> list[Agent]:
     """Retrieves all agent documents from Firestore."""
-    docs = db.collection("agents").stream()
+    docs = list(db.collection("agents").stream())
+    io_ledger.record_firestore_reads("agents", count=len(docs))
     docs = [doc for doc in docs if doc.to_dict()["user_id"] == user_id]
     return [Agent(**doc.to_dict()) for doc in docs]
 
 
+def message_to_dict(msg: AnyMessage) -> dict:
+    """Serializes a message for the messages subcollection."""
+    msg_dict = msg.model_dump(mode="json")
+    msg_dict['additional_kwargs'].pop("__gemini_function_call_thought_signatures__", None)
+    return msg_dict
+
+
 def add_messages(db: Client, agent_id: str, messages: list[AnyMessage]):
     """Updates the messages of an agent document in Firestore."""
     doc_ref = db.collection("agents").document(agent_id)
@@ -112,28 +140,77 @@ def add_messages(db: Client, agent_id: str, messages: list[AnyMessage]):
     batch = db.batch()
     for msg in messages:
         doc_ref = msg_ref.document()
-        msg_dict = msg.model_dump(mode="json")
-        msg_dict['additional_kwargs'].pop("__gemini_function_call_thought_signatures__", None)        
+        batch.set(doc_ref, message_to_dict(msg))
+
+    batch.commit()
+    io_ledger.record_firestore_writes(len(messages))
+
+
+def write_message_batch(db: Client, items: list[tuple[str, str, dict]]):
+    """
+    Writes serialized messages of one or more agents in a single batch.
+    Setting messages by a fixed document ID makes retrying a batch idempotent.
+
+    Args:
+        items: (agent_id, message document ID, serialized message) tuples, at most 500.
+    """
+    batch = db.batch()
+    for agent_id, doc_id, msg_dict in items:
+        doc_ref = (
+            db.collection("agents")
+            .document(agent_id)
+            .collection("messages")
+            .document(doc_id)
+        )
         batch.set(doc_ref, msg_dict)
 
     batch.commit()
+    io_ledger.record_firestore_writes(len(items))
+
+def update_agent_document(db: Client, agent_id: str, fields: dict):
+    """
+    Updates fields of an existing agent document in one round trip. update()
+    carries the exists=True precondition, so a missing agent fails the write.
+
+    Raises:
+        ValueError: If the agent document does not exist.
+    """
+    try:
+        db.collection("agents").document(agent_id).update(fields)
+        io_ledger.record_firestore_writes()
+    except NotFound:
+        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
+
 
 def add_contracts_to_agent(db: Client, agent_id: str, contract_id: str):
     """Updates the selected contract of an agent document in Firestore."""
+    # selecting a single contract ends a cross-contract selection
+    update_agent_document(
+        db, agent_id, {"selected_contract": contract_id, "selected_contracts": []}
+    )
+
+
+def set_agent_contracts(db: Client, agent_id: str, contract_ids: List[str]):
+    """
+    Sets the contracts a cross-contract agent queries. The first one becomes
+    the selected contract.
+    """
+    update_agent_document(
+        db,
+        agent_id,
+        {"selected_contract": contract_ids[0], "selected_contracts": contract_ids},
+    )
+
+def save_history_summary(db: Client, agent_id: str, summary: str, summarized_until: float):
+    """Stores the rolling summary of an agent's history and the timestamp of the last folded message."""
     doc_ref = db.collection("agents").document(agent_id)
-    doc = doc_ref.get()
-    if not doc.exists:  # type: ignore
-        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
-    
-    doc_ref.set({"selected_contract": contract_id}, merge=True)
+    doc_ref.set(
+        {"history_summary": summary, "summarized_until": summarized_until}, merge=True
+    )
+    io_ledger.record_firestore_writes()
 
 def rename_agent(db: Client, agent_id: str, new_name: str):
     """Renames an agent document in Firestore."""
-    doc_ref = db.collection("agents").document(agent_id)
-    doc = doc_ref.get()
-    if not doc.exists:  # type: ignore
-        raise ValueError(f"Agent document with ID {agent_id} does not exist.")
-    
-    doc_ref.set({"name": new_name}, merge=True)
+    update_agent_document(db, agent_id, {"name": new_name})
     
     
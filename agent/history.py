@@ -0,0 +1,242 @@
+"""Token-budgeted agent history.
+
+On the hot path the history is fitted into ``HISTORY_TOKEN_BUDGET`` using
+only local work: messages already folded into the rolling summary are swapped
+for the summary, old tool results are trimmed, and as a last resort the oldest
+turns are dropped. Folding older turns into the persisted summary is an LLM
+call, so it is scheduled in the background after a turn completes.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+from typing import List, Optional, Set
+from google import genai
+from google.cloud.firestore import Client
+from langchain.messages import AnyMessage, HumanMessage, ToolMessage
+
+from agent import dal as agent_dal
+from agent import prompts as agent_prompts
+from agent.schemas import Agent
+from usage import utils as usage_utils
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("AGENT_HISTORY_TOKEN_BUDGET", 32000))
+
+# share of the budget above which a background compaction is started, so the
+# hot path rarely has to drop turns to stay under the budget
+HISTORY_COMPACT_RATIO = float(os.environ.get("AGENT_HISTORY_COMPACT_RATIO", 0.8))
+
+# share of the budget kept verbatim after compaction, the rest is summarized
+HISTORY_KEEP_RATIO = float(os.environ.get("AGENT_HISTORY_KEEP_RATIO", 0.5))
+
+# tool results of the most recent turns are kept intact
+TOOL_RESULT_KEEP_TURNS = 2
+
+SUMMARY_MODEL = "gemini-2.5-flash"
+
+# rough chars per token for Gemini models, good enough for budgeting
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRIMMED_TOOL_RESULT = "[tool result trimmed]"
+
+_compacting: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def message_text(message: AnyMessage) -> str:
+    """Flattens the content of a message to text."""
+    if isinstance(message.content, str):
+        return message.content
+
+    parts = []
+    for part in message.content:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and "text" in part:
+            parts.append(part["text"])
+    return "".join(parts)
+
+
+def count_tokens(message: AnyMessage) -> int:
+    """Estimates the number of tokens a message takes in the prompt."""
+    chars = len(message_text(message))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        chars += len(tool_call["name"]) + len(json.dumps(tool_call["args"]))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_history_tokens(messages: List[AnyMessage]) -> int:
+    """Estimates the tokens of the conversation, excluding the system prefix."""
+    return sum(count_tokens(msg) for msg in messages if msg.type != "system")
+
+
+def is_summary(message: AnyMessage) -> bool:
+    return bool(message.additional_kwargs.get("history_summary"))
+
+
+def summary_message(summary: str) -> HumanMessage:
+    return HumanMessage(
+        content=agent_prompts.history_summary_prompt.format(summary=summary),
+        additional_kwargs={"history_summary": True},
+    )
+
+
+def turn_starts(messages: List[AnyMessage]) -> List[int]:
+    """Indexes of the human messages that open each turn."""
+    return [
+        i
+        for i, msg in enumerate(messages)
+        if msg.type == "human" and not is_summary(msg)
+    ]
+
+
+def trim_tool_results(messages: List[AnyMessage], keep_turns: int = TOOL_RESULT_KEEP_TURNS) -> List[AnyMessage]:
+    """Replaces the content of tool results older than the last keep_turns turns."""
+    starts = turn_starts(messages)
+    if len(starts) <= keep_turns:
+        return messages
+
+    boundary = starts[-keep_turns] if keep_turns > 0 else len(messages)
+    trimmed: List[AnyMessage] = []
+    for i, msg in enumerate(messages):
+        if i < boundary and isinstance(msg, ToolMessage) and msg.content != TRIMMED_TOOL_RESULT:
+            msg = msg.model_copy(update={"content": TRIMMED_TOOL_RESULT})
+        trimmed.append(msg)
+    return trimmed
+
+
+def fit_history(agent_doc: Agent, messages: List[AnyMessage], budget: int = HISTORY_TOKEN_BUDGET) -> List[AnyMessage]:
+    """
+    Fits the conversation of an agent into the token budget without calling the model.
+
+    Args:
+        agent_doc: The agent, carrying the rolling summary.
+        messages: The conversation, oldest first, without the system prefix.
+        budget: The token budget of the conversation.
+
+    Returns:
+        The messages to send to the model.
+    """
+    if agent_doc.history_summary and agent_doc.summarized_until is not None:
+        messages = [
+            msg
+            for msg in messages
+            if msg.additional_kwargs.get("created_at", 0) > agent_doc.summarized_until
+        ]
+        messages = [summary_message(agent_doc.history_summary)] + messages
+
+    if count_history_tokens(messages) <= budget:
+        return messages
+
+    messages = trim_tool_results(messages)
+
+    # the background compaction has not caught up, drop whole turns oldest first
+    while count_history_tokens(messages) > budget:
+        starts = turn_starts(messages)
+        if len(starts) < 2:
+            break
+        head = [msg for msg in messages[: starts[0]] if is_summary(msg)]
+        messages = head + messages[starts[1] :]
+
+    return messages
+
+
+async def summarize(summary: Optional[str], messages: List[AnyMessage]) -> str:
+    """Folds the given messages into the existing summary."""
+    transcript = "\n".join(
+        f"{msg.type}: {message_text(msg)}"
+        for msg in messages
+        if msg.type in ("human", "ai") and message_text(msg)
+    )
+    prompt = agent_prompts.summarize_history_prompt.format(
+        summary=summary or "(none)", messages=transcript
+    )
+
+    client = genai.Client()
+    started = time.perf_counter()
+    response = await client.aio.models.generate_content(
+        model=SUMMARY_MODEL, contents=prompt
+    )
+    usage_utils.record_genai_response("agent.summarize", SUMMARY_MODEL, response, started)
+    if not response.text:
+        raise RuntimeError("No response received from the API")
+    return response.text.strip()
+
+
+async def compact_history(db_client: Client, agent_id: str, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Folds the oldest turns of an agent's history into its rolling summary
+    until the verbatim part fits HISTORY_KEEP_RATIO of the budget.
+    """
+    agent_doc = await asyncio.to_thread(agent_dal.get_agent_document, db_client, agent_id)
+
+    messages = [msg for msg in agent_doc.messages if msg.type != "system"]
+    if agent_doc.summarized_until is not None:
+        messages = [
+            msg
+            for msg in messages
+            if msg.additional_kwargs.get("created_at", 0) > agent_doc.summarized_until
+        ]
+
+    if count_history_tokens(messages) <= budget * HISTORY_COMPACT_RATIO:
+        return
+
+    # keep the most recent turns verbatim, cut at a turn boundary
+    keep_budget = int(budget * HISTORY_KEEP_RATIO)
+    split = len(messages)
+    for start in reversed(turn_starts(messages)):
+        kept = count_history_tokens(messages[start:])
+        if kept > keep_budget:
+            break
+        split = start
+
+    if split == 0:
+        return
+    if split == len(messages):
+        # even the last turn exceeds the keep budget, fold all but that turn
+        starts = turn_starts(messages)
+        split = starts[-1] if starts else len(messages)
+
+    folded = messages[:split]
+    if not folded:
+        return
+
+    summary = await summarize(agent_doc.history_summary, folded)
+    summarized_until = folded[-1].additional_kwargs["created_at"]
+
+    await asyncio.to_thread(
+        agent_dal.save_history_summary, db_client, agent_id, summary, summarized_until
+    )
+    logger.debug(f"folded {len(folded)} messages into the summary of agent_id: {agent_id}")
+
+
+async def _run_compaction(db_client: Client, agent_id: str):
+    try:
+        await compact_history(db_client, agent_id)
+    except Exception as exc:
+        logger.error("History compaction failed for agent_id=%s", agent_id, exc_info=exc)
+    finally:
+        _compacting.discard(agent_id)
+
+
+def schedule_compaction(db_client: Client, agent_id: str, messages: List[AnyMessage], budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Starts a background compaction of the agent's history if the given
+    conversation exceeds HISTORY_COMPACT_RATIO of the budget and none is
+    running for the agent.
+    """
+    if agent_id in _compacting:
+        return
+    if count_history_tokens(messages) <= budget * HISTORY_COMPACT_RATIO:
+        return
+
+    _compacting.add(agent_id)
+    task = asyncio.create_task(_run_compaction(db_client, agent_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
@@ -0,0 +1,183 @@
+"""Cross-contract agent queries.
+
+An agent with several selected contracts answers a question by asking a
+sub-agent bound to each contract. The sub-queries run concurrently, at most
+``PORTFOLIO_CONCURRENCY`` at a time, and every answer is streamed as soon as
+it is ready, so the total latency is close to the slowest contract instead of
+the sum. The merged answer is persisted as one message, in contract order.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+from google.cloud.firestore import AsyncClient, Client
+from google.cloud.storage import Bucket
+from langchain.messages import AIMessage, AnyMessage, HumanMessage
+
+from agent import utils as agent_utils
+from agent.schemas import Agent
+from agent.writer import message_writer
+from contracts import async_dal as contracts_dal
+from usage import utils as usage_utils
+
+import chromadb
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_CONCURRENCY = int(os.environ.get("AGENT_PORTFOLIO_CONCURRENCY", 4))
+
+
+def contract_heading(contract_id: str, contract_name: Optional[str]) -> str:
+    return f"### {contract_name or contract_id}\n\n"
+
+
+async def ask_contract(
+    db_client: Client,
+    async_db_client: AsyncClient,
+    bucket: Bucket,
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    agent_doc: Agent,
+    agent_id: str,
+    contract_id: str,
+    message: str,
+    semaphore: asyncio.Semaphore,
+) -> str:
+    """
+    Answers the question for one contract with a sub-agent bound to it.
+
+    Returns:
+        The answer, headed by the name of the contract.
+    """
+    async with semaphore:
+        usage_utils.bind_usage_context(contract_id=contract_id)
+        heading = contract_heading(contract_id, None)
+
+        try:
+            contract = await contracts_dal.get_contract_unvalidated(async_db_client, contract_id)
+            heading = contract_heading(contract_id, contract.contract_name if contract else None)
+
+            warm_agent = await asyncio.to_thread(
+                agent_utils.WarmAgent,
+                db_client,
+                async_db_client,
+                bucket,
+                chroma_client,
+                agent_doc,
+                agent_id,
+                contract_id,
+            )
+            history, messages = await asyncio.to_thread(warm_agent.prepare, message)
+
+            started = time.perf_counter()
+            response = await warm_agent.agent.ainvoke(input={"messages": history + messages})
+            response_msgs = response["messages"][len(history) :]
+            usage_utils.record_agent_messages(
+                "agent.portfolio", response_msgs, started, agent_id=agent_id
+            )
+        except Exception as exc:
+            logger.error(
+                "Cross-contract query failed for agent_id=%s, contract_id=%s",
+                agent_id,
+                contract_id,
+                exc_info=exc,
+            )
+            return f"{heading}This contract could not be queried. Please try again.\n\n"
+
+        answer = ""
+        if response_msgs and isinstance(response_msgs[-1], AIMessage):
+            answer = agent_utils.message_content(response_msgs[-1])
+        return f"{heading}{answer or 'No answer was generated for this contract.'}\n\n"
+
+
+async def portfolio_events(
+    db_client: Client,
+    async_db_client: AsyncClient,
+    bucket: Bucket,
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    request: agent_utils.Disconnectable,
+    agent_doc: Agent,
+    agent_id: str,
+    message: str,
+    transcript: Optional[List[AnyMessage]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Answers the question for every selected contract of the agent and yields
+    the answers in the events of agent_utils.agent_events, in completion order.
+    """
+    contract_ids = agent_doc.selected_contracts
+    logger.debug(f"querying {len(contract_ids)} contracts for agent_id: {agent_id}")
+
+    question = HumanMessage(
+        content=message,
+        additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
+    )
+    message_writer.enqueue(agent_id, [question])
+    if transcript is not None:
+        transcript.append(question)
+
+    semaphore = asyncio.Semaphore(PORTFOLIO_CONCURRENCY)
+
+    async def answer_for(contract_id: str) -> Tuple[str, str]:
+        answer = await ask_contract(
+            db_client,
+            async_db_client,
+            bucket,
+            chroma_client,
+            agent_doc,
+            agent_id,
+            contract_id,
+            message,
+            semaphore,
+        )
+        return contract_id, answer
+
+    tasks = [asyncio.create_task(answer_for(contract_id)) for contract_id in contract_ids]
+
+    async def completed() -> AsyncIterator[Tuple[str, str]]:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+
+    answers = {}
+    try:
+        async for contract_id, answer in agent_utils.until_disconnected(request, completed()):
+            answers[contract_id] = answer
+            yield {"type": "ai_response", "content": answer}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if len(answers) < len(contract_ids):
+        return
+
+    reply = AIMessage(
+        content="".join(answers[contract_id] for contract_id in contract_ids),
+        additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
+    )
+    message_writer.enqueue(agent_id, [reply])
+    if transcript is not None:
+        transcript.append(reply)
+
+    yield {"type": "done", "content": ""}
+
+
+async def stream_portfolio(
+    db_client: Client,
+    async_db_client: AsyncClient,
+    bucket: Bucket,
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    request: agent_utils.Disconnectable,
+    agent_doc: Agent,
+    agent_id: str,
+    message: str,
+):
+    """Streams a cross-contract answer in the SSE frames of agent_utils.stream_agent."""
+    async for event in portfolio_events(
+        db_client, async_db_client, bucket, chroma_client, request, agent_doc, agent_id, message
+    ):
+        yield agent_utils.sse_frame(event)
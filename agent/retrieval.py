@@ -0,0 +1,74 @@
+"""Retrieval mode for agents: only the contract chunks relevant to a question
+are loaded into the context, so the prompt size does not grow with the contract."""
+
+import logging
+import os
+
+from typing import List
+from google.cloud.firestore import Client
+from google.cloud.storage import Bucket
+from langchain.messages import SystemMessage
+
+from agent import context
+from agent import prompts as agent_prompts
+from connectors import chromadb_connector
+
+import chromadb
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_TOP_K = int(os.environ.get("AGENT_RETRIEVAL_TOP_K", 4))
+
+
+def index_contract_text(chroma_client: chromadb.ClientAPI, contract_id: str, contract_text: str): # type: ignore
+    """Chunks the contract markdown and writes it to the contract's collection."""
+    chunks = chromadb_connector.chunk_text(contract_text)
+    chromadb_connector.write_to_chroma(
+        chroma_client, chunks, chromadb_connector.contract_collection_name(contract_id)
+    )
+
+
+def ensure_contract_index(
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    db: Client,
+    bucket: Bucket,
+    contract_id: str,
+):
+    """
+    Indexes the contract if its collection is missing, e.g. for contracts
+    uploaded before retrieval mode existed or after the local index was lost.
+    """
+    collection_name = chromadb_connector.contract_collection_name(contract_id)
+    if chromadb_connector.has_documents(chroma_client, collection_name):
+        return
+
+    logger.debug(f"indexing contract {contract_id} for retrieval")
+    contract_text = context.load_contract_text(db, bucket, contract_id)
+    index_contract_text(chroma_client, contract_id, contract_text)
+
+
+def retrieve_chunks(
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    contract_id: str,
+    query: str,
+    n_results: int = RETRIEVAL_TOP_K,
+) -> List[str]:
+    """Returns the chunks of the contract most relevant to the query."""
+    return chromadb_connector.query_chunks(
+        chroma_client,
+        chromadb_connector.contract_collection_name(contract_id),
+        query,
+        n_results=n_results,
+    )
+
+
+def build_retrieval_prefix(chunks: List[str]) -> List[SystemMessage]:
+    """Builds the prompt prefix for retrieval mode from the retrieved chunks."""
+    return [
+        SystemMessage(content=agent_prompts.agent_system_prompt),
+        SystemMessage(
+            content=agent_prompts.retrieved_context_prompt.format(
+                contract_excerpts="\n\n---\n\n".join(chunks)
+            )
+        ),
+    ]
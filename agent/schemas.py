@@ -1,9 +1,16 @@
 from typing import Optional, List, Dict
 from pydantic import BaseModel, Field, ConfigDict
 from langchain.messages import AnyMessage
+from enum import Enum
 import uuid
 
 
+class ContextMode(str, Enum):
+    """How the selected contract is loaded into the agent's context."""
+    FULL = "FULL" # entire contract markdown in the prompt prefix
+    RETRIEVAL = "RETRIEVAL" # only the chunks relevant to the question
+
+
 class Agent(BaseModel):
     model_config = ConfigDict(extra='forbid')
     agent_id: uuid.UUID = Field(default_factory=uuid.uuid4, description="Unique identifier for the agent.")
@@ -16,4 +23,9 @@ class Agent(BaseModel):
     messages: List[AnyMessage] = Field(default=[],description="List of messages exchanged with the agent.")
     state: Dict = Field(default={} ,description="The current state of the agent.")
     
-    selected_contract: str = Field(..., description="selected contract ID for the agent's context.")
\ No newline at end of file
+    selected_contract: str = Field(..., description="selected contract ID for the agent's context.")
+    selected_contracts: List[str] = Field(default=[], description="Contract IDs a cross-contract agent answers every question for. Empty for single contract agents.")
+    history_summary: Optional[str] = Field(default=None, description="Rolling summary of the messages folded out of the agent's history.")
+    summarized_until: Optional[float] = Field(default=None, description="created_at timestamp of the last message folded into history_summary.")
+
+    context_mode: ContextMode = Field(default=ContextMode.FULL, description="How the selected contract is loaded into the agent's context. Allowed values are 'FULL', 'RETRIEVAL'.")
\ No newline at end of file
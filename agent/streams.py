@@ -0,0 +1,181 @@
+"""Resumable agent streams.
+
+An agent run is decoupled from the HTTP connection that started it. The run
+publishes its SSE frames into a bounded ring buffer, and every frame carries
+a monotonic event ID of the form ``<stream_id>:<seq>``. A client that
+reconnects with ``Last-Event-ID`` gets the frames it missed replayed and is
+re-attached to the still running generation, instead of paying for a new run.
+
+A run keeps going while no client is attached for up to
+``STREAM_DETACHED_GRACE_SECONDS``, after which it is cancelled. Finished runs
+stay replayable for ``STREAM_RETENTION_SECONDS``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+STREAM_BUFFER_SIZE = int(os.environ.get("AGENT_STREAM_BUFFER_SIZE", 1024))
+STREAM_RETENTION_SECONDS = float(os.environ.get("AGENT_STREAM_RETENTION", 300))
+STREAM_DETACHED_GRACE_SECONDS = float(os.environ.get("AGENT_STREAM_DETACHED_GRACE", 30))
+STREAM_KEEPALIVE_SECONDS = 15
+
+KEEPALIVE_FRAME = ": keepalive\n\n"
+
+
+class StreamRun:
+    """Frames of one agent run, kept in a bounded ring buffer."""
+
+    def __init__(self, user_id: str, agent_id: str):
+        self.stream_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.agent_id = agent_id
+        self.frames: Deque[Tuple[int, str]] = deque(maxlen=STREAM_BUFFER_SIZE)
+        self.next_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.detached_since: Optional[float] = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.stream_id}:{seq}"
+
+    def publish(self, frame: str):
+        """Buffers an SSE frame under the next event ID and wakes up subscribers."""
+        seq = self.next_seq
+        self.next_seq += 1
+        self.frames.append((seq, f"id: {self.event_id(seq)}\n{frame}"))
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def is_disconnected(self) -> bool:
+        """True once no client has been attached for the grace period, which stops the run."""
+        if self.subscribers > 0 or self.detached_since is None:
+            return False
+        return time.monotonic() - self.detached_since > STREAM_DETACHED_GRACE_SECONDS
+
+    async def subscribe(self, request: Request, after_seq: int = -1) -> AsyncIterator[str]:
+        """
+        Yields the buffered frames after after_seq, then the live frames until
+        the run finishes or the client disconnects.
+        """
+        self.subscribers += 1
+        self.detached_since = None
+        seq = after_seq
+        try:
+            while True:
+                changed = self._changed
+                frames = [(s, frame) for s, frame in self.frames if s > seq]
+                for s, frame in frames:
+                    yield frame
+                    seq = s
+
+                if self.done and seq >= self.next_seq - 1:
+                    return
+
+                if frames:
+                    continue
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE_FRAME
+
+                if await request.is_disconnected():
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self.detached_since = time.monotonic()
+
+
+class StreamRegistry:
+    """In-memory registry of the agent runs of this instance."""
+
+    def __init__(self):
+        self._runs: Dict[str, StreamRun] = {}
+
+    def start(self, user_id: str, agent_id: str, source: Callable[[StreamRun], AsyncIterator[str]]) -> StreamRun:
+        """
+        Starts a run that publishes the frames of the source in the background.
+
+        Args:
+            source: Called with the run, returns the SSE frames of the generation.
+                The run can stand in for the request to detect that every client left.
+        """
+        self._evict()
+        run = StreamRun(user_id, agent_id)
+        self._runs[run.stream_id] = run
+        run.task = asyncio.create_task(self._produce(run, source(run)))
+        return run
+
+    def resume(self, last_event_id: str, user_id: str) -> Tuple[Optional[StreamRun], int]:
+        """
+        Looks up the run of a Last-Event-ID.
+
+        Returns:
+            The run, or None if it is unknown or expired, and the last seq the client received.
+
+        Raises:
+            ValueError: If the Last-Event-ID is malformed or the run belongs to another user.
+        """
+        self._evict()
+        stream_id, _, seq = last_event_id.rpartition(":")
+        if not stream_id or not seq.isdigit():
+            raise ValueError("Invalid Last-Event-ID")
+
+        run = self._runs.get(stream_id)
+        if run is None:
+            return None, int(seq)
+        if run.user_id != user_id:
+            raise ValueError("User not authorized to resume this stream")
+        return run, int(seq)
+
+    async def close(self):
+        """Cancels the runs still generating, e.g. on shutdown."""
+        tasks = [run.task for run in self._runs.values() if run.task and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _produce(self, run: StreamRun, frames: AsyncIterator[str]):
+        try:
+            async for frame in frames:
+                run.publish(frame)
+        except Exception as exc:
+            logger.error("Agent stream %s failed", run.stream_id, exc_info=exc)
+        finally:
+            run.finish()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [
+            stream_id
+            for stream_id, run in self._runs.items()
+            if run.finished_at is not None
+            and now - run.finished_at > STREAM_RETENTION_SECONDS
+        ]
+        for stream_id in expired:
+            del self._runs[stream_id]
+
+
+stream_registry = StreamRegistry()
@@ -1,65 +1,178 @@
 import logging
-import aiofiles
 import asyncio
-import tempfile
-import os
-import json
+import functools
+
+from typing import Any, Optional
+from datetime import date, datetime, timezone
 
 from langchain.tools import tool
-from google.cloud.firestore_v1.client import Client
+from google.cloud.firestore import AsyncClient
 from google.cloud.storage import Bucket
 from connectors import gcs_connector
 from model import validate
-from contracts import dal as contracts_dal
-from agent import dal as agent_dal
+from contracts import async_dal as contracts_dal
+from contracts import schemas as contracts_schemas
+from contracts import dates as contracts_dates
+from agent import async_dal as agent_dal
+from agent import retrieval
+from agent.answer_cache import answer_cache
+
+import chromadb
 
 logger = logging.getLogger(__name__)
 
-def make_get_contract_schema_tool(db_client: Client, agent_id: str):
-    """Creates tools for interacting with contracts."""
+async def resolve_contract(db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None) -> str:
+    """
+    The contract a tool works on: the bound contract of a cross-contract
+    sub-query, otherwise the agent's selected contract, resolved on every call.
+    """
+    if bound_contract is not None:
+        return bound_contract
+    return await agent_dal.get_selected_contract(db_client, agent_id)
+
+
+# bookkeeping fields of a contract that are never returned to the model
+HIDDEN_CONTRACT_FIELDS = ("user_id", "contract_id", "md_uri", "pdf_uri")
+
+UNKNOWN_FIELD = "<unknown field>"
+
+
+@functools.lru_cache(maxsize=None)
+def contract_outline(contract_type: contracts_schemas.ContractType) -> str:
+    """Field outline of a contract type, generated once per type."""
+    contract_cls = contracts_schemas.CONTRACT_CLASSES[contract_type]
+    return "\n".join(
+        line
+        for line in contracts_schemas.generate_field_outline(contract_cls)
+        if line.split(":", 1)[0].split(".", 1)[0] not in HIDDEN_CONTRACT_FIELDS
+    )
+
+
+def project_field(data: Any, path: str) -> Any:
+    """
+    Resolves a dotted field path against dumped contract data.
+    Numeric segments index into lists, other segments are applied to every item of a list.
+    """
+    value = data
+    for segment in path.split("."):
+        if isinstance(value, list):
+            if segment.isdigit():
+                index = int(segment)
+                if index >= len(value):
+                    return UNKNOWN_FIELD
+                value = value[index]
+                continue
+            value = [project_field(item, segment) for item in value]
+        elif isinstance(value, dict):
+            if segment not in value or segment in HIDDEN_CONTRACT_FIELDS:
+                return UNKNOWN_FIELD
+            value = value[segment]
+        else:
+            return UNKNOWN_FIELD
+    return value
+
+
+def make_get_contract_outline_tool(db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None):
+    """Creates a tool for discovering the fields of the selected contract."""
+
+    @tool
+    async def get_contract_outline() -> str:
+        """Get the outline of the fields available for the contract.
+        Each line holds a dotted field path and its type. Use the paths with get_contract_fields.
+
+        Returns:
+            The field outline of the contract.
+        """
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
+        contract = await contracts_dal.get_contract_unvalidated(db_client, contract_id)
+
+        if contract is None:
+            raise ValueError(f"Contract with ID {contract_id} not found.")
+
+        if contract.contract_type is None:
+            raise ValueError(f"Contract with ID {contract_id} has no contract type.")
+
+        return contract_outline(contract.contract_type)
+
+    return get_contract_outline
+
+
+def make_get_contract_fields_tool(db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None):
+    """Creates a tool for fetching selected fields of the contract."""
 
     @tool
-    def get_contract_data() -> dict:
-        """Get contract data from the database.
-        This tool is used to fetch contract data from the database.
-        
+    async def get_contract_fields(field_paths: list[str]) -> dict:
+        """Get the values of selected fields of the contract from the database.
+        Prefer this tool over fetching the whole contract when only a few fields are needed.
+
+        Args:
+            field_paths: Dotted field paths from get_contract_outline, e.g. ["ctc.total_ctc", "payment_term.due_period"].
+                A numeric segment selects a list item, e.g. "parties.0.legal_name".
+
         Returns:
-            A dictionary containing the contract data.
+            A dictionary mapping each field path to its value, or to "<unknown field>" if the path does not exist.
         """
-        logger.debug(f"fetching contract data")
-        
-        agent_doc = agent_dal.get_agent_document(db_client, agent_id)
-        contract_id = agent_doc.selected_contract
-        contract_doc = contracts_dal.get_contract(db_client, contract_id)
+        logger.debug(f"fetching contract fields: {field_paths}")
+
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
+        contract_doc = await contracts_dal.get_contract(db_client, contract_id)
 
         if contract_doc is None:
             raise ValueError(f"Contract with ID {contract_id} not found.")
 
-        contract_doc = contract_doc.model_dump()
-        contract_doc.pop("user_id", None)
-        contract_doc.pop("contract_id", None)
-        contract_doc.pop("md_uri", None)
-        contract_doc.pop("pdf_uri", None)
-        
-        return contract_doc
-    
-    return get_contract_data
+        data = contract_doc.model_dump(mode="json")
+        return {path: project_field(data, path) for path in field_paths}
+
+    return get_contract_fields
 
-def make_fetch_validation_report_tool(db_client: Client, agent_id: str):
+
+def make_get_contract_dates_tool(db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None):
+    """Creates a tool for computing the date facts of the contract."""
+
+    @tool
+    async def get_contract_dates(as_of: Optional[str] = None, invoice_date: Optional[str] = None) -> dict:
+        """Compute exact date facts of the contract: term end, status, days until the end,
+        next renewal or renewal decision date, next billing and payment due dates.
+        Use this tool instead of calculating dates yourself.
+
+        Args:
+            as_of: ISO date (YYYY-MM-DD) to compute the facts for. Defaults to today.
+            invoice_date: ISO date of an invoice, to get the date its payment is due.
+
+        Returns:
+            A dictionary of the date facts. Day counts are negative for dates in the past.
+        """
+        try:
+            as_of_date = date.fromisoformat(as_of) if as_of else datetime.now(timezone.utc).date()
+            invoice = date.fromisoformat(invoice_date) if invoice_date else None
+        except ValueError:
+            raise ValueError("Dates must be in the ISO format YYYY-MM-DD.")
+
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
+        contract = await contracts_dal.get_contract(db_client, contract_id)
+
+        if contract is None:
+            raise ValueError(f"Contract with ID {contract_id} not found.")
+
+        return contracts_dates.contract_date_facts(contract, as_of_date, invoice)
+
+    return get_contract_dates
+
+
+def make_fetch_validation_report_tool(db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None):
     """Creates tools for interacting with contracts."""
 
     @tool
-    def fetch_validation_report() -> dict:
+    async def fetch_validation_report() -> dict:
         """Fetch validation report from the database.
 
         Returns:
             A dictionary containing the validation report.
         """
 
-        agent_doc = agent_dal.get_agent_document(db_client, agent_id)
-        contract_id = agent_doc.selected_contract
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
         logger.debug(f"fetching validation report for contract_id: {contract_id}")
-        validation_report = contracts_dal.get_validation_report(db_client, contract_id)
+        validation_report = await contracts_dal.get_validation_report(db_client, contract_id)
 
         if validation_report is None:
             raise ValueError(f"Validation report for contract with ID {contract_id} not found.")
@@ -70,7 +183,7 @@ def make_fetch_validation_report_tool(db_client: Client, agent_id: str):
 
 
 
-def make_validate_contract_tool(db_client: Client, bucket: Bucket, agent_id: str):
+def make_validate_contract_tool(db_client: AsyncClient, bucket: Bucket, agent_id: str, bound_contract: Optional[str] = None):
     """Creates tools for interacting with contracts."""
     @tool
     async def validate_contract():
@@ -80,38 +193,52 @@ def make_validate_contract_tool(db_client: Client, bucket: Bucket, agent_id: str
             A dictionary containing the validation report.
         """
 
-        agent = agent_dal.get_agent_document(db_client, agent_id)
-        contract_id = agent.selected_contract
-        logger.debug(f"user session validated for validating contract_id: {contract_id}")
-        contract = await asyncio.to_thread(
-            contracts_dal.get_contract, db_client, contract_id
-        )
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
+        logger.debug(f"validating contract_id: {contract_id}")
+        contract = await contracts_dal.get_contract(db_client, contract_id)
 
         if contract is None:
             raise ValueError("Contract not found")
 
         logger.log(logging.DEBUG, "contract fetched from database")
 
-        md_uri = contract.md_uri
-
-        temp_dir = tempfile.gettempdir()
-        temp_md_path = os.path.join(temp_dir, f"{contract_id}.md")
-        if md_uri is not None:
-            md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, md_uri)
+        if contract.md_uri is None:
+            raise ValueError("Contract has no markdown")
 
+        md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, contract.md_uri)
         logger.log(logging.DEBUG, "markdown of the contract downloaded from storage")
-        async with aiofiles.open(temp_md_path, "wb") as f:
-            await f.write(md_file)
 
-        validation_report = await asyncio.to_thread(
-            validate.validate, contract_path=temp_md_path, contract=contract
-        )
+        # the markdown is validated in memory, no temp file shared between requests
+        validation_report = await validate.avalidate(md_file.decode("utf-8"), contract)
         logger.debug("Validated the contract")
 
-        await asyncio.to_thread(contracts_dal.save_validation_report, db_client, validation_report)
+        await contracts_dal.save_validation_report(db_client, validation_report)
+        await asyncio.to_thread(answer_cache.invalidate, contract_id)
 
         logger.log(logging.DEBUG, "validation report is saved to database")
         return validation_report.model_dump()
     
 
-    return validate_contract
\ No newline at end of file
+    return validate_contract
+
+
+def make_search_contract_tool(chroma_client: chromadb.ClientAPI, db_client: AsyncClient, agent_id: str, bound_contract: Optional[str] = None): # type: ignore
+    """Creates a tool for searching the selected contract's text."""
+
+    @tool
+    async def search_contract(query: str) -> list[str]:
+        """Search the text of the contract for passages relevant to the query.
+
+        Args:
+            query: What to look for in the contract, e.g. "termination notice period".
+
+        Returns:
+            A list of the most relevant passages of the contract.
+        """
+        contract_id = await resolve_contract(db_client, agent_id, bound_contract)
+        logger.debug(f"searching contract_id: {contract_id}")
+
+        # embedding the query is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(retrieval.retrieve_chunks, chroma_client, contract_id, query)
+
+    return search_contract
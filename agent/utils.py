@@ -1,73 +1,232 @@
 import logging
 import asyncio
 import json
-from time import sleep
+import time
+import contextlib
 
-from fastapi import Request
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import create_agent
 from langchain.messages import (
     HumanMessage,
     AnyMessage,
     AIMessage,
+    AIMessageChunk,
     ToolMessage,
 )
 from langgraph.graph.state import CompiledStateGraph
 
-from agent import dal as agent_dal
+from agent import context
+from agent import history as agent_history
+from agent import retrieval
 from agent import tools
+from agent.writer import message_writer
+from agent.schemas import Agent, ContextMode
+from usage import utils as usage_utils
 
 from google.api_core.exceptions import InvalidArgument, ResourceExhausted
-from google.cloud.firestore import Client
+from google.cloud.firestore import AsyncClient, Client
 from google.cloud.storage import Bucket
 
-from typing import List
+import chromadb
+
+from typing import Any, AsyncIterator, Callable, List, Optional, Protocol, Tuple
 from datetime import datetime, timezone
 
 
 logger = logging.getLogger(__name__)
 
+# how often a pending agent step checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
 
-def prepare_agent(db_client: Client, bucket: Bucket, agent_id: str, message: str):
-    agent_doc = agent_dal.get_agent_document(db_client, agent_id)
-    model = ChatGoogleGenerativeAI(
-        model=agent_doc.model_name,
-        vertexai=True,
-        thinking_budget=-1,
-        top_k=50,
-        top_p=0.9,
-        temperature=0.7,
-        streaming=True,
-    )
 
-    agent = create_agent(
-        model,
-        tools=[
-            tools.make_get_contract_schema_tool(db_client=db_client, agent_id=agent_id),
-            tools.make_fetch_validation_report_tool(
-                db_client=db_client, agent_id=agent_id
-            ),
-            tools.make_validate_contract_tool(
-                db_client=db_client, bucket=bucket, agent_id=agent_id
-            ),
-        ],
-        checkpointer=None,
-    )
+class Disconnectable(Protocol):
+    """A request, or a resumable stream run that outlives its requests."""
+
+    async def is_disconnected(self) -> bool: ...
+
+
+class WarmAgent:
+    """
+    An agent with its tools, model and compiled graph built once, so they can
+    be reused for several questions, e.g. over a WebSocket connection.
+
+    The contract context of FULL mode is loaded when the agent is built;
+    RETRIEVAL mode retrieves the excerpts for every question. A contract_id
+    binds the agent to one contract of a cross-contract query instead of the
+    agent's selected contract.
+
+    The contract context is loaded with the sync db_client, in the thread
+    building the agent. The tools run on the event loop and use the
+    async_db_client.
+    """
+
+    def __init__(
+        self,
+        db_client: Client,
+        async_db_client: AsyncClient,
+        bucket: Bucket,
+        chroma_client: chromadb.ClientAPI, # type: ignore
+        agent_doc: Agent,
+        agent_id: str,
+        contract_id: Optional[str] = None,
+    ):
+        self.agent_doc = agent_doc
+        self.agent_id = agent_id
+        self.chroma_client = chroma_client
+        self.contract_id = contract_id or agent_doc.selected_contract
+        bound = {"db_client": async_db_client, "agent_id": agent_id, "bound_contract": contract_id}
+
+        agent_tools = [
+            tools.make_get_contract_outline_tool(**bound),
+            tools.make_get_contract_fields_tool(**bound),
+            tools.make_get_contract_dates_tool(**bound),
+            tools.make_fetch_validation_report_tool(**bound),
+            tools.make_validate_contract_tool(bucket=bucket, **bound),
+        ]
+
+        cached_content = None
+        # when the model side cached content stops being usable
+        self.cached_until: Optional[float] = None
+        self.prefix: List[AnyMessage] = []
+
+        # the contract is referenced by id and resolved on every call, so
+        # add_contracts_to_agent takes effect on the next turn
+        if agent_doc.context_mode == ContextMode.RETRIEVAL:
+            retrieval.ensure_contract_index(
+                chroma_client, db_client, bucket, self.contract_id
+            )
+            agent_tools.append(
+                tools.make_search_contract_tool(chroma_client=chroma_client, **bound)
+            )
+        else:
+            contract_text = context.load_contract_text(
+                db_client, bucket, self.contract_id
+            )
+            self.prefix = context.build_context_prefix(contract_text)
+
+            context_cache = context.get_context_cache()
+            cached_entry = context_cache.get_or_create_entry(
+                agent_doc.model_name, contract_text, agent_tools
+            )
+            if context_cache.model_side and cached_entry is not None:
+                cached_content = cached_entry.name
+                self.cached_until = cached_entry.expires_at
+
+        self.cached_content = cached_content
+
+        model = context.CachedContextChatModel(
+            model=agent_doc.model_name,
+            vertexai=True,
+            thinking_budget=-1,
+            top_k=50,
+            top_p=0.9,
+            temperature=0.7,
+            streaming=True,
+            cached_content=cached_content,
+        )
+
+        self.agent: CompiledStateGraph = create_agent(
+            model,
+            tools=agent_tools,
+            checkpointer=None,
+        )
+
+        # system messages stored by older agents carry a copy of the contract,
+        # the prefix replaces them
+        self.transcript: List[AnyMessage] = [
+            msg for msg in agent_doc.messages if msg.type != "system"
+        ]
+
+    def expired(self) -> bool:
+        """True once the cached content the model was built with has expired."""
+        return self.cached_until is not None and time.time() >= self.cached_until
+
+    def prepare(self, message: str) -> Tuple[List[AnyMessage], List[AnyMessage]]:
+        """
+        Builds the history and the new messages for a question. Messages of
+        later answers are expected to be appended to the transcript.
+        """
+        if self.agent_doc.context_mode == ContextMode.RETRIEVAL:
+            prefix = retrieval.build_retrieval_prefix(
+                retrieval.retrieve_chunks(
+                    self.chroma_client, self.contract_id, message
+                )
+            )
+        else:
+            prefix = self.prefix
 
-    history: List[AnyMessage] = agent_doc.messages
-    messages: List[AnyMessage] = []
+        history: List[AnyMessage] = agent_history.fit_history(self.agent_doc, self.transcript)
+        if self.cached_content is None:
+            history = prefix + history
 
-    if len(history) < 2:
-        raise ValueError("Agent has no history")
+        messages: List[AnyMessage] = []
 
-    messages.append(
-        HumanMessage(
-            content=message,
-            additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
+        messages.append(
+            HumanMessage(
+                content=message,
+                additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
+            )
         )
-    )
 
-    return agent, history, messages
+        return history, messages
+
+
+def prepare_agent(
+    db_client: Client,
+    async_db_client: AsyncClient,
+    bucket: Bucket,
+    chroma_client: chromadb.ClientAPI, # type: ignore
+    agent_doc: Agent,
+    agent_id: str,
+    message: str,
+):
+    """Builds the agent for one question from the agent document the request already read."""
+    warm_agent = WarmAgent(db_client, async_db_client, bucket, chroma_client, agent_doc, agent_id)
+    history, messages = warm_agent.prepare(message)
+    return warm_agent.agent, history, messages
+
+
+async def until_disconnected(request: Disconnectable, stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Yields the items of the stream until the client disconnects.
+
+    The disconnect is polled while the next item is pending, so a slow tool
+    call is cancelled as soon as the client goes away instead of running to
+    completion for nobody.
+    """
+    iterator = stream.__aiter__()
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(iterator.__anext__())
+            while True:
+                done, _ = await asyncio.wait({pending}, timeout=DISCONNECT_POLL_SECONDS)
+                if done:
+                    break
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling agent run")
+                    pending.cancel()
+                    with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                        await pending
+                    return
+
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            yield item
+
+            if await request.is_disconnected():
+                logger.info("Client disconnected")
+                return
+    finally:
+        # closing the agent stream cancels whatever step is still running
+        if pending is not None and not pending.done():
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await pending
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
 
 
 async def call_agent(
@@ -95,11 +254,16 @@ async def call_agent(
     logger.debug(f"calling agent with ID: {agent_id}")
 
     try:
+        started = time.perf_counter()
         response = await agent.ainvoke(input={"messages": history + messages})
         response_msgs = response["messages"]
         response_msgs = response_msgs[len(history) :]
 
-        logger.debug(f"agent generated response")
+        usage_utils.record_agent_messages(
+            "agent.call", response_msgs, started, agent_id=agent_id
+        )
+
+        logger.debug("agent generated response")
 
         for msg in response_msgs:
             if not msg.additional_kwargs.get("created_at", None):
@@ -147,104 +311,134 @@ async def call_agent(
 # write call_agent method with streaming agent response
 
 
-async def stream_agent(
+def sse_frame(event: dict) -> str:
+    """Formats an agent event as a server-sent event frame."""
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def message_content(msg: AIMessage) -> str:
+    """Flattens the content of an AI message into its text."""
+    if not isinstance(msg.content, list):
+        return msg.content
+
+    # possibility to break here, since it is depends on the format of the llm's output
+    new_msg = ""
+    if len(msg.content) > 0:
+        if isinstance(msg.content[0], dict) and "text" in msg.content[0]:
+            new_msg = msg.content[0]["text"]  # type: ignore
+        elif isinstance(msg.content[0], str):
+            new_msg = msg.content[0]
+        if len(msg.content) > 1 and isinstance(msg.content[1], str):
+            new_msg += msg.content[1]
+    return new_msg
+
+
+async def agent_events(
     db_client: Client,
-    request: Request,
+    request: Disconnectable,
     agent_id: str,
     agent: CompiledStateGraph,
     history: List[AnyMessage],
     messages: List[AnyMessage],
-):
+    on_answer: Optional[Callable[[str], Any]] = None,
+    transcript: Optional[List[AnyMessage]] = None,
+    operation: str = "agent.stream",
+    pace: bool = True,
+) -> AsyncIterator[dict]:
     """
-    Call the agent with the given message and history, and stream the response.
+    Call the agent with the given message and history, and yield its events.
 
     Args:
-        db: The database session.
-        bucket: The bucket to download the contract from.
+        db_client: Firestore client.
+        request: Stops the run once it is disconnected.
         agent_id: The ID of the agent to call.
-        message: The message to send to the agent.
+        agent: The compiled agent graph.
         history: The history of messages to send to the agent.
+        messages: The new messages to send to the agent.
+        on_answer: Called in a worker thread with the final answer, once the
+            agent completed without being interrupted.
+        transcript: Extended with the question and each completed message.
+        operation: Usage operation the run is recorded under.
+        pace: Spaces the events out for the typing effect of the web client.
 
     Returns:
-        A generator that yields the response messages from the agent.
+        A generator of {"type", "content"} events. Each message is queued for
+        persistence as soon as it completes.
     """
     # stream the response
     logger.debug(f"streaming agent with ID: {agent_id}")
 
+    async def pause(seconds: float):
+        if pace:
+            await asyncio.sleep(seconds)
+
+    chunks: List[AnyMessage] = [messages[0]]
+
+    def keep(msgs: List[AnyMessage]):
+        message_writer.enqueue(agent_id, msgs)
+        if transcript is not None:
+            transcript.extend(msgs)
+
     try:
-        agent_response = agent.astream(input={"messages": history + messages})
-        chunks: List[AnyMessage] = [messages[0]]
+        started = time.perf_counter()
+        first_token_at = None
+        # "updates" carries the completed messages, "messages" the token chunks
+        # of the model, used to time the first token
+        agent_response = agent.astream(
+            input={"messages": history + messages}, stream_mode=["updates", "messages"]
+        )
+
+        # persisted before the model runs, so the question survives a disconnect
+        keep(messages)
+
+        async for mode, chunk in until_disconnected(request, agent_response):
+            if mode == "messages":
+                if first_token_at is None and isinstance(chunk[0], AIMessageChunk):
+                    first_token_at = time.perf_counter()
+                continue
 
-        async for chunk in agent_response:
-            if await request.is_disconnected():
-                logger.info("Client disconnected")
-                break
             key = next(iter(chunk))
             msg = chunk[key]["messages"][0]
-            
+
             msg.additional_kwargs["created_at"] = datetime.now(timezone.utc).timestamp()
-            await asyncio.sleep(1)
+            await pause(1)
             if isinstance(msg, AIMessage):
                 # check if msg has tool calls
                 if len(msg.tool_calls) > 0:
                     chunks.append(msg)
-                    yield f"data: {json.dumps(
-                        {"type": "tool_call", "content": msg.tool_calls[0]["name"]}
-                    )}\n\n"
-                    await asyncio.sleep(0.2)
-
-                elif isinstance(msg.content, list):
-                    # possibility to break here, since it is depends on the format of the llm's output
-                    new_msg = ""
-                    
-                    
-                    if len(msg.content) > 0:
-                        if isinstance(msg.content[0], dict) and "text" in msg.content[0]:
-                            new_msg = msg.content[0]["text"]  # type: ignore
-                        elif isinstance(msg.content[0], str):
-                            new_msg = msg.content[0]
-                        if len(msg.content) > 1 and isinstance(msg.content[1], str):
-                            new_msg += msg.content[1]
-                    
-                    msg.content = new_msg
-                    chunks.append(msg)
-
-                    # send 100 chars at once
-                    for i in range(0, len(msg.content), 100):
-
-                        yield f"data: {json.dumps(
-                            {"type": "ai_response", "content": msg.content[i : i + 100]}
-                        )}\n\n"
-                        await asyncio.sleep(0.2)
-
-                    # yield f"ai_response: {msg.content}"
+                    keep([msg])
+                    yield {"type": "tool_call", "content": msg.tool_calls[0]["name"]}
+                    await pause(0.2)
                 else:
+                    msg.content = message_content(msg)
                     chunks.append(msg)
+                    keep([msg])
+
                     # send 100 chars at once
                     for i in range(0, len(msg.content), 100):
-                        yield f"data:{json.dumps(
-                            {"type": "ai_response", "content": msg.content[i : i + 100]}
-                        )}\n\n"
-                        await asyncio.sleep(0.2)
-                    # yield f"ai_response: {msg.content}"
+                        yield {"type": "ai_response", "content": msg.content[i : i + 100]}
+                        await pause(0.2)
             elif isinstance(msg, ToolMessage):
-
                 chunks.append(msg)
-                yield f"data: {json.dumps(
-                    {"type": "tool_response", "content": ""}
-                )}\n\n"
-                await asyncio.sleep(0.5)
+                keep([msg])
+                yield {"type": "tool_response", "content": ""}
+                await pause(0.5)
 
         logger.debug(f"completed streaming agent response for agent_id: {agent_id}")
 
-        # save the messages to the database
-        await asyncio.to_thread(
-            agent_dal.add_messages, db_client, agent_id, messages=chunks
+        usage_utils.record_agent_messages(
+            operation, chunks, started, first_token_at=first_token_at, agent_id=agent_id
         )
 
-        logger.debug(f"saved messages to database for agent_id: {agent_id}")
-        yield f"data: {json.dumps({"type": "done", "content": ""})}\n\n"
-        
+        agent_history.schedule_compaction(db_client, agent_id, history + chunks)
+        yield {"type": "done", "content": ""}
+
+        answer = final_answer(chunks)
+        if on_answer is not None and answer:
+            try:
+                await asyncio.to_thread(on_answer, answer)
+            except Exception as exc:
+                logger.warning("Caching the answer of agent_id=%s failed", agent_id, exc_info=exc)
 
     except ResourceExhausted as exc:
         logging.error(
@@ -252,7 +446,7 @@ async def stream_agent(
             agent_id,
             exc_info=exc,
         )
-        yield f"data: {json.dumps({"type": "error", "content": "Rate limit exceeded. Please try again later."})}\n\n"
+        yield {"type": "error", "content": "Rate limit exceeded. Please try again later."}
     except InvalidArgument as exc:
         if "context" in str(exc).lower():
             logging.error(
@@ -260,12 +454,86 @@ async def stream_agent(
                 agent_id,
                 exc_info=exc,
             )
-            
-        yield f"data: {json.dumps({"type": "error", "content": "Context overflow. Please try again with a shorter message."})}\n\n"
+
+        yield {"type": "error", "content": "Context overflow. Please try again with a shorter message."}
     except Exception as exc:
         logging.error(
             "Agent invoke failed for agent_id=%s",
             agent_id,
             exc_info=exc,
         )
-        yield f"data: {json.dumps({"type": "error", "content": "An error occurred. Please try again."})}\n\n"
+        yield {"type": "error", "content": "An error occurred. Please try again."}
+
+
+async def stream_agent(
+    db_client: Client,
+    request: Disconnectable,
+    agent_id: str,
+    agent: CompiledStateGraph,
+    history: List[AnyMessage],
+    messages: List[AnyMessage],
+    on_answer: Optional[Callable[[str], Any]] = None,
+):
+    """
+    Call the agent with the given message and history, and stream the response.
+
+    Returns:
+        A generator of the SSE frames of agent_events.
+    """
+    async for event in agent_events(
+        db_client, request, agent_id, agent, history, messages, on_answer=on_answer
+    ):
+        yield sse_frame(event)
+
+
+def final_answer(chunks: List[AnyMessage]) -> Optional[str]:
+    """
+    Returns the text of the agent's final answer, or None if the run ended
+    on a tool call or tool result, i.e. it was interrupted.
+    """
+    if not chunks:
+        return None
+    last = chunks[-1]
+    if not isinstance(last, AIMessage) or last.tool_calls:
+        return None
+    if not isinstance(last.content, str) or not last.content.strip():
+        return None
+    return last.content
+
+
+async def cached_answer_events(
+    agent_id: str,
+    message: str,
+    answer: str,
+    transcript: Optional[List[AnyMessage]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Yields an answer served from the answer cache as the events of agent_events.
+    The question and the answer are persisted like a generated exchange.
+    """
+    logger.debug(f"streaming cached answer for agent_id: {agent_id}")
+
+    created_at = datetime.now(timezone.utc).timestamp()
+    question = HumanMessage(content=message, additional_kwargs={"created_at": created_at})
+    reply = AIMessage(
+        content=answer,
+        # history is ordered by created_at, so the answer must sort after the question
+        additional_kwargs={"created_at": created_at + 0.001, "cached_answer": True},
+    )
+    message_writer.enqueue(agent_id, [question, reply])
+    if transcript is not None:
+        transcript.extend([question, reply])
+
+    for i in range(0, len(answer), 100):
+        yield {"type": "ai_response", "content": answer[i : i + 100]}
+    yield {"type": "done", "content": ""}
+
+
+async def stream_cached_answer(
+    agent_id: str,
+    message: str,
+    answer: str,
+):
+    """Streams an answer served from the answer cache in the frames of stream_agent."""
+    async for event in cached_answer_events(agent_id, message, answer):
+        yield sse_frame(event)
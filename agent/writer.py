@@ -0,0 +1,141 @@
+"""Write-behind persistence of agent messages.
+
+Streamed messages are queued as soon as each one completes and written by a
+background task that coalesces them into batched writes, bounded by a linger
+time and a batch size. A client disconnect or a failed stream no longer loses
+the question or the generated messages, and there is no Firestore round trip
+per message on the streaming path. The queue is drained on shutdown through
+the FastAPI lifespan.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+
+from dataclasses import dataclass
+from typing import List, Optional
+from google.cloud.firestore import Client
+from langchain.messages import AnyMessage
+
+from agent import dal as agent_dal
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_WRITE_LINGER_SECONDS = float(os.environ.get("AGENT_MESSAGE_WRITE_LINGER", 0.25))
+MESSAGE_WRITE_BATCH_SIZE = int(os.environ.get("AGENT_MESSAGE_WRITE_BATCH_SIZE", 100))
+MESSAGE_WRITE_RETRIES = 3
+MESSAGE_WRITE_SHUTDOWN_TIMEOUT_SECONDS = 10
+
+
+@dataclass
+class PendingMessage:
+    agent_id: str
+    doc_id: str
+    msg_dict: dict
+
+
+class MessageWriter:
+    """Queues agent messages and writes them in coalesced batches."""
+
+    def __init__(
+        self,
+        linger_seconds: float = MESSAGE_WRITE_LINGER_SECONDS,
+        batch_size: int = MESSAGE_WRITE_BATCH_SIZE,
+    ):
+        self.linger_seconds = linger_seconds
+        self.batch_size = batch_size
+        self._db: Optional[Client] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db: Client):
+        """Starts the background writer on the running event loop."""
+        self._db = db
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, agent_id: str, messages: List[AnyMessage]):
+        """
+        Queues messages for persistence. Messages are serialized right away,
+        so later changes to the message objects are not persisted.
+
+        Raises:
+            RuntimeError: If the writer has not been started.
+        """
+        if self._queue is None:
+            raise RuntimeError("Message writer is not started")
+
+        for msg in messages:
+            self._queue.put_nowait(
+                PendingMessage(
+                    agent_id=agent_id,
+                    doc_id=str(uuid.uuid4()),
+                    msg_dict=agent_dal.message_to_dict(msg),
+                )
+            )
+
+    async def flush(self):
+        """Waits until every queued message has been written or dropped."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """Drains the queue and stops the background writer."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout=MESSAGE_WRITE_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(
+                "Timed out flushing %d agent messages on shutdown", self._queue.qsize()  # type: ignore
+            )
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = self._queue  # type: ignore
+        while True:
+            batch: List[PendingMessage] = [await queue.get()]
+            deadline = loop.time() + self.linger_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write(self, batch: List[PendingMessage]):
+        items = [(item.agent_id, item.doc_id, item.msg_dict) for item in batch]
+        for attempt in range(MESSAGE_WRITE_RETRIES):
+            try:
+                await asyncio.to_thread(agent_dal.write_message_batch, self._db, items)
+                logger.debug(f"wrote {len(items)} agent messages")
+                return
+            except Exception as exc:
+                logger.warning(
+                    "Writing agent messages failed (attempt %d)", attempt + 1, exc_info=exc
+                )
+                await asyncio.sleep(0.2 * 2**attempt)
+
+        logger.error(
+            "Dropping %d agent messages for agents %s",
+            len(items),
+            sorted({item.agent_id for item in batch}),
+        )
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,157 @@
+"""FastAPI routes for platform administration."""
+
+from typing import Annotated, Any, Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from api.utils import handle_exceptions, validate_session
+from api.singleflight import single_flight
+from connectors.google_certs import google_certs
+from connectors import cache_coherence
+from connectors.blob_cache import blob_cache
+from contracts.cache import contract_cache
+from sessions.cache import session_cache
+from sessions.sweeper import sweep_stats
+from sessions import schemas as session_schemas
+from usage import utils as usage_utils
+from usage.schemas import UsageDimension, UsageSummary
+
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin")
+
+
+def require_admin(
+    session: Annotated[session_schemas.Session, Depends(validate_session)],
+) -> session_schemas.Session:
+    """
+    Allows only the users listed in the comma separated ADMIN_USERS env variable.
+
+    Raises:
+        HTTPException: If the user is not an admin with 403 (Forbidden) status code
+    """
+    admins = {
+        admin.strip()
+        for admin in os.environ.get("ADMIN_USERS", "").split(",")
+        if admin.strip()
+    }
+    if session.user_id not in admins:
+        raise HTTPException(status_code=403, detail="admin access required")
+    return session
+
+
+@router.get("/usage")
+@handle_exceptions
+async def get_usage(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+    dimension: UsageDimension = UsageDimension.USER,
+) -> List[UsageSummary]:
+    """
+    Returns the LLM usage of this instance aggregated by the given dimension,
+    with token totals, estimated cost and latency percentiles.
+
+    Args:
+        dimension: One of 'user', 'agent', 'contract', 'operation'.
+
+    Returns:
+        List[UsageSummary]: Usage per key, most expensive first.
+    """
+    logger.debug(f"fetching usage summary by {dimension.value}")
+    return usage_utils.recorder.summary(dimension)
+
+
+@router.get("/singleflight")
+@handle_exceptions
+async def get_single_flight_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, Dict[str, int]]:
+    """
+    Returns how many calls of each coalesced operation were executed and how
+    many duplicates joined a call already in flight on this instance.
+    """
+    return single_flight.stats()
+
+
+@router.get("/auth")
+@handle_exceptions
+async def get_auth_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, int]:
+    """
+    Returns the Google certificate fetches and the session cache hits and
+    misses of this instance.
+    """
+    return {
+        "google_cert_fetches": google_certs.fetches,
+        "session_cache_hits": session_cache.hits,
+        "session_cache_misses": session_cache.misses,
+    }
+
+
+@router.get("/contract_cache")
+@handle_exceptions
+async def get_contract_cache_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, int]:
+    """
+    Returns the hits, misses, evictions, entries and size in bytes of the
+    contract cache of this instance.
+    """
+    return contract_cache.stats()
+
+
+@router.get("/blob_cache")
+@handle_exceptions
+async def get_blob_cache_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, int]:
+    """
+    Returns the hits, misses, evictions, corrupted entries, entries and size
+    in bytes of the local GCS blob cache of this instance.
+    """
+    return blob_cache.stats()
+
+
+@router.get("/cache_tier")
+@handle_exceptions
+async def get_cache_tier_stats(
+    request: Request,
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, int]:
+    """
+    Returns the hits, misses and errors of the shared cache tier and the
+    invalidations received from other instances. Empty without a shared tier.
+    """
+    tier = request.app.state.cache_tier
+    if tier is None:
+        return {}
+    return tier.stats()
+
+
+@router.get("/cache_coherence")
+@handle_exceptions
+async def get_cache_coherence_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, int]:
+    """
+    Returns the snapshot listeners, watched keys and listener driven
+    invalidations of this instance. Empty when coherence is disabled.
+    """
+    if cache_coherence.cache_coherence is None:
+        return {}
+    return cache_coherence.cache_coherence.stats()
+
+
+@router.get("/sessions")
+@handle_exceptions
+async def get_session_sweep_stats(
+    session: Annotated[session_schemas.Session, Depends(require_admin)],
+) -> Dict[str, Any]:
+    """
+    Returns the expired session sweeps of this instance: deletes in total and
+    in the last sweep, its throughput, and the size of the sessions collection
+    after it.
+    """
+    return sweep_stats.to_dict()
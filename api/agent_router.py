@@ -1,40 +1,75 @@
 import logging
 import asyncio
 
-from typing import Annotated, Any, List
-from fastapi import APIRouter, Body, Depends, Request, Response
+from typing import Annotated, Any, Optional
+from fastapi import (
+    APIRouter,
+    Body,
+    Cookie,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 from fastapi.responses import StreamingResponse
-from langchain.messages import AIMessage, SystemMessage, ToolMessage, AnyMessage
-from api.schemas import CallAgentRequest, CreateAgentRequest, RenameAgentRequest
+from api.schemas import (
+    CallAgentRequest,
+    CreateAgentRequest,
+    RenameAgentRequest,
+    SetAgentContractsRequest,
+)
 from api.utils import (
-    handle_exceptions,
+    check_session,
     validate_session,
     handle_exceptions,
     get_bucket,
+    get_chromadb,
+    get_async_firestore,
     get_firestore,
 )
 from google.cloud import firestore, storage
-from connectors.gcs_connector import download_file
 from sessions import schemas as session_schemas
 from agent import schemas as agent_schemas
-from agent import dal as agent_dal
+from agent import async_dal as agent_dal
 from agent import utils as agent_utils
-from datetime import datetime, timezone
-from langchain.messages import AIMessageChunk
-from contracts import dal as contract_dal
-from agent import prompts as agent_prompts
-from langgraph.graph.state import CompiledStateGraph
+from agent import history as agent_history
+from agent import portfolio as agent_portfolio
+from usage import utils as usage_utils
+from agent.streams import stream_registry
+from agent.answer_cache import answer_cache, is_first_turn
+from api.singleflight import single_flight
+from contracts import async_dal as contract_dal
 from google.cloud.storage import Bucket
 
+import chromadb
+import json
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/agent")
 
+# the first message of a WebSocket must authenticate it within this time
+SOCKET_AUTH_TIMEOUT_SECONDS = 10
+SOCKET_HEARTBEAT_SECONDS = 15
+
+
+class SocketConnection:
+    """Lets the agent runs of a WebSocket notice that the socket went away."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def is_disconnected(self) -> bool:
+        return self.closed
+
 
 @router.post("/")
 @handle_exceptions
 async def create_agent(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     req: CreateAgentRequest,
@@ -51,9 +86,7 @@ async def create_agent(
     """
 
     # verify whether contract exists
-    contract = await asyncio.to_thread(
-        contract_dal.get_contract, db_client, req.selected_contract
-    )
+    contract = await contract_dal.get_contract(db_client, req.selected_contract)
     if not contract:
         raise ValueError(f"Contract with ID {req.selected_contract} does not exist.")
 
@@ -64,39 +97,17 @@ async def create_agent(
 
     # Create a new collection for the agent
     agent_doc = agent_schemas.Agent(
-        user_id=session.user_id, name=req.name, selected_contract=req.selected_contract
-    )
-    agent_id = await asyncio.to_thread(
-        agent_dal.create_agent_document, db_client, agent_doc
+        user_id=session.user_id,
+        name=req.name,
+        selected_contract=req.selected_contract,
+        context_mode=req.context_mode,
     )
+    agent_id = await agent_dal.create_agent_document(db_client, agent_doc)
 
     logger.debug(f"Created agent with ID: {agent_id}")
 
-    # add messages to the agent
-    messages = []
-
-    messages.append(
-        SystemMessage(
-            content=agent_prompts.agent_system_prompt,
-            additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
-        )
-    )
-
-    get_contract_response_bytes = download_file(bucket, contract.md_uri)
-
-    # convert bytes to string
-    get_contract_response_str = get_contract_response_bytes.decode("utf-8")
-
-    # load the contract content into the agent's context
-    messages.append(
-        SystemMessage(
-            content=f"The following is the content of a contract document that may be relevant to answer the user's question:\n\n{get_contract_response_str}",
-            additional_kwargs={"created_at": datetime.now(timezone.utc).timestamp()},
-        )
-    )
-
-    # add the message to the agent
-    await asyncio.to_thread(agent_dal.add_messages, db_client, agent_id, messages)
+    # the contract is resolved from selected_contract on every call, so no
+    # copy of it is stored in the agent's messages
 
     return agent_id
 
@@ -104,7 +115,7 @@ async def create_agent(
 @router.get("/get_all")
 @handle_exceptions
 async def get_all_agents(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
 ) -> list[agent_schemas.Agent]:
     """
@@ -118,9 +129,7 @@ async def get_all_agents(
         List of Agent objects.
     """
 
-    agents = await asyncio.to_thread(
-        agent_dal.get_all_agent_documents, db_client, session.user_id
-    )
+    agents = await agent_dal.get_all_agent_documents(db_client, session.user_id)
 
     return agents
 
@@ -130,7 +139,9 @@ async def get_all_agents(
 @handle_exceptions
 async def stream_agent(
     db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    async_db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[Bucket, Depends(get_bucket)],
+    chroma_client: Annotated[chromadb.ClientAPI, Depends(get_chromadb)], # type: ignore
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     response: Response,
     request: Request,
@@ -141,20 +152,40 @@ async def stream_agent(
     Call an agent for the given session.
 
     Args:
-        db_client: Firestore client.
+        db_client: Firestore client, for the agent run.
+        async_db_client: Async Firestore client, for the documents read by the request.
         session: Session object.
         agent_id: Agent ID.
         message: Message to send to the agent.
         selected_contracts: List of selected contract IDs.
 
+    A request carrying a Last-Event-ID header resumes the stream that event
+    belongs to instead of starting a new run.
+
     Returns:
         Agent object.
     """
     logger.debug(f"streaming agent with ID: {agent_id} for user: {session.user_id}")
 
-    agent_doc = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, agent_id
-    )
+    headers = {
+        "Cache-Control": "no-cache, no-transform",
+        "Content-Type": "text/event-stream",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }
+
+    # a reconnecting client replays the frames it missed and re-attaches to the run
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        run, after_seq = stream_registry.resume(last_event_id, session.user_id)
+        if run is None:
+            raise ValueError("The response stream has expired. Please ask again.")
+
+        logger.debug(f"resuming stream {run.stream_id} after event {after_seq}")
+        headers["X-Stream-ID"] = run.stream_id
+        return StreamingResponse(run.subscribe(request, after_seq), headers=headers)  # type: ignore
+
+    agent_doc = await agent_dal.get_agent_document(async_db_client, agent_id)
 
     logger.debug(
         f"fetched agent document with ID: {agent_id} for user: {session.user_id}"
@@ -167,25 +198,274 @@ async def stream_agent(
     if agent_doc.user_id != session.user_id:
         raise ValueError("User not authorized to call this agent")
 
-    agent, history, messages = await asyncio.to_thread(
-        agent_utils.prepare_agent, db_client, bucket, agent_id, message
+    usage_utils.bind_usage_context(
+        agent_id=agent_id, contract_id=agent_doc.selected_contract
     )
 
-    streamer = agent_utils.stream_agent(db_client, request, agent_id, agent, history, messages)
+    async def start_run():
+        # a question about several contracts fans out to one sub-query per contract
+        if len(agent_doc.selected_contracts) > 1:
+            return stream_registry.start(
+                session.user_id,
+                agent_id,
+                lambda run: agent_portfolio.stream_portfolio(
+                    db_client, async_db_client, bucket, chroma_client, run, agent_doc, agent_id, message
+                ),
+            )
+
+        # the first question of a chat close enough to one already answered for
+        # this contract is answered from the cache without running the agent
+        contract_id = agent_doc.selected_contract
+        first_turn = is_first_turn(agent_doc.messages, agent_doc.history_summary)
+        generation = answer_cache.generation(contract_id)
+        cached_answer = None
+        if first_turn:
+            cached_answer = await asyncio.to_thread(answer_cache.lookup, contract_id, message)
+        if cached_answer is not None:
+            return stream_registry.start(
+                session.user_id,
+                agent_id,
+                lambda run: agent_utils.stream_cached_answer(agent_id, message, cached_answer),
+            )
+
+        agent, history, messages = await asyncio.to_thread(
+            agent_utils.prepare_agent,
+            db_client,
+            async_db_client,
+            bucket,
+            chroma_client,
+            agent_doc,
+            agent_id,
+            message,
+        )
+
+        # the run outlives this request, it stops once no client is attached for a while
+        return stream_registry.start(
+            session.user_id,
+            agent_id,
+            lambda run: agent_utils.stream_agent(
+                db_client,
+                run,
+                agent_id,
+                agent,
+                history,
+                messages,
+                on_answer=(
+                    (lambda answer: answer_cache.store(contract_id, message, answer, generation))
+                    if first_turn
+                    else None
+                ),
+            ),
+        )
+
+    # a duplicate of a question still being answered subscribes to the
+    # running stream from its first frame instead of starting another run
+    run = await single_flight.do(
+        "agent.stream", agent_id, {"message": message}, start_run, hold=lambda run: run.task
+    )
+    headers["X-Stream-ID"] = run.stream_id
+
+    streamer = run.subscribe(request)
     
-    headers = {
-        "Cache-Control": "no-cache, no-transform",
-        "Content-Type": "text/event-stream",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
     return StreamingResponse(streamer, headers=headers)  # type: ignore
 
 
+@router.websocket("/ws")
+async def agent_socket(
+    websocket: WebSocket,
+    agent_id: str,
+    session_id: Optional[str] = Cookie(None, alias="session_id"),
+):
+    """
+    Chat with an agent over a WebSocket.
+
+    The socket is authenticated once and the agent is built once, so the
+    following questions only pay for the LLM. Protocol, all messages JSON:
+
+        client: {"type": "auth", "csrf_token": ...}  must be the first message
+        server: {"type": "ready"}
+        client: {"type": "question", "id": ..., "content": ...}
+        server: the events of /agent/stream, e.g. {"type": "ai_response", "id": ..., "content": ...},
+                ending with "done" or "error"
+        server: {"type": "ping"} every SOCKET_HEARTBEAT_SECONDS
+        client: {"type": "ping"}, answered with {"type": "pong"}
+
+    Questions are answered one after another in the order they arrive, each
+    event carries the id of its question. The agent's contract context is
+    loaded when the socket opens, so a client reconnects after switching the
+    agent to another contract. The agent is rebuilt, keeping the transcript,
+    once the context cache entry it was built with expires.
+    """
+    db_client: firestore.Client = websocket.app.state.firestore
+    async_db_client: firestore.AsyncClient = websocket.app.state.firestore_async
+    bucket: Bucket = websocket.app.state.bucket
+    chroma_client: chromadb.ClientAPI = websocket.app.state.chromadb # type: ignore
+
+    await websocket.accept()
+
+    # browsers cannot set headers on a WebSocket, so the CSRF token comes
+    # in the first message, checked against the session cookie
+    try:
+        auth = json.loads(
+            await asyncio.wait_for(websocket.receive_text(), timeout=SOCKET_AUTH_TIMEOUT_SECONDS)
+        )
+        if not isinstance(auth, dict) or auth.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="unauthorized")
+        session = await check_session(async_db_client, session_id, auth.get("csrf_token"))
+
+        agent_doc = await agent_dal.get_agent_document(async_db_client, agent_id)
+        if agent_doc.user_id != session.user_id:
+            raise ValueError("User not authorized to call this agent")
+
+        usage_utils.bind_usage_context(
+            agent_id=agent_id, contract_id=agent_doc.selected_contract
+        )
+        warm_agent = await asyncio.to_thread(
+            agent_utils.WarmAgent,
+            db_client,
+            async_db_client,
+            bucket,
+            chroma_client,
+            agent_doc,
+            agent_id,
+        )
+    except WebSocketDisconnect:
+        return
+    except HTTPException as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+        return
+    except (asyncio.TimeoutError, ValueError) as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc) or "unauthorized")
+        return
+
+    logger.debug(f"agent socket opened for agent: {agent_id} and user: {session.user_id}")
+
+    connection = SocketConnection()
+    questions: asyncio.Queue = asyncio.Queue()
+    send_lock = asyncio.Lock()
+
+    async def send(event: dict):
+        async with send_lock:
+            await websocket.send_json(event)
+
+    async def answer(question_id: Any, content: str):
+        nonlocal warm_agent
+
+        if len(agent_doc.selected_contracts) > 1:
+            events = agent_portfolio.portfolio_events(
+                db_client,
+                async_db_client,
+                bucket,
+                chroma_client,
+                connection,
+                agent_doc,
+                agent_id,
+                content,
+                transcript=warm_agent.transcript,
+            )
+            async for event in events:
+                await send({**event, "id": question_id})
+            return
+
+        contract_id = agent_doc.selected_contract
+        first_turn = is_first_turn(warm_agent.transcript, agent_doc.history_summary)
+        generation = answer_cache.generation(contract_id)
+        cached_answer = None
+        if first_turn:
+            cached_answer = await asyncio.to_thread(answer_cache.lookup, contract_id, content)
+        if cached_answer is not None:
+            events = agent_utils.cached_answer_events(
+                agent_id, content, cached_answer, transcript=warm_agent.transcript
+            )
+        else:
+            # the model-side cached content lives for the context cache TTL,
+            # a socket open longer registers it again
+            if warm_agent.expired():
+                logger.debug(f"context cache expired, rebuilding agent: {agent_id}")
+                rebuilt = await asyncio.to_thread(
+                    agent_utils.WarmAgent,
+                    db_client,
+                    async_db_client,
+                    bucket,
+                    chroma_client,
+                    agent_doc,
+                    agent_id,
+                )
+                rebuilt.transcript = warm_agent.transcript
+                warm_agent = rebuilt
+            history, messages = await asyncio.to_thread(warm_agent.prepare, content)
+            events = agent_utils.agent_events(
+                db_client,
+                connection,
+                agent_id,
+                warm_agent.agent,
+                history,
+                messages,
+                on_answer=(
+                    (lambda text: answer_cache.store(contract_id, content, text, generation))
+                    if first_turn
+                    else None
+                ),
+                transcript=warm_agent.transcript,
+                operation="agent.socket",
+                pace=False,
+            )
+
+        async for event in events:
+            await send({**event, "id": question_id})
+
+    async def answer_questions():
+        while True:
+            question_id, content = await questions.get()
+            try:
+                await answer(question_id, content)
+            except (ValueError, RuntimeError) as exc:
+                await send({"type": "error", "id": question_id, "content": str(exc)})
+            except Exception as exc:
+                logger.error("Agent socket question failed for agent_id=%s", agent_id, exc_info=exc)
+                await send({"type": "error", "id": question_id, "content": "An error occurred. Please try again."})
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(SOCKET_HEARTBEAT_SECONDS)
+            await send({"type": "ping"})
+
+    workers = [
+        asyncio.create_task(answer_questions()),
+        asyncio.create_task(heartbeat()),
+    ]
+
+    try:
+        await send({"type": "ready"})
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                await send({"type": "error", "content": "Invalid JSON message"})
+                continue
+
+            kind = data.get("type") if isinstance(data, dict) else None
+            if kind == "ping":
+                await send({"type": "pong"})
+            elif kind == "question" and isinstance(data.get("content"), str) and data["content"].strip():
+                questions.put_nowait((data.get("id"), data["content"]))
+            else:
+                question_id = data.get("id") if isinstance(data, dict) else None
+                await send({"type": "error", "id": question_id, "content": "Unknown message"})
+    except WebSocketDisconnect:
+        logger.debug(f"agent socket closed for agent: {agent_id}")
+    finally:
+        # stops the running agent step, like a disconnected SSE client
+        connection.closed = True
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
 @router.get("/{agent_id}")
 @handle_exceptions
 async def get_agent(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     agent_id: str,
 ) -> agent_schemas.Agent:
@@ -201,9 +481,7 @@ async def get_agent(
         Agent object.
     """
 
-    agent_doc = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, agent_id
-    )
+    agent_doc = await agent_dal.get_agent_document(db_client, agent_id)
 
     if agent_doc is None:
         raise ValueError("Agent not found")
@@ -217,7 +495,7 @@ async def get_agent(
 @router.delete("/{agent_id}")
 @handle_exceptions
 async def delete_agent(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     agent_id: str,
 ) -> None:
@@ -233,9 +511,7 @@ async def delete_agent(
         None
     """
 
-    agent_doc = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, agent_id
-    )
+    agent_doc = await agent_dal.get_agent_document(db_client, agent_id)
 
     if agent_doc is None:
         raise ValueError("Agent not found")
@@ -244,13 +520,13 @@ async def delete_agent(
         raise ValueError("User not authorized to delete this agent")
 
     # Delete the agent document
-    await asyncio.to_thread(agent_dal.delete_agent_document, db_client, agent_id)
+    await agent_dal.delete_agent_document(db_client, agent_id)
 
 
 @router.put("/add_contract")
 @handle_exceptions
 async def add_contract_to_agent(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     agent_id: str = Body(...),
     contract_id: str = Body(...),
@@ -266,9 +542,7 @@ async def add_contract_to_agent(
     Returns:
         None
     """
-    agent_doc = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, agent_id
-    )
+    agent_doc = await agent_dal.get_agent_document(db_client, agent_id)
 
     if agent_doc is None:
         raise ValueError("Agent not found")
@@ -276,16 +550,61 @@ async def add_contract_to_agent(
     if agent_doc.user_id != session.user_id:
         raise ValueError("User not authorized to modify this agent")
 
-    await asyncio.to_thread(
-        agent_dal.add_contracts_to_agent, db_client, agent_id, contract_id
-    )
+    # the agent's context is resolved from this contract on the next call
+    contract = await contract_dal.get_contract_unvalidated(db_client, contract_id)
+    if contract is None:
+        raise ValueError(f"Contract with ID {contract_id} does not exist.")
+
+    if contract.user_id != session.user_id:
+        raise ValueError("User not authorized to use this contract")
+
+    await agent_dal.add_contracts_to_agent(db_client, agent_id, contract_id)
+
+
+@router.put("/contracts")
+@handle_exceptions
+async def set_agent_contracts(
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
+    session: Annotated[session_schemas.Session, Depends(validate_session)],
+    req: SetAgentContractsRequest,
+) -> None:
+    """
+    Select several contracts for an agent. Every question is then answered
+    for each of the contracts concurrently, and the answers are merged.
+
+    Args:
+        db_client: Firestore client.
+        session: Session object.
+        req: SetAgentContractsRequest object.
+    Returns:
+        None
+    """
+    agent_doc = await agent_dal.get_agent_document(db_client, req.agent_id)
+
+    if agent_doc.user_id != session.user_id:
+        raise ValueError("User not authorized to modify this agent")
+
+    contract_ids = list(dict.fromkeys(req.contract_ids))
+    contracts = await contract_dal.get_contracts_unvalidated(db_client, contract_ids)
+    for contract_id in contract_ids:
+        contract = contracts.get(contract_id)
+        if contract is None:
+            raise ValueError(f"Contract with ID {contract_id} does not exist.")
+        if contract.user_id != session.user_id:
+            raise ValueError("User not authorized to use this contract")
+        if not contract.md_uri:
+            raise ValueError(f"Contract with ID {contract_id} does not have a valid md_uri.")
+
+    await agent_dal.set_agent_contracts(db_client, req.agent_id, contract_ids)
 
 
 @router.put("/")
 @handle_exceptions
 async def call_agent(
     db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    async_db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[Bucket, Depends(get_bucket)],
+    chroma_client: Annotated[chromadb.ClientAPI, Depends(get_chromadb)], # type: ignore
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     req: CallAgentRequest,
 ):
@@ -293,7 +612,8 @@ async def call_agent(
     Call an agent for the given session.
 
     Args:
-        db_client: Firestore client.
+        db_client: Firestore client, for the agent run.
+        async_db_client: Async Firestore client, for the documents read by the request.
         session: Session object.
         req: CallAgentRequest object.
 
@@ -301,15 +621,13 @@ async def call_agent(
         Agent object.
     """
 
-    response = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, req.agent_id
-    )
+    response = await agent_dal.get_agent_document(async_db_client, req.agent_id)
     logger.debug(
         f"fetched agent document with ID: {req.agent_id} for user: {session.user_id}"
     )
     logger.debug(f"agent document details: {response.selected_contract}")
 
-    logger.debug(f"fetched agent document")
+    logger.debug("fetched agent document")
 
     if response is None:
         raise ValueError("Agent not found")
@@ -317,20 +635,31 @@ async def call_agent(
     if response.user_id != session.user_id:
         raise ValueError("User not authorized to call this agent")
 
-    logger.debug(f"preparing agent")
+    usage_utils.bind_usage_context(
+        agent_id=req.agent_id, contract_id=response.selected_contract
+    )
+
+    logger.debug("preparing agent")
 
     # Call the agent
     agent, history, messages = await asyncio.to_thread(
-        agent_utils.prepare_agent, db_client, bucket, req.agent_id, req.message
+        agent_utils.prepare_agent,
+        db_client,
+        async_db_client,
+        bucket,
+        chroma_client,
+        response,
+        req.agent_id,
+        req.message,
     )
 
     response_msgs = await agent_utils.call_agent(req.agent_id, agent, history, messages)
 
-    logger.debug(f"agent generated response")
+    logger.debug("agent generated response")
 
-    await asyncio.to_thread(
-        agent_dal.add_messages, db_client, agent_id=req.agent_id, messages=response_msgs
-    )
+    await agent_dal.add_messages(async_db_client, agent_id=req.agent_id, messages=response_msgs)
+
+    agent_history.schedule_compaction(db_client, req.agent_id, history + response_msgs)
 
     return response_msgs
 
@@ -338,7 +667,7 @@ async def call_agent(
 @router.put("/rename")
 @handle_exceptions
 async def rename_agent(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     req: RenameAgentRequest,
 ) -> None:
@@ -353,9 +682,7 @@ async def rename_agent(
     Returns:
         None
     """
-    agent_doc = await asyncio.to_thread(
-        agent_dal.get_agent_document, db_client, req.agent_id
-    )
+    agent_doc = await agent_dal.get_agent_document(db_client, req.agent_id)
 
     if agent_doc is None:
         raise ValueError("Agent not found")
@@ -365,6 +692,4 @@ async def rename_agent(
 
     agent_doc.name = req.new_name
 
-    await asyncio.to_thread(
-        agent_dal.rename_agent, db_client, req.agent_id, req.new_name
-    )
+    await agent_dal.rename_agent(db_client, req.agent_id, req.new_name)
@@ -3,14 +3,18 @@
 from typing import Annotated, List, Union
 from fastapi import Body, Depends, Path, UploadFile, File, Form, HTTPException
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from fastapi.routing import APIRouter
 from openai import BaseModel
-from api.utils import validate_session, handle_exceptions, get_bucket, get_firestore
-from connectors import gcs_connector
-from contracts import schemas as contracts_schemas, dal as contracts_dal
+from api.utils import validate_session, handle_exceptions, get_bucket, get_chromadb, get_async_firestore
+from connectors import gcs_connector, chromadb_connector
+from contracts import schemas as contracts_schemas, async_dal as contracts_dal
 from model import extract, fill, validate
 from sessions import schemas as session_schemas
 from google.cloud import firestore, storage
+from usage import utils as usage_utils
+from agent.answer_cache import answer_cache
+from api.singleflight import single_flight
 
 import os
 import uuid
@@ -18,11 +22,24 @@ import tempfile
 import logging
 import asyncio
 import aiofiles
+import chromadb
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/contract")
 
+
+def _temp_path(contract_id: str, suffix: str) -> str:
+    # unique per request, concurrent requests for a contract must not share a file
+    return os.path.join(tempfile.gettempdir(), f"{contract_id}-{uuid.uuid4().hex}{suffix}")
+
+
+def _remove_temp(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 class UploadContractInput(BaseModel):
     contract_name: str
     contract_type: str
@@ -31,8 +48,9 @@ class UploadContractInput(BaseModel):
 @router.post("/upload")
 @handle_exceptions
 async def upload_contract(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
+    chroma_client: Annotated[chromadb.ClientAPI, Depends(get_chromadb)], # type: ignore
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     # contract_name: str = Form(...),
     # contract_type: str = Form(...),
@@ -64,51 +82,66 @@ async def upload_contract(
         pdf_uri=pdf_file_uri,
         md_uri=md_file_uri,
     )
+    usage_utils.bind_usage_context(contract_id=str(contract.contract_id))
 
-    # set temp directory to the api folder
-    api_temp = tempfile.gettempdir()
-    temp_pdf_path = os.path.join(api_temp, uploaded_contract.file.filename)
-    temp_md_path = os.path.join(api_temp, uploaded_contract.file.filename.replace(".pdf", ".md"))
-
-    # write the file to a temp pdf file and store in the api folder
-    async with aiofiles.open(temp_pdf_path, "wb") as f:
-        await f.write(await uploaded_contract.file.read())
-    
-    logger.debug("contract pdf file saved to temporary path successfully")
-
-    # extract the text from the pdf file and store it in a temp md file
-    await asyncio.to_thread(extract.extract, temp_pdf_path, temp_md_path)
-    logger.debug("contract extracted to markdown successfully")
-
-    # Upload the file to Google Cloud Storage
-    await asyncio.to_thread(gcs_connector.upload_file, bucket, temp_pdf_path, pdf_file_uri)
-    await asyncio.to_thread(gcs_connector.upload_file, bucket, temp_md_path, md_file_uri)
-    logger.debug("contract uploaded successfully")
+    # unique temp paths, the uploaded file name is not used on disk
+    temp_pdf_path = _temp_path(str(contract.contract_id), ".pdf")
+    temp_md_path = _temp_path(str(contract.contract_id), ".md")
 
-    # Save contract to Firestore
-    await asyncio.to_thread(contracts_dal.add_contract, db_client, contract)
-    logger.debug("contract saved to database successfully")
-
-    await asyncio.to_thread(os.remove, temp_pdf_path)
-    await asyncio.to_thread(os.remove, temp_md_path)
-    logger.debug("temporary files removed successfully")
+    try:
+        # write the file to a temp pdf file
+        async with aiofiles.open(temp_pdf_path, "wb") as f:
+            await f.write(await uploaded_contract.file.read())
+
+        logger.debug("contract pdf file saved to temporary path successfully")
+
+        # extract the text from the pdf file and store it in a temp md file
+        await asyncio.to_thread(extract.extract, temp_pdf_path, temp_md_path)
+        logger.debug("contract extracted to markdown successfully")
+
+        # Upload the file to Google Cloud Storage
+        await asyncio.to_thread(gcs_connector.upload_file, bucket, temp_pdf_path, pdf_file_uri)
+        await asyncio.to_thread(gcs_connector.upload_file, bucket, temp_md_path, md_file_uri)
+        logger.debug("contract uploaded successfully")
+
+        # Save contract to Firestore
+        await contracts_dal.add_contract(db_client, contract)
+        logger.debug("contract saved to database successfully")
+
+        # index the markdown for agents in retrieval mode; the contract is
+        # saved, and agent.retrieval.ensure_contract_index builds a missing
+        # index on first use, so a failure here does not fail the upload
+        try:
+            chunks = await asyncio.to_thread(chromadb_connector.chunk_document, temp_md_path)
+            await asyncio.to_thread(
+                chromadb_connector.write_to_chroma,
+                chroma_client,
+                chunks,
+                chromadb_connector.contract_collection_name(str(contract.contract_id)),
+            )
+            logger.debug("contract indexed for retrieval successfully")
+        except Exception as exc:
+            logger.warning(f"Indexing contract {contract.contract_id} for retrieval failed", exc_info=exc)
+    finally:
+        await asyncio.to_thread(_remove_temp, temp_pdf_path)
+        await asyncio.to_thread(_remove_temp, temp_md_path)
+        logger.debug("temporary files removed successfully")
 
     return contract
 
 @router.post("/fill")
 @handle_exceptions
 async def fill_contract(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     contract_id: Annotated[str, Body(embed=True)],
 ) -> dict:
 
     logger.debug(f"user session validated for filling contract_id: {contract_id}")
+    usage_utils.bind_usage_context(contract_id=contract_id)
 
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract_unvalidated, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract_unvalidated(db_client, contract_id)
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
 
@@ -125,17 +158,19 @@ async def fill_contract(
     
     md_uri = contract.md_uri
 
-    temp_dir = tempfile.gettempdir()
-    temp_md_path = os.path.join(temp_dir, f"{contract_id}.md")
+    temp_md_path = _temp_path(contract_id, ".md")
     if md_uri is not None:
         md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, md_uri)
 
-    async with aiofiles.open(temp_md_path, "wb") as f:
-        await f.write(md_file)
+    try:
+        async with aiofiles.open(temp_md_path, "wb") as f:
+            await f.write(md_file)
 
-    filled_contract = await asyncio.to_thread(
-        fill.fill_schema, contract_path=temp_md_path, contract_cls=contract_cls
-    )
+        filled_contract = await asyncio.to_thread(
+            fill.fill_schema, contract_path=temp_md_path, contract_cls=contract_cls
+        )
+    finally:
+        _remove_temp(temp_md_path)
     logger.debug("contract filling completed successfully")
     
     filled_contract.contract_id = contract.contract_id
@@ -146,8 +181,8 @@ async def fill_contract(
     filled_contract.user_id = contract.user_id
     
     
-    await asyncio.to_thread(contracts_dal.update_contract, db_client, filled_contract)
-    
+    await contracts_dal.update_contract(db_client, filled_contract)
+    await asyncio.to_thread(answer_cache.invalidate, str(filled_contract.contract_id))
     
     logger.debug("filled contract saved to database successfully")
     return filled_contract.model_dump(mode="json")
@@ -155,7 +190,7 @@ async def fill_contract(
 @router.get("/get_unval/{contract_id}")
 @handle_exceptions
 async def get_contract_unval(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     contract_id: str,
     session: Annotated[session_schemas.Session, Depends(validate_session)],
 ) -> contracts_schemas.Contract:
@@ -172,9 +207,7 @@ async def get_contract_unval(
         HTTPException: If the contract is not found or an error occurs.
     """
     logger.debug(f"user session validated for fetching contract_id: {contract_id}")
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract_unvalidated, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract_unvalidated(db_client, contract_id)
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
     if contract.user_id != session.user_id:
@@ -187,7 +220,7 @@ async def get_contract_unval(
 @router.get("/get/{contract_id}")
 @handle_exceptions
 async def get_contract(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     contract_id: str,
     session: Annotated[session_schemas.Session, Depends(validate_session)],
 ) -> contracts_schemas.AnyContract:
@@ -204,9 +237,7 @@ async def get_contract(
         HTTPException: If the contract is not found or an error occurs.
     """
     logger.debug(f"user session validated for fetching contract_id: {contract_id}")
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract(db_client, contract_id)
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
     if contract.user_id != session.user_id:
@@ -219,7 +250,7 @@ async def get_contract(
 @router.get("/get_all")
 @handle_exceptions
 async def get_all_contracts(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
 ) -> List[contracts_schemas.Contract]:
     """Fetches all contracts for the authenticated user."""
@@ -228,9 +259,7 @@ async def get_all_contracts(
     logger.debug(f"Session ID from cookie: {session.session_id}")
 
     logger.debug(f"user session validated for user_id: {session.user_id}")
-    contracts = await asyncio.to_thread(
-        contracts_dal.get_all_contracts, db_client, session.user_id
-    )
+    contracts = await contracts_dal.get_all_contracts(db_client, session.user_id)
     logger.debug(msg="fetched all contracts")
 
     return contracts
@@ -239,7 +268,7 @@ async def get_all_contracts(
 @router.get("/get_pdf/{contract_id}")
 @handle_exceptions
 async def get_contract_pdf(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
     contract_id: str,
     session: Annotated[session_schemas.Session, Depends(validate_session)],
@@ -247,9 +276,7 @@ async def get_contract_pdf(
 
     logger.debug(f"user session validated for fetching contract_id: {contract_id}")
 
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract(db_client, contract_id)
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
 
@@ -257,8 +284,7 @@ async def get_contract_pdf(
         raise HTTPException(status_code=403, detail="unauthorized request")
     pdf_uri = contract.pdf_uri
 
-    temp_dir = tempfile.gettempdir()
-    temp_pdf_path = os.path.join(temp_dir, f"{contract_id}.pdf")
+    temp_pdf_path = _temp_path(contract_id, ".pdf")
 
     if pdf_uri is not None:
         pdf_file = await asyncio.to_thread(gcs_connector.download_file, bucket, pdf_uri)
@@ -266,22 +292,24 @@ async def get_contract_pdf(
     async with aiofiles.open(temp_pdf_path, "wb") as f:
         await f.write(pdf_file)
 
-    return FileResponse(path=temp_pdf_path, media_type="application/pdf")
+    return FileResponse(
+        path=temp_pdf_path,
+        media_type="application/pdf",
+        background=BackgroundTask(_remove_temp, temp_pdf_path),
+    )
 
 
 @router.get("/get_md/{contract_id}")
 @handle_exceptions
 async def get_contract_md(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
     contract_id: str,
     session: Annotated[session_schemas.Session, Depends(validate_session)],
 ) -> FileResponse:
 
     logger.debug(f"user session validated for fetching contract_id: {contract_id}")
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract(db_client, contract_id)
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
 
@@ -290,8 +318,7 @@ async def get_contract_md(
 
     md_uri = contract.md_uri
 
-    temp_dir = tempfile.gettempdir()
-    temp_md_path = os.path.join(temp_dir, f"{contract_id}.md")
+    temp_md_path = _temp_path(contract_id, ".md")
 
     if md_uri is not None:
         md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, md_uri)
@@ -299,7 +326,11 @@ async def get_contract_md(
     async with aiofiles.open(temp_md_path, "wb") as f:
         await f.write(md_file)
 
-    return FileResponse(path=temp_md_path, media_type="text/markdown")
+    return FileResponse(
+        path=temp_md_path,
+        media_type="text/markdown",
+        background=BackgroundTask(_remove_temp, temp_md_path),
+    )
 
 class ValidateContractDTO(BaseModel):
     contract_id: str
@@ -307,16 +338,15 @@ class ValidateContractDTO(BaseModel):
 @router.post("/validate")
 @handle_exceptions
 async def validate_contract(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     bucket: Annotated[storage.Bucket, Depends(get_bucket)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     request: ValidateContractDTO = Body(...),
 ) -> contracts_schemas.ValidationReport:
 
     logger.debug(f"user session validated for validating contract_id: {request.contract_id}")
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract, db_client, request.contract_id
-    )
+    usage_utils.bind_usage_context(contract_id=request.contract_id)
+    contract = await contracts_dal.get_contract(db_client, request.contract_id)
 
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
@@ -325,39 +355,51 @@ async def validate_contract(
     if contract.user_id != session.user_id:
         raise HTTPException(status_code=403, detail="unauthorized request")
 
-    md_uri = contract.md_uri
-
-    temp_dir = tempfile.gettempdir()
-    temp_md_path = os.path.join(temp_dir, f"{request.contract_id}.md")
-    if md_uri is not None:
-        md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, md_uri)
-
-    logger.log(logging.DEBUG, "markdown of the contract downloaded from storage")
-    async with aiofiles.open(temp_md_path, "wb") as f:
-        await f.write(md_file)
-
-    validation_report = await asyncio.to_thread(
-        validate.validate, contract_path=temp_md_path, contract=contract
+    async def run_validation() -> contracts_schemas.ValidationReport:
+        md_uri = contract.md_uri
+
+        temp_md_path = _temp_path(request.contract_id, ".md")
+        if md_uri is not None:
+            md_file = await asyncio.to_thread(gcs_connector.download_file, bucket, md_uri)
+
+        logger.log(logging.DEBUG, "markdown of the contract downloaded from storage")
+        try:
+            async with aiofiles.open(temp_md_path, "wb") as f:
+                await f.write(md_file)
+
+            validation_report = await asyncio.to_thread(
+                validate.validate, contract_path=temp_md_path, contract=contract
+            )
+        finally:
+            _remove_temp(temp_md_path)
+        logger.debug("Validated the contract")
+
+        await contracts_dal.save_validation_report(db_client, validation_report)
+        await asyncio.to_thread(answer_cache.invalidate, request.contract_id)
+
+        logger.log(logging.DEBUG, "validation report is saved to database")
+        return validation_report
+
+    # a double click or retry joins the validation already running for the
+    # same contract content instead of paying for a second one
+    validation_report = await single_flight.do(
+        "contract.validate",
+        request.contract_id,
+        contract.model_dump(mode="json"),
+        run_validation,
     )
-    logger.debug("Validated the contract")
-    
-    await asyncio.to_thread(contracts_dal.save_validation_report, db_client, validation_report)
-
-    logger.log(logging.DEBUG, "validation report is saved to database")
     return validation_report
 
 @router.get("/validate/{contract_id}")
 @handle_exceptions
 async def get_validation_report(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session: Annotated[session_schemas.Session, Depends(validate_session)],
     contract_id: Annotated[str, Path(description="The ID of the contract to validate")],
 ) -> contracts_schemas.ValidationReport:
 
     logger.debug(f"user session validated for getting validation report of contract_id: {contract_id}")
-    contract = await asyncio.to_thread(
-        contracts_dal.get_contract, db_client, contract_id
-    )
+    contract = await contracts_dal.get_contract(db_client, contract_id)
 
     if contract is None:
         raise HTTPException(status_code=404, detail="Contract not found")
@@ -366,9 +408,7 @@ async def get_validation_report(
     if contract.user_id != session.user_id:
         raise HTTPException(status_code=403, detail="unauthorized request")
 
-    validation_report = await asyncio.to_thread(
-        contracts_dal.get_validation_report, db_client, contract_id
-    )
+    validation_report = await contracts_dal.get_validation_report(db_client, contract_id)
 
     if validation_report is None:
         raise HTTPException(status_code=404, detail="Validation report not found")
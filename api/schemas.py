@@ -1,9 +1,12 @@
+from typing import List
 from pydantic import BaseModel, Field
+from agent.schemas import ContextMode
 
 
 class CreateAgentRequest(BaseModel):
     name: str = Field(..., description="The name of the agent to be created.")
     selected_contract: str = Field(..., description="The selected contract for the agent.")
+    context_mode: ContextMode = Field(default=ContextMode.FULL, description="How the contract is loaded into the agent's context.")
 
 class CallAgentRequest(BaseModel):
     agent_id: str = Field(..., description="The ID of the agent to call.")
@@ -12,4 +15,8 @@ class CallAgentRequest(BaseModel):
 class RenameAgentRequest(BaseModel):
     agent_id: str = Field(..., description="The ID of the agent to rename.")
     new_name: str = Field(..., description="The new name for the agent.")
-    
\ No newline at end of file
+    
+
+class SetAgentContractsRequest(BaseModel):
+    agent_id: str = Field(..., description="The ID of the agent.")
+    contract_ids: List[str] = Field(..., description="The contracts the agent answers every question for.", min_length=1, max_length=20)
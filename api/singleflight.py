@@ -0,0 +1,110 @@
+"""Single-flight coalescing of identical in-flight requests.
+
+Double clicks and client retries start the same expensive LLM work twice.
+Requests are keyed by (operation, target id, input hash); while a call for a
+key is in flight, duplicates wait for the leader's result instead of doing the
+work again. The work runs in its own task, so a leader that disconnects does
+not fail the requests that joined it.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FlightKey = Tuple[str, str, str]
+
+
+def flight_key(operation: str, target_id: str, inputs: Any) -> FlightKey:
+    """Builds the key of a call from its operation, target and JSON serializable inputs."""
+    digest = hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return operation, target_id, digest
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._calls: Dict[FlightKey, asyncio.Task] = {}
+        self.executed: Counter = Counter()
+        self.deduplicated: Counter = Counter()
+
+    async def do(
+        self,
+        operation: str,
+        target_id: str,
+        inputs: Any,
+        fn: Callable[[], Awaitable[T]],
+        hold: Optional[Callable[[T], Awaitable[Any]]] = None,
+    ) -> T:
+        """
+        Runs fn, or joins the call already in flight for the same key.
+
+        Args:
+            inputs: The inputs the result depends on, hashed into the key.
+            fn: Does the work.
+            hold: Called with the result, the key stays claimed until the
+                returned awaitable completes. Used for results that keep
+                producing after they are returned, like a running stream.
+
+        Returns:
+            The result of the leader's call. Exceptions are shared as well.
+        """
+        key = flight_key(operation, target_id, inputs)
+        task = self._calls.get(key)
+        if task is not None:
+            self.deduplicated[operation] += 1
+            logger.debug(f"joining in-flight {operation} for {target_id}")
+            return await asyncio.shield(task)
+
+        self.executed[operation] += 1
+        task = asyncio.create_task(self._lead(key, fn, hold))
+        self._calls[key] = task
+        return await asyncio.shield(task)
+
+    async def _lead(
+        self,
+        key: FlightKey,
+        fn: Callable[[], Awaitable[T]],
+        hold: Optional[Callable[[T], Awaitable[Any]]],
+    ) -> T:
+        task = asyncio.current_task()
+        try:
+            result = await fn()
+        except BaseException:
+            self._release(key, task)
+            raise
+
+        if hold is None:
+            self._release(key, task)
+        else:
+            held = asyncio.ensure_future(hold(result))
+            held.add_done_callback(lambda _: self._release(key, task))
+        return result
+
+    def _release(self, key: FlightKey, task: Optional[asyncio.Task]):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Executions and deduplicated calls per operation."""
+        return {
+            operation: {
+                "executed": self.executed[operation],
+                "deduplicated": self.deduplicated[operation],
+                "in_flight": sum(1 for key in self._calls if key[0] == operation),
+            }
+            for operation in sorted(set(self.executed) | set(self.deduplicated))
+        }
+
+
+single_flight = SingleFlight()
@@ -4,13 +4,16 @@ from typing import Annotated, Optional
 from fastapi import APIRouter, Depends, HTTPException, Response, Cookie
 from pydantic import BaseModel
 from api.utils import (
-    get_firestore,
+    get_async_firestore,
     handle_exceptions,
+    session_cache_call,
     validate_session,
     verify_google_id_token,
 )
-from user import dal as user_dal, schemas as user_schemas
-from sessions import dal as session_dal, schemas as session_schemas, utils as session_utils
+from user import async_dal as user_dal, schemas as user_schemas
+from sessions import async_dal as session_dal, schemas as session_schemas, utils as session_utils
+from sessions.cache import session_cache
+from sessions import tokens as session_tokens
 from datetime import datetime, timedelta, timezone
 from google.cloud import firestore
 
@@ -40,7 +43,7 @@ class SigninOutput(BaseModel):
 async def signin(
     input: SigninInput,
     response: Response,
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session_id: Optional[str] = Cookie(None, alias="session_id"),
 ) -> SigninOutput:
     """
@@ -59,40 +62,85 @@ async def signin(
     """
     logger.debug(f"Starting signin process")
     logger.debug(f"Session ID from cookie: {session_id}")
-    # Check if there's an active session cookie
-    if session_id:
-        session = await asyncio.to_thread(
-            session_dal.get_session, db_client, session_id
-        )
-        if session and datetime.now(timezone.utc) < session.expires_at:
-            if input.csrf_token and input.csrf_token != session.csrf_token:
-                logger.debug(f"CSRF token mismatch")
-                raise HTTPException(status_code=403, detail="CSRF token mismatch")
 
-            user = await asyncio.to_thread(
-                user_dal.get_user, db_client, session.user_id
+    # the token is verified locally against cached certificates, so it is
+    # checked first and its user is read in the same round trip as the session.
+    # With a session cookie any failure, e.g. fetching the certificates, is
+    # only raised when the session turns out not to be valid
+    profile = None
+    token_error = None
+    if input.token:
+        client_id = os.environ["GOOGLE_AUTH_CLIENT_ID"]
+        try:
+            profile = await asyncio.to_thread(verify_google_id_token, input.token, client_id)
+            logger.debug("Validated Token")
+        except Exception as exc:
+            if not session_id:
+                raise
+            logger.debug(f"Token verification failed: {exc}")
+            token_error = exc
+    elif not session_id:
+        raise HTTPException(status_code=400, detail="Token is required")
+
+    # Check if there's an active session cookie
+    session = None
+    read_session_id = None
+    if session_id and session_tokens.signed_sessions_enabled():
+        # a signed token only carries a hash of the CSRF token, so it can only
+        # be resumed by a client that still has the CSRF token
+        if input.csrf_token:
+            try:
+                session = session_tokens.verify_token(session_id, input.csrf_token)
+            except ValueError:
+                logger.debug("Session token rejected")
+    elif session_id:
+        cached, session = await session_cache_call(session_cache.get, session_id)
+        if not cached:
+            read_session_id = session_id
+
+    emails = [profile["email"]] if profile else []
+    if session:
+        emails.append(session.user_id)
+
+    # first round trip: the session and the users, batched
+    stored_session, users = await user_dal.get_signin_documents(
+        db_client, read_session_id, emails
+    )
+    if read_session_id:
+        session = stored_session
+        await session_cache_call(session_cache.put, read_session_id, session)
+        if session and session.user_id not in users:
+            # second round trip, only when the session's user was not known up front
+            _, session_users = await user_dal.get_signin_documents(
+                db_client, None, [session.user_id]
             )
+            users.update(session_users)
 
-            if not user:
-                raise HTTPException(
-                    status_code=404, detail="User not found for the session"
-                )
-            return SigninOutput(username=user.username, email=user.email, csrf_token=session.csrf_token)
+    if session and datetime.now(timezone.utc) < session.expires_at:
+        if input.csrf_token and input.csrf_token != session.csrf_token:
+            logger.debug(f"CSRF token mismatch")
+            raise HTTPException(status_code=403, detail="CSRF token mismatch")
 
-    logger.debug("No valid session found, verifying token")
+        user = users.get(session.user_id)
+        if not user:
+            raise HTTPException(
+                status_code=404, detail="User not found for the session"
+            )
+        return SigninOutput(username=user.username, email=user.email, csrf_token=session.csrf_token)
+
+    logger.debug("No valid session found")
 
-    token = input.token
-    if not token:
+    if token_error is not None:
+        raise token_error
+    if profile is None:
         raise HTTPException(status_code=400, detail="Token is required")
 
-    client_id = os.environ["GOOGLE_AUTH_CLIENT_ID"]
-    profile = verify_google_id_token(token, client_id)  # type: ignore
-    logger.debug("Validated Token")
     username = profile["name"]
     email = profile["email"]
 
     # Check if user is already registered
-    existing_user = await asyncio.to_thread(user_dal.get_user, db_client, email)
+    new_user = None
+    existing_user = users.get(email)
     if existing_user:
         logger.debug("user exists")
         # User exists, create new session
@@ -100,11 +148,10 @@ async def signin(
         email = str(existing_user.email)
     else:
         logger.debug("new user")
-        # New user, register them
-        user = user_schemas.User(username=username, email=email)
-        await asyncio.to_thread(user_dal.add_user, db_client, user)
-        email = str(user.email)
-        username = str(user.username)
+        # New user, register them with the session
+        new_user = user_schemas.User(username=username, email=email)
+        email = str(new_user.email)
+        username = str(new_user.username)
 
     logger.debug(f"Creating session for user_id: {email}")
     session_expiry = datetime.now(timezone.utc) + timedelta(hours=5)  # 5 hour session
@@ -112,15 +159,21 @@ async def signin(
     csrf_token = session_utils.generate_csrf_token()
     new_session = session_schemas.Session(user_id=email, expires_at=session_expiry, csrf_token=csrf_token)
 
-    logger.debug("Saving session to database")
-    session_id = await asyncio.to_thread(
-        session_dal.write_session, db_client, new_session
-    )
+    # second round trip: the session and a new user, created in one batch
+    if session_tokens.signed_sessions_enabled():
+        session_cookie = session_tokens.issue_token(new_session)
+        if new_user is not None:
+            await user_dal.create_signin(db_client, None, new_user)
+    else:
+        logger.debug("Saving session to database")
+        await user_dal.create_signin(db_client, new_session, new_user)
+        session_cookie = str(new_session.session_id)
+        await session_cache_call(session_cache.put, session_cookie, new_session)
 
     logger.debug("Setting session cookie in response")
     response.set_cookie(
         key="session_id",
-        value=str(new_session.session_id),
+        value=session_cookie,
         expires=session_expiry,
         httponly=True,
         secure=True,  # Use HTTPS in production
@@ -138,7 +191,7 @@ class GetUserOutput(BaseModel):
 @handle_exceptions
 async def get_user(
     session: Annotated[session_schemas.Session, Depends(validate_session)],
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
 ) -> GetUserOutput:
     """
     Authenticates a user with an OIDC token.
@@ -156,7 +209,7 @@ async def get_user(
     logger.debug(f"user session validated for fetching user info")
     # session = request.state.session
 
-    user = await asyncio.to_thread(user_dal.get_user, db_client, session.user_id)  # type: ignore
+    user = await user_dal.get_user(db_client, session.user_id)  # type: ignore
     if not user:
         raise HTTPException(
             status_code=401,
@@ -171,7 +224,7 @@ async def get_user(
 @router.post("/logout")
 @handle_exceptions
 async def logout_user(
-    db_client: Annotated[firestore.Client, Depends(get_firestore)],
+    db_client: Annotated[firestore.AsyncClient, Depends(get_async_firestore)],
     session_id: Optional[str] = Cookie(None, alias="session_id"),
 ):
 
@@ -180,9 +233,12 @@ async def logout_user(
     if not session_id:
         raise HTTPException(status_code=401, detail="unauthorized")
     
-    await asyncio.to_thread(
-        session_dal.delete_session, db_client, str(session_id)
-    )
+    if session_tokens.signed_sessions_enabled():
+        await session_tokens.revoke_token_async(db_client, session_id)
+        return
+
+    await session_dal.delete_session(db_client, str(session_id))
+    await session_cache_call(session_cache.invalidate, str(session_id))
 
 
 if __name__ == "__main__":
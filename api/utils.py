@@ -1,13 +1,15 @@
 from typing import Optional
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from fastapi import Cookie, Depends, HTTPException, Request
 from functools import wraps
 from datetime import datetime, timezone
-from sessions import dal as session_dal
+from connectors.google_certs import google_certs
+from sessions import async_dal as session_dal
+from sessions.cache import session_cache
+from sessions import tokens as session_tokens
 from google.cloud import firestore, storage
 from sessions.schemas import Session
 from pydantic import ValidationError
+from usage import utils as usage_utils
 import chromadb
 import asyncio
 import logging
@@ -18,6 +20,9 @@ logger = logging.getLogger(__name__)
 def get_firestore(request: Request) -> firestore.Client:
     return request.app.state.firestore
 
+def get_async_firestore(request: Request) -> firestore.AsyncClient:
+    return request.app.state.firestore_async
+
 def get_bucket(request: Request) -> storage.Bucket:
     return request.app.state.bucket
 
@@ -26,16 +31,9 @@ def get_chromadb(request: Request) -> chromadb.ClientAPI: # type: ignore
 
 
 def verify_google_id_token(token: str, client_id: str):
-    request = requests.Request()
-
-    claims = id_token.verify_oauth2_token(token, request, audience=client_id)
-
-    # issuer check (extra safety)
-    if claims["iss"] not in (
-        "accounts.google.com",
-        "https://accounts.google.com",
-    ):
-        raise ValueError("Wrong issuer")
+    # certificates are cached and fetched through a pooled session, so this
+    # is a local signature check unless Google rotated its keys
+    claims = google_certs.verify_id_token(token, audience=client_id)
 
     profile = {
         "google_sub": claims["sub"],  # stable user ID
@@ -49,6 +47,12 @@ def verify_google_id_token(token: str, client_id: str):
     }
     return profile
 
+async def session_cache_call(fn, *args):
+    """Runs a session_cache method, in a thread when the shared cache tier makes it do network I/O."""
+    if session_cache.tier is None:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
 # get X-CSRF-Token from headers
 def get_csrf_token(request: Request) -> str:
     csrf_token = request.headers.get("X-CSRF-Token")
@@ -56,7 +60,7 @@ def get_csrf_token(request: Request) -> str:
         raise HTTPException(status_code=400, detail="CSRF token is missing")
     return csrf_token
 
-async def validate_session(db_client: firestore.Client = Depends(get_firestore), 
+async def validate_session(db_client: firestore.AsyncClient = Depends(get_async_firestore), 
                            session_id: Optional[str] = Cookie(None, alias="session_id"),
                            csrf_token: Optional[str] = Depends(get_csrf_token)
                            ) -> Session:
@@ -69,6 +73,20 @@ async def validate_session(db_client: firestore.Client = Depends(get_firestore),
     Returns:
         str: The user ID associated with the session
 
+    Raises:
+        HTTPException: If the session is invalid or expired with 401 (Unauthorized) status code
+    """
+    return await check_session(db_client, session_id, csrf_token)
+
+
+async def check_session(db_client: firestore.AsyncClient,
+                        session_id: Optional[str],
+                        csrf_token: Optional[str]
+                        ) -> Session:
+    """
+    Checks that the session exists, has not expired and matches the CSRF token.
+    Shared by validate_session and the WebSocket handshake.
+
     Raises:
         HTTPException: If the session is invalid or expired with 401 (Unauthorized) status code
     """
@@ -76,8 +94,20 @@ async def validate_session(db_client: firestore.Client = Depends(get_firestore),
     if not session_id:
         raise HTTPException(status_code=401, detail="unauthorized")
 
-    # Check if there's an active session cookie
-    session = await asyncio.to_thread(session_dal.get_session, db_client, session_id)
+    # a signed session token is verified locally, without any I/O
+    if session_tokens.signed_sessions_enabled():
+        try:
+            session = session_tokens.verify_token(session_id, csrf_token or "")
+        except ValueError as exc:
+            raise HTTPException(status_code=401, detail=f"unauthorized, {exc}")
+        usage_utils.bind_usage_context(user_id=session.user_id)
+        return session
+
+    # Check if there's an active session cookie, known and unknown ids are cached
+    cached, session = await session_cache_call(session_cache.get, session_id)
+    if not cached:
+        session = await session_dal.get_session(db_client, session_id)
+        await session_cache_call(session_cache.put, session_id, session)
 
     logger.debug(f"Validating session: {session_id}")
 
@@ -90,6 +120,8 @@ async def validate_session(db_client: firestore.Client = Depends(get_firestore),
     if session.csrf_token != csrf_token:
         raise HTTPException(status_code=401, detail="unauthorized, csrf token mismatch")
 
+    usage_utils.bind_usage_context(user_id=session.user_id)
+
     return session
 
 
@@ -0,0 +1,284 @@
+"""Local disk cache of GCS blobs.
+
+fill, validate, get_md, get_pdf, the validate_contract tool and the agent
+context all download the markdown or PDF of a contract through
+gcs_connector.download_file, again on every call. Blobs are cached on local
+disk in an LRU bounded by BLOB_CACHE_MAX_BYTES.
+
+Entries are keyed by object name plus generation, so an overwritten object
+is a new entry and is never served stale. A read first gets the object's
+metadata, its generation and CRC32C, in one small request and serves the
+local copy of that generation. The metadata of a name is trusted for
+BLOB_CACHE_METADATA_TTL seconds, so repeat reads of a hot contract make no
+request at all. A local copy whose CRC32C does not match the metadata is
+dropped and downloaded again.
+
+Files are written to a temporary file in the cache directory and renamed
+into place, so a concurrent reader, also in another process sharing the
+directory, never sees a partial file. Concurrent misses for the same blob
+in this process download it once. The size bound is kept per process.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import google_crc32c
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+
+from usage import io_ledger
+
+logger = logging.getLogger(__name__)
+
+BLOB_CACHE_ENABLED = os.environ.get("BLOB_CACHE_ENABLED", "true").lower() == "true"
+BLOB_CACHE_DIR = os.environ.get(
+    "BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cip-blob-cache")
+)
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+BLOB_CACHE_METADATA_TTL_SECONDS = float(os.environ.get("BLOB_CACHE_METADATA_TTL", 30))
+
+TEMP_SUFFIX = ".tmp"
+
+
+def crc32c(data: bytes) -> str:
+    """The CRC32C of the data in the base64 format of GCS object metadata."""
+    return base64.b64encode(struct.pack(">I", google_crc32c.value(data))).decode("ascii")
+
+
+@dataclass
+class BlobMetadata:
+    generation: int
+    crc32c: Optional[str]
+    checked_at: float
+
+
+class BlobCache:
+    """LRU of blob files on disk, keyed by (object name, generation)."""
+
+    def __init__(
+        self,
+        directory: str = BLOB_CACHE_DIR,
+        max_bytes: int = BLOB_CACHE_MAX_BYTES,
+        metadata_ttl_seconds: float = BLOB_CACHE_METADATA_TTL_SECONDS,
+        enabled: bool = BLOB_CACHE_ENABLED,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.metadata_ttl_seconds = metadata_ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corrupted = 0
+        self.size_bytes = 0
+        # file name -> size
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._metadata: Dict[str, BlobMetadata] = {}
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    @staticmethod
+    def _file_name(name: str, generation: int) -> str:
+        return f"{hashlib.sha256(name.encode('utf-8')).hexdigest()}-{generation}"
+
+    def _scan(self):
+        # caller holds self._lock; picks up the files of a previous run, oldest first
+        if self._scanned:
+            return
+        self._scanned = True
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(TEMP_SUFFIX):
+                # left behind by a process that died while writing
+                self._unlink(entry.name)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, file_name, size in sorted(entries):
+            self._files[file_name] = size
+            self.size_bytes += size
+        self._evict()
+
+    def _unlink(self, file_name: str):
+        try:
+            os.remove(os.path.join(self.directory, file_name))
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, file_name: str):
+        # caller holds self._lock
+        size = self._files.pop(file_name, None)
+        if size is not None:
+            self.size_bytes -= size
+        self._unlink(file_name)
+
+    def _evict(self):
+        # caller holds self._lock
+        while self.size_bytes > self.max_bytes and self._files:
+            oldest = next(iter(self._files))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _get_metadata(self, bucket: storage.Bucket, name: str) -> Tuple[storage.Blob, BlobMetadata]:
+        with self._lock:
+            metadata = self._metadata.get(name)
+        if metadata is not None and time.monotonic() - metadata.checked_at < self.metadata_ttl_seconds:
+            return bucket.blob(name, generation=metadata.generation), metadata
+
+        blob = bucket.get_blob(name)
+        io_ledger.record_gcs()
+        if blob is None:
+            raise NotFound(f"Blob {name} not found in bucket {bucket.name}")
+        metadata = BlobMetadata(blob.generation, blob.crc32c, time.monotonic())
+        with self._lock:
+            self._metadata[name] = metadata
+        return blob, metadata
+
+    def _read_local(self, file_name: str, metadata: BlobMetadata) -> Optional[bytes]:
+        with self._lock:
+            if file_name not in self._files:
+                return None
+            self._files.move_to_end(file_name)
+        try:
+            with open(os.path.join(self.directory, file_name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # evicted by another process sharing the directory
+            with self._lock:
+                self._remove(file_name)
+            return None
+        if metadata.crc32c is not None and crc32c(data) != metadata.crc32c:
+            logger.warning(f"Dropping corrupted cached blob {file_name}")
+            with self._lock:
+                self.corrupted += 1
+                self._remove(file_name)
+            return None
+        return data
+
+    def _write_local(self, file_name: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=TEMP_SUFFIX)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                # the rename is atomic, readers see the whole file or none
+                os.replace(temp_path, os.path.join(self.directory, file_name))
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+        except OSError as exc:
+            # e.g. a full disk; the blob is served without being cached
+            logger.warning(f"Caching blob {file_name} failed", exc_info=exc)
+            return
+        with self._lock:
+            if file_name in self._files:
+                self.size_bytes -= self._files[file_name]
+            self._files[file_name] = len(data)
+            self.size_bytes += len(data)
+            self._evict()
+
+    def download(self, bucket: storage.Bucket, name: str) -> bytes:
+        """
+        Returns the content of the blob, from disk when the current generation
+        is cached.
+
+        Raises:
+            google.api_core.exceptions.NotFound: If the blob does not exist.
+        """
+        try:
+            return self._download(bucket, name)
+        except (NotFound, PreconditionFailed):
+            # overwritten or deleted since its metadata was read
+            self.invalidate(name)
+            return self._download(bucket, name)
+
+    def _download(self, bucket: storage.Bucket, name: str) -> bytes:
+        with self._lock:
+            self._scan()
+
+        blob, metadata = self._get_metadata(bucket, name)
+        file_name = self._file_name(name, metadata.generation)
+        data = self._read_local(file_name, metadata)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        with self._lock:
+            key_lock = self._loading.setdefault(file_name, threading.Lock())
+
+        # one download per blob, concurrent misses wait for it
+        with key_lock:
+            data = self._read_local(file_name, metadata)
+            if data is not None:
+                with self._lock:
+                    self.hits += 1
+                return data
+
+            with self._lock:
+                self.misses += 1
+            try:
+                # the generation match fails the download if the object was
+                # overwritten since its metadata was read, and the client
+                # checks the downloaded bytes against the object's CRC32C
+                data = blob.download_as_bytes(
+                    if_generation_match=metadata.generation, checksum="crc32c"
+                )
+                io_ledger.record_gcs(len(data))
+                self._write_local(file_name, data)
+            finally:
+                with self._lock:
+                    self._loading.pop(file_name, None)
+            return data
+
+    def put(self, name: str, generation: int, crc32c_value: Optional[str], data: bytes):
+        """Caches a blob just uploaded, so the first read is local too."""
+        with self._lock:
+            self._scan()
+            self._metadata[name] = BlobMetadata(generation, crc32c_value, time.monotonic())
+        self._write_local(self._file_name(name, generation), data)
+
+    def invalidate(self, name: str):
+        """Forgets the metadata of a name, so the next read checks its generation."""
+        with self._lock:
+            self._metadata.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._scan()
+            for file_name in list(self._files):
+                self._remove(file_name)
+            self._metadata.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "corrupted": self.corrupted,
+                "entries": len(self._files),
+                "size_bytes": self.size_bytes,
+            }
+
+
+blob_cache = BlobCache()
@@ -0,0 +1,309 @@
+"""Firestore listener driven coherence of the in-process caches.
+
+session_cache and contract_cache are per instance and rely on TTLs, so a
+write made by another instance is served stale until the entry expires.
+With CACHE_COHERENCE_ENABLED=true every key that enters a cache is watched
+with a Firestore snapshot listener, and a change to the document drops the
+cached entry right away. The TTLs can then be raised to
+CACHE_COHERENCE_TTL.
+
+Listeners are scoped to the hot keys, the ones that missed the cache on this
+instance. New keys are batched into document id ``in`` queries of up to 30
+ids. A listener is never rebuilt to add a key, because its initial snapshot
+reads every document again. When there are more than
+CACHE_COHERENCE_MAX_LISTENERS listeners, the oldest is closed and its keys
+are dropped from the caches, since they are no longer kept coherent.
+
+A key is cached before its listener starts. The initial snapshot of a
+listener therefore drops the keys whose documents were updated after the
+cache miss.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.cloud.firestore import Client
+from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from contracts import dal as contracts_dal
+from contracts.cache import contract_cache
+from sessions.cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_COHERENCE_ENABLED = os.environ.get("CACHE_COHERENCE_ENABLED", "false").lower() == "true"
+CACHE_COHERENCE_TTL_SECONDS = float(os.environ.get("CACHE_COHERENCE_TTL", 3600))
+CACHE_COHERENCE_FLUSH_SECONDS = float(os.environ.get("CACHE_COHERENCE_FLUSH_INTERVAL", 1))
+# Firestore recommends at most 100 snapshot listeners per client
+CACHE_COHERENCE_MAX_LISTENERS = int(os.environ.get("CACHE_COHERENCE_MAX_LISTENERS", 90))
+
+# document id "in" queries take at most 30 values
+KEYS_PER_LISTENER = 30
+
+# (collection, document ids, callback) -> unsubscribe
+Subscriber = Callable[[str, List[str], Callable[..., None]], Callable[[], None]]
+
+
+def firestore_subscriber(db: Client) -> Subscriber:
+    """Subscribes with Firestore snapshot listeners on document id ``in`` queries."""
+
+    def subscribe(collection: str, doc_ids: List[str], callback: Callable[..., None]) -> Callable[[], None]:
+        collection_ref = db.collection(collection)
+        refs = [collection_ref.document(doc_id) for doc_id in doc_ids]
+        query = collection_ref.where(filter=FieldFilter(FieldPath.document_id(), "in", refs))
+        return query.on_snapshot(callback).unsubscribe
+
+    return subscribe
+
+
+def _invalidate_session(session_id: str):
+    session_cache.invalidate(session_id)
+
+
+def _invalidate_contract(contract_id: str):
+    contract_cache.invalidate(contract_id, contracts_dal.CONTRACT, contracts_dal.CONTRACT_UNVALIDATED)
+
+
+def _invalidate_validation_report(contract_id: str):
+    contract_cache.invalidate(contract_id, contracts_dal.VALIDATION_REPORT)
+
+
+INVALIDATORS: Dict[str, Callable[[str], None]] = {
+    "sessions": _invalidate_session,
+    "contracts": _invalidate_contract,
+    "validation_reports": _invalidate_validation_report,
+}
+
+CONTRACT_CACHE_COLLECTIONS = {
+    contracts_dal.CONTRACT: "contracts",
+    contracts_dal.CONTRACT_UNVALIDATED: "contracts",
+    contracts_dal.VALIDATION_REPORT: "validation_reports",
+}
+
+
+@dataclass
+class Listener:
+    """One snapshot listener over up to 30 keys of a collection."""
+    collection: str
+    # document id -> when it missed the cache
+    keys: Dict[str, datetime]
+    unsubscribe: Optional[Callable[[], None]] = None
+    initial: bool = True
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class CacheCoherence:
+    """Watches the hot keys of session_cache and contract_cache."""
+
+    def __init__(
+        self,
+        subscribe: Subscriber,
+        max_listeners: int = CACHE_COHERENCE_MAX_LISTENERS,
+    ):
+        self.subscribe = subscribe
+        self.max_listeners = max_listeners
+        self.invalidations = 0
+        self.closed_listeners = 0
+        self._pending: Dict[str, Dict[str, datetime]] = {}
+        self._watched: Dict[Tuple[str, str], Listener] = {}
+        self._listeners: "OrderedDict[int, Listener]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def watch(self, collection: str, doc_id: str):
+        """Registers a key entering a cache; it is subscribed on the next flush."""
+        with self._lock:
+            if (collection, doc_id) in self._watched:
+                return
+            self._pending.setdefault(collection, {}).setdefault(doc_id, datetime.now(timezone.utc))
+
+    def flush(self):
+        """Subscribes the pending keys, closing the oldest listeners beyond the limit."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for collection, keys in pending.items():
+            doc_ids = list(keys)
+            for start in range(0, len(doc_ids), KEYS_PER_LISTENER):
+                chunk = {doc_id: keys[doc_id] for doc_id in doc_ids[start:start + KEYS_PER_LISTENER]}
+                listener = Listener(collection=collection, keys=chunk)
+                with self._lock:
+                    for doc_id in chunk:
+                        self._watched[(collection, doc_id)] = listener
+                    self._listeners[id(listener)] = listener
+                listener.unsubscribe = self.subscribe(
+                    collection, list(chunk), self._callback(listener)
+                )
+
+        while True:
+            with self._lock:
+                if len(self._listeners) <= self.max_listeners:
+                    break
+                _, oldest = self._listeners.popitem(last=False)
+                for doc_id in oldest.keys:
+                    self._watched.pop((oldest.collection, doc_id), None)
+            self._close(oldest)
+
+    def _close(self, listener: Listener):
+        if listener.unsubscribe is not None:
+            listener.unsubscribe()
+        self.closed_listeners += 1
+        # the keys are no longer coherent, so they are not kept for the long TTL
+        invalidate = INVALIDATORS[listener.collection]
+        for doc_id in listener.keys:
+            invalidate(doc_id)
+
+    def _callback(self, listener: Listener) -> Callable[..., None]:
+        invalidate = INVALIDATORS[listener.collection]
+
+        def on_snapshot(docs: List[Any], changes: List[Any], read_time: Any):
+            with listener.lock:
+                initial, listener.initial = listener.initial, False
+            for change in changes:
+                doc_id = change.document.id
+                if initial:
+                    # the initial snapshot lists the current documents; only the
+                    # ones written after the cache miss may be cached stale
+                    missed_at = listener.keys.get(doc_id)
+                    update_time = change.document.update_time
+                    if missed_at is not None and update_time is not None and update_time < missed_at:
+                        continue
+                invalidate(doc_id)
+                self.invalidations += 1
+                logger.debug(f"{listener.collection}/{doc_id} changed, cache entry dropped")
+
+        return on_snapshot
+
+    def start(self, ttl_seconds: float = CACHE_COHERENCE_TTL_SECONDS):
+        """Hooks into the keys entering the caches and raises the cache TTLs."""
+        session_cache.on_key = lambda session_id: self.watch("sessions", session_id)
+        contract_cache.on_key = lambda kind, contract_id: self.watch(
+            CONTRACT_CACHE_COLLECTIONS[kind], contract_id
+        )
+        session_cache.ttl_seconds = ttl_seconds
+        contract_cache.ttl_seconds = ttl_seconds
+
+    def close(self):
+        session_cache.on_key = None
+        contract_cache.on_key = None
+        with self._lock:
+            listeners = list(self._listeners.values())
+            self._listeners.clear()
+            self._watched.clear()
+            self._pending.clear()
+        for listener in listeners:
+            self._close(listener)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "listeners": len(self._listeners),
+                "watched_keys": len(self._watched),
+                "pending_keys": sum(len(keys) for keys in self._pending.values()),
+                "invalidations": self.invalidations,
+                "closed_listeners": self.closed_listeners,
+            }
+
+    async def run(self, interval: float = CACHE_COHERENCE_FLUSH_SECONDS):
+        """Subscribes pending keys on an interval until cancelled, then closes the listeners."""
+        self.start()
+        try:
+            while True:
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as exc:
+                    logger.warning("Subscribing cache listeners failed", exc_info=exc)
+                await asyncio.sleep(interval)
+        finally:
+            await asyncio.to_thread(self.close)
+
+
+class FakeSubscriber:
+    """
+    Local stand-in for Firestore listeners: records the subscriptions and
+    delivers changes emitted by hand.
+    """
+
+    @dataclass
+    class Document:
+        id: str
+        update_time: Optional[datetime]
+
+    @dataclass
+    class Change:
+        document: "FakeSubscriber.Document"
+        type: str = "MODIFIED"
+
+    def __init__(self):
+        self.subscriptions: Dict[int, Tuple[str, List[str], Callable[..., None]]] = {}
+        self._next = 0
+
+    def __call__(self, collection: str, doc_ids: List[str], callback: Callable[..., None]) -> Callable[[], None]:
+        key = self._next
+        self._next += 1
+        self.subscriptions[key] = (collection, doc_ids, callback)
+        return lambda: self.subscriptions.pop(key, None)
+
+    def emit(self, collection: str, doc_id: str, change_type: str = "MODIFIED", update_time: Optional[datetime] = None):
+        """Delivers a change to every listener watching the document."""
+        change = self.Change(self.Document(doc_id, update_time or datetime.now(timezone.utc)), change_type)
+        for watched_collection, doc_ids, callback in list(self.subscriptions.values()):
+            if watched_collection == collection and doc_id in doc_ids:
+                callback([], [change], change.document.update_time)
+
+    def initial_snapshot(self, update_times: Dict[str, datetime]):
+        """Delivers the initial snapshot of every listener."""
+        for collection, doc_ids, callback in list(self.subscriptions.values()):
+            changes = [
+                self.Change(self.Document(doc_id, update_times.get(doc_id)), "ADDED")
+                for doc_id in doc_ids
+            ]
+            callback([], changes, datetime.now(timezone.utc))
+
+
+cache_coherence: Optional[CacheCoherence] = None
+
+
+def start_cache_coherence(db: Client) -> CacheCoherence:
+    global cache_coherence
+    cache_coherence = CacheCoherence(firestore_subscriber(db))
+    return cache_coherence
+
+
+if __name__ == "__main__":
+    # Walk through the coherence protocol against the fake listener
+    from datetime import timedelta
+
+    from sessions.schemas import Session
+
+    fake = FakeSubscriber()
+    coherence = CacheCoherence(fake, max_listeners=2)
+    coherence.start()
+
+    session = Session(
+        user_id="user@example.com",
+        csrf_token="csrf",
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+    )
+    session_id = str(session.session_id)
+    print("cached:", session_cache.get(session_id)[0])
+    session_cache.put(session_id, session)
+    coherence.flush()
+    print("listeners:", coherence.stats()["listeners"])
+
+    # unchanged since the miss: the initial snapshot keeps the entry
+    fake.initial_snapshot({session_id: datetime.now(timezone.utc) - timedelta(minutes=1)})
+    print("cached after initial snapshot:", session_cache.get(session_id)[0])
+
+    # deleted by a logout on another instance
+    fake.emit("sessions", session_id, "REMOVED")
+    print("cached after remote logout:", session_cache.get(session_id)[0])
+    print(coherence.stats())
+    coherence.close()
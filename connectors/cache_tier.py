@@ -0,0 +1,296 @@
+"""Shared second-level cache between instances.
+
+session_cache, contract_cache and answer_cache are in-process (L1). With
+several instances each one warms its own copy and hit rates drop with every
+instance added. With CACHE_BACKEND=redis the caches read through a shared L2
+on any Redis protocol server (Redis, Valkey, Memorystore):
+
+- an L1 miss reads L2 before Firestore, and a load is written to both
+- multi-key reads go to L2 in one pipelined round trip
+- an invalidation deletes the L2 key and is published to every instance,
+  which drops its L1 entry
+
+Invalidations reach other instances within the pub/sub latency instead of
+the L1 TTL. A load racing with a write on another instance can still put a
+stale value into L2, which is bounded by CACHE_L2_TTL. L2 errors are logged
+and counted, and the caches fall back to Firestore, so an unavailable Redis
+only costs hit rate.
+
+By default (CACHE_BACKEND=local) there is no L2. CACHE_BACKEND=memory puts
+an in-process LocalBackend behind the same read path, for local runs of
+the tiered code without a server.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_L2_TTL_SECONDS = float(os.environ.get("CACHE_L2_TTL", 300))
+CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "cip")
+LOCAL_BACKEND_MAX_ENTRIES = 10000
+
+INVALIDATION_CHANNEL = "invalidations"
+
+
+class CacheBackend(ABC):
+    """Byte values by key, with TTLs and an invalidation channel."""
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Reads the keys, returning the ones found."""
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, bytes], ttl_seconds: float):
+        """Writes the values, each expiring after ttl_seconds."""
+
+    @abstractmethod
+    def delete_many(self, keys: List[str]):
+        """Deletes the keys."""
+
+    @abstractmethod
+    def publish(self, channel: str, message: str):
+        """Sends the message to the subscribers of the channel on every instance."""
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """Calls callback with every message published on the channel."""
+
+    def close(self):
+        pass
+
+
+class LocalBackend(CacheBackend):
+    """In-process backend, for a single instance and local runs."""
+
+    def __init__(self, max_entries: int = LOCAL_BACKEND_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl_seconds: float):
+        expires_at = time.monotonic() + ttl_seconds
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def publish(self, channel: str, message: str):
+        for callback in list(self._subscribers.get(channel, [])):
+            callback(message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+
+class RedisBackend(CacheBackend):
+    """Backend on a Redis protocol server; multi-key reads and writes are pipelined."""
+
+    def __init__(self, client):
+        self.client = client
+        self._pubsub = None
+        self._pubsub_thread = None
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        values = self.client.mget(keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: Dict[str, bytes], ttl_seconds: float):
+        if not items:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(key, value, px=int(ttl_seconds * 1000))
+        pipeline.execute()
+
+    def delete_many(self, keys: List[str]):
+        if keys:
+            self.client.delete(*keys)
+
+    def publish(self, channel: str, message: str):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+
+        def handler(message):
+            data = message["data"]
+            callback(data.decode("utf-8") if isinstance(data, bytes) else data)
+
+        self._pubsub.subscribe(**{channel: handler})
+        if self._pubsub_thread is None:
+            self._pubsub_thread = self._pubsub.run_in_thread(
+                sleep_time=1.0, daemon=True, exception_handler=self._on_pubsub_error
+            )
+
+    @staticmethod
+    def _on_pubsub_error(exc, pubsub, thread):
+        # the next read reconnects and resubscribes; invalidations published
+        # meanwhile are missed and those L1 entries expire by TTL
+        logger.warning("Cache invalidation subscription failed", exc_info=exc)
+        time.sleep(1.0)
+
+    def close(self):
+        if self._pubsub_thread is not None:
+            self._pubsub_thread.stop()
+            self._pubsub_thread.join(timeout=5)
+            self._pubsub_thread = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+        self.client.close()
+
+
+class CacheTier:
+    """
+    The L2 of the in-process caches. Keys are namespaced per cache, and
+    invalidations are delivered to the callbacks registered for the namespace
+    on every other instance.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: float = CACHE_L2_TTL_SECONDS, prefix: str = CACHE_KEY_PREFIX):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.instance_id = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.remote_invalidations = 0
+        self._invalidators: Dict[str, List[Callable[[str], None]]] = {}
+        self._channel = f"{prefix}:{INVALIDATION_CHANNEL}"
+        self.backend.subscribe(self._channel, self._on_message)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Reads several keys in one round trip, returning the ones found."""
+        keys = list(keys)
+        try:
+            found = self.backend.get_many([self._key(namespace, key) for key in keys])
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Reading the shared cache failed", exc_info=exc)
+            return {}
+        values = {key: found[self._key(namespace, key)] for key in keys if self._key(namespace, key) in found}
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return values
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return self.get_many(namespace, [key]).get(key)
+
+    def set_many(self, namespace: str, items: Dict[str, bytes], ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        try:
+            self.backend.set_many({self._key(namespace, key): value for key, value in items.items()}, ttl)
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Writing the shared cache failed", exc_info=exc)
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_seconds: Optional[float] = None):
+        self.set_many(namespace, {key: value}, ttl_seconds)
+
+    def invalidate(self, namespace: str, keys: Iterable[str], stored: bool = True):
+        """
+        Deletes the keys from L2, unless they are not stored there, and tells
+        the other instances to drop them from L1.
+        """
+        keys = list(keys)
+        try:
+            if stored:
+                self.backend.delete_many([self._key(namespace, key) for key in keys])
+            self.backend.publish(
+                self._channel,
+                json.dumps({"origin": self.instance_id, "namespace": namespace, "keys": keys}),
+            )
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Invalidating the shared cache failed", exc_info=exc)
+
+    def on_invalidate(self, namespace: str, callback: Callable[[str], None]):
+        """Registers the L1 invalidation of a cache for keys invalidated by other instances."""
+        self._invalidators.setdefault(namespace, []).append(callback)
+
+    def _on_message(self, message: str):
+        try:
+            invalidation = json.loads(message)
+        except ValueError:
+            logger.warning(f"Ignoring malformed cache invalidation: {message!r}")
+            return
+        if invalidation.get("origin") == self.instance_id:
+            return
+        for callback in self._invalidators.get(invalidation.get("namespace"), []):
+            for key in invalidation.get("keys", []):
+                callback(key)
+                self.remote_invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "l2_hits": self.hits,
+            "l2_misses": self.misses,
+            "l2_errors": self.errors,
+            "remote_invalidations": self.remote_invalidations,
+        }
+
+    def close(self):
+        self.backend.close()
+
+
+def create_cache_tier(backend: str = CACHE_BACKEND) -> Optional[CacheTier]:
+    """The configured L2, or None when the caches are L1 only."""
+    if backend == "redis":
+        from connectors import redis_connector
+
+        client = redis_connector.get_redis_connection()
+        try:
+            return CacheTier(RedisBackend(client))
+        except Exception as exc:
+            # without the invalidation subscription the L2 could serve stale
+            # entries, so this instance runs with L1 only
+            logger.warning("Shared cache unavailable, using in-process caches only", exc_info=exc)
+            client.close()
+            return None
+    if backend == "memory":
+        return CacheTier(LocalBackend())
+    if backend == "local":
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
@@ -1,8 +1,10 @@
 """Methods for interacting with chromadb vector database"""
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
+from typing import Optional
 
 import os
+import tempfile
 import chromadb
 import uuid
 import logging
@@ -17,6 +19,26 @@ def get_chroma_client():
     )
     return client
 
+def get_persistent_chroma_client(persist_dir: Optional[str] = None):
+    """
+    Returns an embedded chromadb client persisting to the local disk.
+
+    Args:
+        persist_dir (Optional[str]): Directory for the index, defaults to CHROMA_PERSIST_DIR
+            or a folder in the temp directory.
+    """
+    if persist_dir is None:
+        persist_dir = os.environ.get(
+            "CHROMA_PERSIST_DIR", os.path.join(tempfile.gettempdir(), "cip-chroma")
+        )
+    return chromadb.PersistentClient(path=persist_dir)
+
+
+def contract_collection_name(contract_id: str) -> str:
+    """Name of the collection holding the chunks of a contract."""
+    return f"contract-{contract_id}"
+
+
 # function for chunking a given document using semantic chunking
 def chunk_document(
     document_path: str, chunk_size: int = 1000, chunk_overlap: int = 200
@@ -67,6 +89,49 @@ def write_to_chroma(
     logger.debug(f"Successfully added {len(chunks)} chunks to collection '{collection_name}'.")
 
 
+def chunk_text(
+    text: str, chunk_size: int = 1000, chunk_overlap: int = 200
+) -> list[str]:
+    """Splits the given text into chunks using RecursiveCharacterTextSplitter."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    return text_splitter.split_text(text)
+
+
+def has_documents(client: chromadb.ClientAPI, collection_name: str) -> bool: # type: ignore
+    """Checks whether a collection exists and holds at least one chunk."""
+    try:
+        collection = client.get_collection(name=collection_name)
+    except Exception:
+        return False
+    return collection.count() > 0
+
+
+def query_chunks(
+    client: chromadb.ClientAPI, # type: ignore
+    collection_name: str, query: str, n_results: int = 4
+) -> list[str]:
+    """
+    Returns the chunks of a collection most relevant to the query.
+
+    Args:
+        collection_name (str): The name of the ChromaDB collection.
+        query (str): The text to search for.
+        n_results (int): The number of chunks to return.
+
+    Returns:
+        list[str]: The matching chunks, most relevant first.
+    """
+    collection = client.get_collection(name=collection_name)
+    results = collection.query(query_texts=[query], n_results=n_results)
+    documents = results.get("documents") or [[]]
+    return documents[0]
+
+
 def query_chroma(client: chromadb.ClientAPI, collection_name: str): # type: ignore
     collection = client.get_collection(name=collection_name)
     results = collection.query(
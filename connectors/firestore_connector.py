@@ -8,3 +8,11 @@ def get_firestore_connection():
                           database=os.environ['GOOGLE_CLOUD_FIRESTORE_DATABASE'])
     
     return db
+
+
+# function to generate an async firestore connection, bound to the event loop it is first used on
+def get_async_firestore_connection():
+    db = firestore.AsyncClient(project=os.environ['GOOGLE_CLOUD_PROJECT'],
+                               database=os.environ['GOOGLE_CLOUD_FIRESTORE_DATABASE'])
+
+    return db
@@ -3,6 +3,8 @@
 from google.cloud import storage
 from typing import List
 from dotenv import load_dotenv
+from usage import io_ledger
+from connectors.blob_cache import blob_cache
 import os
 import logging
 
@@ -34,6 +36,11 @@ def upload_file(bucket: storage.Bucket, file_path: str, destination_blob_name: s
     
     blob = bucket.blob(destination_blob_name)
     blob.upload_from_filename(file_path)
+    io_ledger.record_gcs(os.path.getsize(file_path))
+    if blob_cache.enabled:
+        # the first read after an upload, e.g. fill after upload, is local
+        with open(file_path, "rb") as f:
+            blob_cache.put(destination_blob_name, blob.generation, blob.crc32c, f.read())
     logger.log(
         level=logging.DEBUG,
         msg=f"File {file_path} uploaded to {destination_blob_name}.",
@@ -42,7 +49,7 @@ def upload_file(bucket: storage.Bucket, file_path: str, destination_blob_name: s
 
 # implement a function to download a file from the storage bucket
 def download_file(bucket: storage.Bucket, source_blob_name: str) -> bytes:
-    """Downloads a file from the Google Cloud Storage bucket and stores it in destination_file_name.
+    """Downloads a file from the Google Cloud Storage bucket, through the local blob_cache.
 
     Args:
         source_blob_name (str): The name of the blob to download.
@@ -56,8 +63,12 @@ def download_file(bucket: storage.Bucket, source_blob_name: str) -> bytes:
 
     """
 
+    if blob_cache.enabled:
+        return blob_cache.download(bucket, source_blob_name)
+
     blob = bucket.blob(source_blob_name)
     blob_bytes = blob.download_as_bytes()
+    io_ledger.record_gcs(len(blob_bytes))
     return blob_bytes
 
 
@@ -65,6 +76,7 @@ def list_files(bucket: storage.Bucket) -> List[str]:
     """Lists all files in the Google Cloud Storage bucket."""
     blobs = bucket.list_blobs()
     blob_names = list(map(lambda blob: blob.name, blobs))
+    io_ledger.record_gcs()
 
     return blob_names
     
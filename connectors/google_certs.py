@@ -0,0 +1,118 @@
+"""Cached verification of Google ID tokens.
+
+``id_token.verify_oauth2_token`` fetches Google's signing certificates on
+every call, and a new transport per sign-in means a new connection each
+time. The certificates are cached here for the max-age of their
+Cache-Control header, fetched through one pooled HTTP session, and refreshed
+in the background before they expire. A sign-in only does the local
+signature check. A token signed with a key that is not cached yet, right
+after a key rotation, triggers one refetch.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+
+from typing import Any, Dict, Mapping, Optional
+
+import requests as http_requests
+
+from google.auth import jwt
+from google.auth.transport import requests
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+# used when the response has no max-age
+DEFAULT_CERTS_MAX_AGE_SECONDS = 3600
+# certificates are refreshed this long before they expire
+CERTS_REFRESH_MARGIN_SECONDS = 300
+# a refetch for an unknown key id is not repeated within this time
+UNKNOWN_KEY_REFETCH_SECONDS = 30
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCertCache:
+    """Google's ID token signing certificates, cached by their max-age."""
+
+    def __init__(self, certs_url: str = GOOGLE_CERTS_URL):
+        self.certs_url = certs_url
+        self.fetches = 0
+        self._request = requests.Request(session=http_requests.Session())
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Mapping[str, str]:
+        """Fetches the certificates, whether or not the cached ones expired."""
+        response = self._request(self.certs_url, method="GET")
+        if response.status != 200:
+            raise ValueError(f"Could not fetch Google certificates: HTTP {response.status}")
+
+        match = _MAX_AGE.search(response.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE_SECONDS
+
+        certs = json.loads(response.data.decode("utf-8"))
+        now = time.monotonic()
+        with self._lock:
+            self._certs = certs
+            self._expires_at = now + max_age
+            self._last_fetch = now
+            self.fetches += 1
+        logger.debug(f"fetched Google certificates, max-age {max_age}s")
+        return certs
+
+    def get_certs(self) -> Mapping[str, str]:
+        with self._lock:
+            if self._certs and time.monotonic() < self._expires_at:
+                return self._certs
+        return self.refresh()
+
+    def seconds_until_refresh(self) -> float:
+        with self._lock:
+            return self._expires_at - CERTS_REFRESH_MARGIN_SECONDS - time.monotonic()
+
+    def verify_id_token(self, token: str, audience: str) -> Mapping[str, Any]:
+        """
+        Verifies the signature, audience, expiry and issuer of a Google ID token.
+
+        Raises:
+            ValueError: If the token is invalid.
+        """
+        certs = self.get_certs()
+
+        key_id: Optional[str] = jwt.decode_header(token).get("kid")
+        if key_id not in certs:
+            with self._lock:
+                recently_fetched = time.monotonic() - self._last_fetch < UNKNOWN_KEY_REFETCH_SECONDS
+            if not recently_fetched:
+                certs = self.refresh()
+
+        claims = jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=10)
+
+        # issuer check (extra safety)
+        if claims["iss"] not in GOOGLE_ISSUERS:
+            raise ValueError("Wrong issuer")
+        return claims
+
+    async def run_refresher(self):
+        """Refreshes the certificates before they expire, until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as exc:
+                logger.warning("Refreshing Google certificates failed", exc_info=exc)
+                await asyncio.sleep(60)
+                continue
+            await asyncio.sleep(max(self.seconds_until_refresh(), 60))
+
+
+google_certs = GoogleCertCache()
@@ -0,0 +1,15 @@
+import redis
+
+import os
+
+
+# function to generate a redis connection
+def get_redis_connection() -> redis.Redis:
+    client = redis.Redis.from_url(
+        os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+        socket_timeout=float(os.environ.get("REDIS_SOCKET_TIMEOUT", 0.5)),
+        socket_connect_timeout=float(os.environ.get("REDIS_CONNECT_TIMEOUT", 1)),
+        health_check_interval=30,
+    )
+
+    return client
@@ -0,0 +1,162 @@
+"""Data Access Layer methods for contracts on the async Firestore client.
+
+Mirrors contracts.dal for handlers running on the event loop. Reads go
+through contract_cache like the sync DAL, and writes invalidate it.
+"""
+
+from typing import Dict, List, Optional, Union
+from google.api_core.exceptions import AlreadyExists, NotFound
+from contracts.schemas import (
+    Contract,
+    ContractType,
+    EmploymentContract,
+    NDAContract,
+    SupplierContract,
+    ValidationReport,
+)
+from google.cloud.firestore import AsyncClient
+from contracts.cache import contract_cache
+from usage import io_ledger
+from contracts.dal import (
+    CONTRACT,
+    CONTRACT_UNVALIDATED,
+    VALIDATION_REPORT,
+    _contract_from_dict,
+    _decode_contract,
+)
+
+
+async def add_contract(db: AsyncClient, contract: Contract) -> str:
+    """
+    add contract to contracts collection, created with the exists=False
+    precondition so an existing contract is never overwritten
+    """
+    doc_ref = db.collection("contracts").document(str(contract.contract_id))
+
+    try:
+        await doc_ref.create(contract.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
+        raise ValueError(f"Contract with ID {contract.contract_id} already exists.")
+    await contract_cache.invalidate_async(doc_ref.id, CONTRACT, CONTRACT_UNVALIDATED)
+    return doc_ref.id
+
+
+async def get_contract_unvalidated(db: AsyncClient, contract_id: str) -> Optional[Contract]:
+    """Fetch a contract by its ID and return as Contract without validation, through contract_cache."""
+    return await contract_cache.get_or_load_async(
+        CONTRACT_UNVALIDATED,
+        contract_id,
+        lambda: _read_contract_unvalidated(db, contract_id),
+        Contract.model_validate_json,
+    )
+
+async def get_contracts_unvalidated(db: AsyncClient, contract_ids: List[str]) -> Dict[str, Contract]:
+    """
+    Fetch several contracts without validation, through contract_cache. The
+    cache misses are read from Firestore in one batched round trip.
+
+    Returns:
+        Dict[str, Contract]: The found contracts by ID
+    """
+    return await contract_cache.get_many_or_load_async(
+        CONTRACT_UNVALIDATED,
+        contract_ids,
+        lambda missing: _read_contracts_unvalidated(db, missing),
+        Contract.model_validate_json,
+    )
+
+async def _read_contracts_unvalidated(db: AsyncClient, contract_ids: List[str]) -> Dict[str, Contract]:
+    refs = [db.collection("contracts").document(contract_id) for contract_id in contract_ids]
+    io_ledger.record_firestore_reads("contracts", *contract_ids)
+    return {
+        doc.id: Contract(**doc.to_dict())  # type: ignore
+        async for doc in db.get_all(refs)
+        if doc.exists
+    }
+
+async def _read_contract_unvalidated(db: AsyncClient, contract_id: str) -> Optional[Contract]:
+    doc = await db.collection("contracts").document(contract_id).get()
+    io_ledger.record_firestore_reads("contracts", contract_id)
+    if not doc.exists: # type: ignore
+        return None
+    return Contract(**doc.to_dict()) # type: ignore
+
+async def get_contract(db: AsyncClient, contract_id: str) -> Optional[Union[EmploymentContract, NDAContract, SupplierContract]]:
+    """Fetch a contract by its ID and return the appropriate Contract subclass, through contract_cache."""
+    return await contract_cache.get_or_load_async(
+        CONTRACT, contract_id, lambda: _read_contract(db, contract_id), _decode_contract
+    )
+
+async def _read_contract(db: AsyncClient, contract_id: str) -> Optional[Union[EmploymentContract, NDAContract, SupplierContract]]:
+    doc = await db.collection("contracts").document(contract_id).get()
+    io_ledger.record_firestore_reads("contracts", contract_id)
+    if not doc.exists: # type: ignore
+        return None
+    return _contract_from_dict(doc.to_dict())  # type: ignore
+
+
+async def fetch_contracts_by_type(db: AsyncClient, contract_type: ContractType) -> list[Contract]:
+    query = db.collection("contracts").where("contract_type", "==", contract_type.value)
+    contracts = [Contract(**doc.to_dict()) async for doc in query.stream()]  # type: ignore
+    io_ledger.record_firestore_reads("contracts", count=len(contracts))
+    return contracts
+
+
+async def get_all_contracts(db: AsyncClient, user_id) -> list[Contract]:
+    query = db.collection("contracts").where("user_id", "==", user_id)
+    contracts = [Contract(**doc.to_dict()) async for doc in query.stream()]  # type: ignore
+    io_ledger.record_firestore_reads("contracts", count=len(contracts))
+    return contracts
+
+async def update_contract(db: AsyncClient, contract: Contract):
+    """
+    Update a contract in the contracts collection in Firestore.
+    The document is deleted with the exists=True precondition and set again
+    in one batch, so a missing contract is detected in the same round trip.
+
+    Args:
+        db: Async Firestore client instance
+        contract: Contract object to update
+    Throws:
+        ValueError: If the contract does not exist
+    Returns:
+        None
+    """
+    doc_ref = db.collection("contracts").document(str(contract.contract_id))
+    try:
+        # the document is replaced, so the fields of a previous contract class
+        # do not survive; the delete carries the precondition
+        batch = db.batch()
+        batch.delete(doc_ref, option=db.write_option(exists=True))
+        batch.set(doc_ref, contract.model_dump(mode="json"))
+        await batch.commit()
+        io_ledger.record_firestore_writes(2)
+    except NotFound:
+        raise ValueError(f"Contract with ID {contract.contract_id} does not exist.")
+    finally:
+        await contract_cache.invalidate_async(doc_ref.id, CONTRACT, CONTRACT_UNVALIDATED)
+
+async def save_validation_report(db: AsyncClient, validation_report: ValidationReport) -> ValidationReport:
+    doc_ref = db.collection("validation_reports").document(str(validation_report.contract_id))
+    try:
+        await doc_ref.set(validation_report.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    finally:
+        await contract_cache.invalidate_async(doc_ref.id, VALIDATION_REPORT)
+    return validation_report
+
+async def get_validation_report(db: AsyncClient, contract_id: str) -> ValidationReport | None:
+    return await contract_cache.get_or_load_async(
+        VALIDATION_REPORT,
+        contract_id,
+        lambda: _read_validation_report(db, contract_id),
+        ValidationReport.model_validate_json,
+    )
+
+async def _read_validation_report(db: AsyncClient, contract_id: str) -> ValidationReport | None:
+    doc = await db.collection("validation_reports").document(contract_id).get()
+    io_ledger.record_firestore_reads("validation_reports", contract_id)
+    if not doc.exists: # type: ignore
+        return None
+    return ValidationReport(**doc.to_dict())  # type: ignore
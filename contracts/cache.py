@@ -0,0 +1,427 @@
+"""Read-through cache of contract documents and validation reports.
+
+The same contract is read from Firestore by most contract endpoints and by
+every agent tool call. Contracts and validation reports are cached in an LRU
+bounded by the serialized size of its entries, with a TTL. Concurrent misses
+for the same key load it once, and the other callers wait for that load. The
+DAL invalidates an entry synchronously when it writes the document. A load
+that races with an invalidation is not cached. Other instances see a write
+within the TTL, or right away through the shared tier, see
+connectors.cache_tier.
+
+The *_async methods serve the async DAL: loads are awaited and shared tier
+calls run in a thread. Concurrent async misses are coalesced with each
+other, but not with sync misses of the same key.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+from connectors.cache_tier import CacheTier
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_CACHE_ENABLED = os.environ.get("CONTRACT_CACHE_ENABLED", "true").lower() == "true"
+CONTRACT_CACHE_TTL_SECONDS = float(os.environ.get("CONTRACT_CACHE_TTL", 300))
+CONTRACT_CACHE_MAX_BYTES = int(os.environ.get("CONTRACT_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# namespace of contract_cache in the shared tier, keyed by "<kind>/<contract_id>"
+TIER_NAMESPACE = "contracts"
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def _tier_key(kind: str, contract_id: str) -> str:
+    return f"{kind}/{contract_id}"
+
+
+def _tier_items(kind: str, values: Dict[str, BaseModel]) -> Dict[str, bytes]:
+    """The shared tier entries of models by contract id."""
+    return {
+        _tier_key(kind, contract_id): value.model_dump_json().encode("utf-8")
+        for contract_id, value in values.items()
+    }
+
+
+class ContractCache:
+    """Byte bounded TTL/LRU cache of pydantic models, keyed by (kind, contract_id)."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = CONTRACT_CACHE_TTL_SECONDS,
+        max_bytes: int = CONTRACT_CACHE_MAX_BYTES,
+        enabled: bool = CONTRACT_CACHE_ENABLED,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, BaseModel]]" = OrderedDict()
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self._loading_async: Dict[Hashable, asyncio.Lock] = {}
+        # invalidations of a contract, counted while loads of it are outstanding
+        self._generations: Dict[str, int] = {}
+        self._loads: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # called with (kind, contract_id) of every miss, see connectors.cache_coherence
+        self.on_key: Optional[Callable[[str, str], None]] = None
+        self.tier: Optional[CacheTier] = None
+
+    def _lookup(self, key: Hashable) -> Optional[BaseModel]:
+        # caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def _remove(self, key: Hashable):
+        # caller holds self._lock
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def _store(self, key: Hashable, value: BaseModel):
+        # caller holds self._lock
+        size = len(value.model_dump_json())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self.evictions += 1
+
+    def use_tier(self, tier: CacheTier):
+        """Reads through the shared tier on a miss and takes invalidations from other instances."""
+        self.tier = tier
+        tier.on_invalidate(TIER_NAMESPACE, self._drop_remote)
+
+    def _drop_remote(self, tier_key: str):
+        kind, _, contract_id = tier_key.partition("/")
+        with self._lock:
+            self._invalidate_loads(contract_id)
+            if kind == "*":
+                keys = [key for key in self._entries if key[1] == contract_id]
+            else:
+                keys = [(kind, contract_id)] if (kind, contract_id) in self._entries else []
+            for key in keys:
+                self._remove(key)
+
+    def _cached_copy(self, key: Hashable) -> Optional[BaseModel]:
+        # caller holds self._lock
+        value = self._lookup(key)
+        if value is None:
+            return None
+        self.hits += 1
+        return value.model_copy(deep=True)
+
+    def _start_load(self, contract_id: str) -> int:
+        # caller holds self._lock; the generation is compared when the load ends
+        self.misses += 1
+        self._loads[contract_id] = self._loads.get(contract_id, 0) + 1
+        return self._generations.get(contract_id, 0)
+
+    def _is_fresh(self, contract_id: str, generation: int) -> bool:
+        # caller holds self._lock; an invalidation during the load means the read may be stale
+        return self._generations.get(contract_id, 0) == generation
+
+    def _release_load(self, contract_id: str):
+        # caller holds self._lock; the generation of a contract is dropped with
+        # its last outstanding load, so only contracts being loaded have one
+        remaining = self._loads[contract_id] - 1
+        if remaining:
+            self._loads[contract_id] = remaining
+        else:
+            del self._loads[contract_id]
+            self._generations.pop(contract_id, None)
+
+    def _invalidate_loads(self, contract_id: str):
+        # caller holds self._lock; without outstanding loads there is nothing to mark stale
+        if contract_id in self._loads:
+            self._generations[contract_id] = self._generations.get(contract_id, 0) + 1
+
+    def _notify_misses(self, kind: str, contract_ids: List[str]):
+        if self.on_key is not None:
+            for contract_id in contract_ids:
+                self.on_key(kind, contract_id)
+
+    def _decode_shared(
+        self, kind: str, contract_id: str, raw: Optional[bytes], decode: Callable[[bytes], T]
+    ) -> Optional[T]:
+        if raw is None:
+            return None
+        try:
+            return decode(raw)
+        except ValueError:
+            # e.g. written by an instance with another schema; read from Firestore instead
+            logger.warning(f"Dropping undecodable shared cache entry {kind}/{contract_id}")
+            return None
+
+    def _end_load(self, key: Hashable, generation: int, loaded: Optional[BaseModel], loading: Dict) -> bool:
+        """Caches a loaded model unless its contract was invalidated during the load, returning whether it was."""
+        with self._lock:
+            fresh = loaded is not None and self._is_fresh(key[1], generation)
+            if fresh:
+                self._store(key, loaded.model_copy(deep=True))  # type: ignore
+            self._release_load(key[1])
+            loading.pop(key, None)
+        return fresh
+
+    def _start_load_many(
+        self, kind: str, contract_ids: List[str]
+    ) -> Tuple[Dict[str, BaseModel], List[str], Dict[str, int]]:
+        """The cached copies, the missing contract ids and the generations their load starts at."""
+        found: Dict[str, BaseModel] = {}
+        missing: List[str] = []
+        with self._lock:
+            for contract_id in dict.fromkeys(contract_ids):
+                value = self._cached_copy((kind, contract_id))
+                if value is not None:
+                    found[contract_id] = value
+                else:
+                    missing.append(contract_id)
+            generations = {contract_id: self._start_load(contract_id) for contract_id in missing}
+        self._notify_misses(kind, missing)
+        return found, missing, generations
+
+    def _decode_shared_many(
+        self, kind: str, contract_ids: List[str], raws: Dict[str, bytes], decode: Callable[[bytes], T]
+    ) -> Dict[str, T]:
+        shared: Dict[str, T] = {}
+        for contract_id in contract_ids:
+            value = self._decode_shared(kind, contract_id, raws.get(_tier_key(kind, contract_id)), decode)
+            if value is not None:
+                shared[contract_id] = value
+        return shared
+
+    def _end_load_many(
+        self, kind: str, generations: Dict[str, int], shared: Dict[str, T], loaded: Dict[str, T]
+    ) -> Dict[str, T]:
+        """Caches the models of contracts not invalidated during the load, returning the loaded ones for the tier."""
+        fresh: Dict[str, T] = {}
+        with self._lock:
+            for contract_id, value in {**shared, **loaded}.items():
+                if self._is_fresh(contract_id, generations[contract_id]):
+                    self._store((kind, contract_id), value.model_copy(deep=True))
+                    if contract_id in loaded:
+                        fresh[contract_id] = value
+            for contract_id in generations:
+                self._release_load(contract_id)
+        return fresh
+
+    def get_or_load(
+        self,
+        kind: str,
+        contract_id: str,
+        load: Callable[[], Optional[T]],
+        decode: Optional[Callable[[bytes], T]] = None,
+    ) -> Optional[T]:
+        """
+        Returns a copy of the cached model, or loads, caches and returns it.
+        A missing document (None) is not cached. With a shared tier and a
+        decode function for its JSON, the tier is read before load.
+        """
+        if not self.enabled:
+            return load()
+
+        key = (kind, contract_id)
+        with self._lock:
+            value = self._cached_copy(key)
+            if value is not None:
+                return value  # type: ignore
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # one load per key, concurrent misses wait for it
+        with key_lock:
+            with self._lock:
+                value = self._cached_copy(key)
+                if value is not None:
+                    return value  # type: ignore
+                generation = self._start_load(contract_id)
+            self._notify_misses(kind, [contract_id])
+
+            loaded = None
+            shared = False
+            try:
+                if self.tier is not None and decode is not None:
+                    raw = self.tier.get(TIER_NAMESPACE, _tier_key(kind, contract_id))
+                    loaded = self._decode_shared(kind, contract_id, raw, decode)
+                    shared = loaded is not None
+                if loaded is None:
+                    loaded = load()
+            finally:
+                fresh = self._end_load(key, generation, loaded, self._loading)
+
+            if self.tier is not None and fresh and not shared:
+                self.tier.set_many(TIER_NAMESPACE, _tier_items(kind, {contract_id: loaded}))  # type: ignore
+            return loaded
+
+    def get_many_or_load(
+        self,
+        kind: str,
+        contract_ids: List[str],
+        load_many: Callable[[List[str]], Dict[str, T]],
+        decode: Optional[Callable[[bytes], T]] = None,
+    ) -> Dict[str, T]:
+        """
+        Returns the found models by contract id. L1 misses are read from the
+        shared tier in one pipelined round trip, and the rest with one
+        load_many call. Unlike get_or_load, concurrent misses are not coalesced.
+        """
+        if not self.enabled:
+            return load_many(contract_ids)
+
+        found, missing, generations = self._start_load_many(kind, contract_ids)
+        if not missing:
+            return found  # type: ignore
+
+        shared: Dict[str, T] = {}
+        loaded: Dict[str, T] = {}
+        try:
+            if self.tier is not None and decode is not None:
+                raws = self.tier.get_many(TIER_NAMESPACE, [_tier_key(kind, contract_id) for contract_id in missing])
+                shared = self._decode_shared_many(kind, missing, raws, decode)
+
+            remaining = [contract_id for contract_id in missing if contract_id not in shared]
+            loaded = load_many(remaining) if remaining else {}
+        finally:
+            fresh = self._end_load_many(kind, generations, shared, loaded)
+        if self.tier is not None and fresh:
+            self.tier.set_many(TIER_NAMESPACE, _tier_items(kind, fresh))
+        return {**found, **shared, **loaded}  # type: ignore
+
+    async def get_or_load_async(
+        self,
+        kind: str,
+        contract_id: str,
+        load: Callable[[], Awaitable[Optional[T]]],
+        decode: Optional[Callable[[bytes], T]] = None,
+    ) -> Optional[T]:
+        """get_or_load for an awaitable load, waiting for concurrent misses without blocking the loop."""
+        if not self.enabled:
+            return await load()
+
+        key = (kind, contract_id)
+        with self._lock:
+            value = self._cached_copy(key)
+            if value is not None:
+                return value  # type: ignore
+            key_lock = self._loading_async.setdefault(key, asyncio.Lock())
+
+        async with key_lock:
+            with self._lock:
+                value = self._cached_copy(key)
+                if value is not None:
+                    return value  # type: ignore
+                generation = self._start_load(contract_id)
+            self._notify_misses(kind, [contract_id])
+
+            loaded = None
+            shared = False
+            try:
+                if self.tier is not None and decode is not None:
+                    raw = await asyncio.to_thread(self.tier.get, TIER_NAMESPACE, _tier_key(kind, contract_id))
+                    loaded = self._decode_shared(kind, contract_id, raw, decode)
+                    shared = loaded is not None
+                if loaded is None:
+                    loaded = await load()
+            finally:
+                fresh = self._end_load(key, generation, loaded, self._loading_async)
+
+            if self.tier is not None and fresh and not shared:
+                await asyncio.to_thread(
+                    self.tier.set_many, TIER_NAMESPACE, _tier_items(kind, {contract_id: loaded})  # type: ignore
+                )
+            return loaded
+
+    async def get_many_or_load_async(
+        self,
+        kind: str,
+        contract_ids: List[str],
+        load_many: Callable[[List[str]], Awaitable[Dict[str, T]]],
+        decode: Optional[Callable[[bytes], T]] = None,
+    ) -> Dict[str, T]:
+        """get_many_or_load for an awaitable load_many."""
+        if not self.enabled:
+            return await load_many(contract_ids)
+
+        found, missing, generations = self._start_load_many(kind, contract_ids)
+        if not missing:
+            return found  # type: ignore
+
+        shared: Dict[str, T] = {}
+        loaded: Dict[str, T] = {}
+        try:
+            if self.tier is not None and decode is not None:
+                raws = await asyncio.to_thread(
+                    self.tier.get_many, TIER_NAMESPACE, [_tier_key(kind, contract_id) for contract_id in missing]
+                )
+                shared = self._decode_shared_many(kind, missing, raws, decode)
+
+            remaining = [contract_id for contract_id in missing if contract_id not in shared]
+            loaded = await load_many(remaining) if remaining else {}
+        finally:
+            fresh = self._end_load_many(kind, generations, shared, loaded)
+        if self.tier is not None and fresh:
+            await asyncio.to_thread(self.tier.set_many, TIER_NAMESPACE, _tier_items(kind, fresh))
+        return {**found, **shared, **loaded}  # type: ignore
+
+    def invalidate(self, contract_id: str, *kinds: str):
+        """Drops the given kinds of entries of a contract, all of them by default."""
+        with self._lock:
+            self._invalidate_loads(contract_id)
+            if kinds:
+                keys = [(kind, contract_id) for kind in kinds if (kind, contract_id) in self._entries]
+            else:
+                keys = [key for key in self._entries if key[1] == contract_id]
+            for key in keys:
+                self._remove(key)
+
+        if self.tier is not None:
+            if kinds:
+                self.tier.invalidate(TIER_NAMESPACE, [_tier_key(kind, contract_id) for kind in kinds])
+            else:
+                # the kinds cached by other instances are not known, their L2 entries expire by TTL
+                self.tier.invalidate(TIER_NAMESPACE, [f"*/{contract_id}"], stored=False)
+
+    async def invalidate_async(self, contract_id: str, *kinds: str):
+        """invalidate, publishing to the shared tier in a thread."""
+        if self.tier is None:
+            self.invalidate(contract_id, *kinds)
+        else:
+            await asyncio.to_thread(self.invalidate, contract_id, *kinds)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+            }
+
+
+contract_cache = ContractCache()
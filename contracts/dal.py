@@ -1,7 +1,9 @@
 """Data Access Layer methods for contracts"""
 
-from typing import Optional, Union
-from google.cloud import firestore
+import json
+
+from typing import Dict, List, Optional, Union
+from google.api_core.exceptions import AlreadyExists, NotFound
 from contracts.schemas import (
     Contract,
     ContractType,
@@ -11,47 +13,99 @@ from contracts.schemas import (
     ValidationReport,
 )
 from google.cloud.firestore import Client
+from contracts.cache import contract_cache
+from usage import io_ledger
+
+# kinds of contract_cache entries
+CONTRACT = "contract"
+CONTRACT_UNVALIDATED = "contract_unvalidated"
+VALIDATION_REPORT = "validation_report"
 
 
 # function to add contract to contracts collection
 def add_contract(db: Client, contract: Contract) -> str:
     """
-    add contract to contracts collection
+    add contract to contracts collection, created with the exists=False
+    precondition so an existing contract is never overwritten
     """
     doc_ref = db.collection("contracts").document(str(contract.contract_id))
 
-    if doc_ref.get().exists: # type: ignore
+    try:
+        doc_ref.create(contract.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
         raise ValueError(f"Contract with ID {contract.contract_id} already exists.")
-  
-    doc_ref.set(contract.model_dump(mode="json"))    
+    contract_cache.invalidate(doc_ref.id, CONTRACT, CONTRACT_UNVALIDATED)
     return doc_ref.id
 
 
 def get_contract_unvalidated(db: Client, contract_id: str) -> Optional[Contract]:
-    """Fetch a contract by its ID and return as Contract without validation."""
+    """Fetch a contract by its ID and return as Contract without validation, through contract_cache."""
+    return contract_cache.get_or_load(
+        CONTRACT_UNVALIDATED,
+        contract_id,
+        lambda: _read_contract_unvalidated(db, contract_id),
+        Contract.model_validate_json,
+    )
+
+def get_contracts_unvalidated(db: Client, contract_ids: List[str]) -> Dict[str, Contract]:
+    """
+    Fetch several contracts without validation, through contract_cache. The
+    cache misses are read from Firestore in one batched round trip.
 
+    Returns:
+        Dict[str, Contract]: The found contracts by ID
+    """
+    return contract_cache.get_many_or_load(
+        CONTRACT_UNVALIDATED,
+        contract_ids,
+        lambda missing: _read_contracts_unvalidated(db, missing),
+        Contract.model_validate_json,
+    )
+
+def _read_contracts_unvalidated(db: Client, contract_ids: List[str]) -> Dict[str, Contract]:
+    refs = [db.collection("contracts").document(contract_id) for contract_id in contract_ids]
+    io_ledger.record_firestore_reads("contracts", *contract_ids)
+    return {
+        doc.id: Contract(**doc.to_dict())  # type: ignore
+        for doc in db.get_all(refs)
+        if doc.exists
+    }
+
+def _read_contract_unvalidated(db: Client, contract_id: str) -> Optional[Contract]:
     doc_ref = db.collection("contracts").document(contract_id)
     doc = doc_ref.get()  # db request
+    io_ledger.record_firestore_reads("contracts", contract_id)
     if not doc.exists: # type: ignore
         return None
     return Contract(**doc.to_dict()) # type: ignore
 
 def get_contract(db: Client, contract_id: str) -> Optional[Union[EmploymentContract, NDAContract, SupplierContract]]:
-    """Fetch a contract by its ID and return the appropriate Contract subclass."""
+    """Fetch a contract by its ID and return the appropriate Contract subclass, through contract_cache."""
+    return contract_cache.get_or_load(
+        CONTRACT, contract_id, lambda: _read_contract(db, contract_id), _decode_contract
+    )
 
+def _read_contract(db: Client, contract_id: str) -> Optional[Union[EmploymentContract, NDAContract, SupplierContract]]:
     doc_ref = db.collection("contracts").document(contract_id)
     doc = doc_ref.get() # db request
+    io_ledger.record_firestore_reads("contracts", contract_id)
     if not doc.exists: # type: ignore
         return None
-    
-    contract = Contract(**doc.to_dict()) # type: ignore
+    return _contract_from_dict(doc.to_dict())  # type: ignore
+
+def _decode_contract(raw: bytes) -> Union[EmploymentContract, NDAContract, SupplierContract]:
+    return _contract_from_dict(json.loads(raw))
+
+def _contract_from_dict(data: dict) -> Union[EmploymentContract, NDAContract, SupplierContract]:
+    contract = Contract(**data)
 
     if contract.contract_type == ContractType.NDA_CONTRACT:
-        return NDAContract(**doc.to_dict())  # type: ignore
+        return NDAContract(**data)
     elif contract.contract_type == ContractType.SUPPLIER_CONTRACT:
-        return SupplierContract(**doc.to_dict())  # type: ignore
+        return SupplierContract(**data)
     elif contract.contract_type == ContractType.EMPLOYMENT_CONTRACT:
-        return EmploymentContract(**doc.to_dict())  # type: ignore
+        return EmploymentContract(**data)
     
     raise ValueError("Invalid contract type")
 
@@ -59,20 +113,24 @@ def get_contract(db: Client, contract_id: str) -> Optional[Union[EmploymentContr
 def fetch_contracts_by_type(db: Client, contract_type: ContractType) -> list[Contract]:
     contracts_ref = db.collection("contracts")
     query = contracts_ref.where("contract_type", "==", contract_type.value)
-    docs = query.stream()
-    return [Contract(**doc.to_dict()) for doc in docs]
+    contracts = [Contract(**doc.to_dict()) for doc in query.stream()]
+    io_ledger.record_firestore_reads("contracts", count=len(contracts))
+    return contracts
 
 
 def get_all_contracts(db: Client, user_id) -> list[Contract]:
     contracts_ref = db.collection("contracts").where("user_id", "==", user_id)
-    docs = contracts_ref.stream()
-    
-    return [Contract(**(doc.to_dict())) for doc in docs]
+    contracts = [Contract(**(doc.to_dict())) for doc in contracts_ref.stream()]
+    io_ledger.record_firestore_reads("contracts", count=len(contracts))
+    return contracts
 
 def update_contract(db: Client, contract: Contract):
     """
     Update a contract in the contracts collection in Firestore.
     If error is not thrown, the contract is updated successfully.
+    The document is deleted with the exists=True precondition and set again
+    in one batch, so a missing contract is detected in the same round trip
+    instead of a transaction.
 
     Args:
         db: Firestore client instance
@@ -82,30 +140,41 @@ def update_contract(db: Client, contract: Contract):
     Returns:
         None
     """
-
-    @firestore.transactional
-    def transaction_update_contract(transaction, doc_ref, contract):
-        snapshot = doc_ref.get(transaction=transaction)
-        if not snapshot.exists:
-            return False
-        transaction.set(doc_ref, contract.model_dump(mode="json"))
-        return True
-        
     doc_ref = db.collection("contracts").document(str(contract.contract_id))
-    txn = db.transaction()
-    is_updated = transaction_update_contract(txn, doc_ref, contract)
-
-    if not is_updated:
+    try:
+        # the document is replaced, so the fields of a previous contract class
+        # do not survive; the delete carries the precondition
+        batch = db.batch()
+        batch.delete(doc_ref, option=db.write_option(exists=True))
+        batch.set(doc_ref, contract.model_dump(mode="json"))
+        batch.commit()
+        io_ledger.record_firestore_writes(2)
+    except NotFound:
         raise ValueError(f"Contract with ID {contract.contract_id} does not exist.")
+    finally:
+        contract_cache.invalidate(doc_ref.id, CONTRACT, CONTRACT_UNVALIDATED)
 
 def save_validation_report(db: Client, validation_report: ValidationReport) -> ValidationReport:
     doc_ref = db.collection("validation_reports").document(str(validation_report.contract_id))
-    doc_ref.set(validation_report.model_dump(mode="json"))
+    try:
+        doc_ref.set(validation_report.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    finally:
+        contract_cache.invalidate(doc_ref.id, VALIDATION_REPORT)
     return validation_report
 
 def get_validation_report(db: Client, contract_id: str) -> ValidationReport | None:
+    return contract_cache.get_or_load(
+        VALIDATION_REPORT,
+        contract_id,
+        lambda: _read_validation_report(db, contract_id),
+        ValidationReport.model_validate_json,
+    )
+
+def _read_validation_report(db: Client, contract_id: str) -> ValidationReport | None:
     doc_ref = db.collection("validation_reports").document(contract_id)
     doc = doc_ref.get()
+    io_ledger.record_firestore_reads("validation_reports", contract_id)
     
     if not doc.exists: # type: ignore
         return None
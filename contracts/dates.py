@@ -0,0 +1,158 @@
+"""Deterministic date facts of a filled contract.
+
+Answers "how many days until renewal?" or "when is the next payment due?"
+from the contract fields, so the agent gets exact dates from one tool call
+instead of reasoning about calendars in the model.
+"""
+
+import calendar
+
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from contracts.schemas import PaymentFrequency, RenewalType
+
+# months between two payments of a recurring payment frequency
+PAYMENT_INTERVAL_MONTHS = {
+    PaymentFrequency.MONTHLY: 1,
+    PaymentFrequency.QUARTERLY: 3,
+    PaymentFrequency.ANNUALLY: 12,
+}
+
+
+def add_months(day: date, months: int) -> date:
+    """Adds calendar months, clamping to the last day of shorter months."""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def months_between(start: date, end: date) -> int:
+    """Whole calendar months from start to end."""
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if add_months(start, months) > end:
+        months -= 1
+    return months
+
+
+def next_on_schedule(start: date, interval_months: int, as_of: date) -> date:
+    """First date on or after as_of in the schedule start + k * interval_months."""
+    if interval_months <= 0:
+        raise ValueError("The schedule interval must be at least one month.")
+    if as_of <= start:
+        return start
+    periods = months_between(start, as_of) // interval_months
+    candidate = add_months(start, periods * interval_months)
+    while candidate < as_of:
+        periods += 1
+        candidate = add_months(start, periods * interval_months)
+    return candidate
+
+
+def contract_date_facts(
+    contract: Any,
+    as_of: date,
+    invoice_date: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    Computes the date facts of a filled contract relative to as_of.
+
+    The end of the term is the expiration_date, or effective_date plus
+    contract_term months when no expiration date was filled. Day counts are
+    negative for dates in the past. The next renewal is unknown, None, once
+    the term has ended if the term is shorter than a month.
+
+    Args:
+        contract: A filled contract with effective_date, expiration_date,
+            contract_term and renewal_type, and optionally payment_term.
+        as_of: The date the facts are computed for, usually today.
+        invoice_date: If given, the payment due date of an invoice issued on
+            this date is computed from payment_term.due_period.
+
+    Returns:
+        A dictionary of the date facts, with dates in ISO format.
+
+    Raises:
+        ValueError: If the term ends before the effective date.
+    """
+    effective_date: Optional[date] = getattr(contract, "effective_date", None)
+    expiration_date: Optional[date] = getattr(contract, "expiration_date", None)
+    contract_term: Optional[int] = getattr(contract, "contract_term", None)
+    renewal_type: RenewalType = getattr(contract, "renewal_type", None) or RenewalType.NON_RENEWABLE
+
+    facts: Dict[str, Any] = {
+        "as_of": as_of.isoformat(),
+        "effective_date": effective_date.isoformat() if effective_date else None,
+        "renewal_type": renewal_type.value,
+    }
+
+    end_date = expiration_date
+    facts["end_date_source"] = "expiration_date" if expiration_date else None
+    if end_date is None and effective_date and contract_term:
+        end_date = add_months(effective_date, contract_term)
+        facts["end_date_source"] = "effective_date + contract_term"
+
+    if effective_date and end_date and end_date < effective_date:
+        raise ValueError(
+            f"The term of the contract ends on {end_date.isoformat()}, "
+            f"before its effective date {effective_date.isoformat()}."
+        )
+
+    if contract_term is None and effective_date and end_date:
+        contract_term = months_between(effective_date, end_date)
+
+    facts["end_date"] = end_date.isoformat() if end_date else None
+    facts["contract_term_months"] = contract_term
+
+    if effective_date:
+        facts["days_since_effective"] = (as_of - effective_date).days
+    if end_date:
+        facts["days_until_end"] = (end_date - as_of).days
+
+    if effective_date and as_of < effective_date:
+        facts["status"] = "NOT_STARTED"
+    elif end_date is None:
+        facts["status"] = "ACTIVE_NO_END_DATE"
+    elif as_of <= end_date:
+        facts["status"] = "ACTIVE"
+    elif renewal_type == RenewalType.AUTOMATIC:
+        facts["status"] = "RENEWED"
+    else:
+        facts["status"] = "EXPIRED"
+
+    # automatic renewals roll the term forward, manual renewals have to be
+    # agreed before the term ends, non renewable contracts just end
+    if renewal_type == RenewalType.AUTOMATIC and end_date:
+        renewal_date: Optional[date] = end_date
+        if as_of > end_date:
+            # a term under a month has no renewal schedule to roll forward on
+            renewal_date = None
+            if contract_term is not None and contract_term > 0:
+                renewal_date = next_on_schedule(end_date, contract_term, as_of)
+        facts["next_renewal_date"] = renewal_date.isoformat() if renewal_date else None
+        facts["days_until_renewal"] = (renewal_date - as_of).days if renewal_date else None
+    elif renewal_type == RenewalType.MANUAL and end_date:
+        facts["renewal_decision_by"] = end_date.isoformat()
+        facts["days_until_renewal_decision"] = (end_date - as_of).days
+
+    payment_term = getattr(contract, "payment_term", None)
+    if payment_term is not None:
+        due_period = timedelta(days=payment_term.due_period)
+        facts["payment_due_period_days"] = payment_term.due_period
+        facts["payment_frequency"] = payment_term.payment_freq.value
+
+        interval = PAYMENT_INTERVAL_MONTHS.get(payment_term.payment_freq)
+        if interval is not None and interval > 0 and effective_date:
+            next_payment = next_on_schedule(effective_date, interval, as_of)
+            if end_date is None or next_payment <= end_date or renewal_type == RenewalType.AUTOMATIC:
+                facts["next_billing_date"] = next_payment.isoformat()
+                facts["next_payment_due_date"] = (next_payment + due_period).isoformat()
+                facts["days_until_next_payment_due"] = (next_payment + due_period - as_of).days
+
+        if invoice_date is not None:
+            facts["invoice_date"] = invoice_date.isoformat()
+            facts["invoice_payment_due_date"] = (invoice_date + due_period).isoformat()
+            facts["days_until_invoice_payment_due"] = (invoice_date + due_period - as_of).days
+
+    return facts
@@ -245,6 +245,56 @@ class ValidationReport(BaseModel):
 
 AnyContract = Union[EmploymentContract, NDAContract, SupplierContract]
 
+CONTRACT_CLASSES = {
+    ContractType.EMPLOYMENT_CONTRACT: EmploymentContract,
+    ContractType.NDA_CONTRACT: NDAContract,
+    ContractType.SUPPLIER_CONTRACT: SupplierContract,
+}
+
+
+def describe_annotation(annotation) -> str:
+    """Short, human readable name of a field annotation, e.g. 'date | None'."""
+    if inspect.isclass(annotation):
+        if issubclass(annotation, Enum):
+            return " | ".join(f"'{member.value}'" for member in annotation)
+        return annotation.__name__
+
+    args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+    if typing.get_origin(annotation) is list and args:
+        return f"list[{describe_annotation(args[0])}]"
+    if len(args) < len(typing.get_args(annotation)):
+        return f"{' | '.join(describe_annotation(arg) for arg in args)} | None"
+    return str(annotation)
+
+
+def generate_field_outline(schema: BaseModel.__class__, prefix: str = "") -> list[str]:
+    """
+    Recursively lists the dotted field paths of a Pydantic schema with their types.
+    Fields of list items are listed under the path of the list, e.g. 'parties.legal_name'.
+    """
+    outline = []
+
+    for field_name, field_info in schema.model_fields.items():
+        if field_info.annotation is uuid.UUID:
+            continue
+
+        path = f"{prefix}{field_name}"
+        annotation = field_info.annotation
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        item = args[0] if typing.get_origin(annotation) is list and args else None
+
+        if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+            outline.append(f"{path}: object")
+            outline.extend(generate_field_outline(annotation, f"{path}."))
+        elif inspect.isclass(item) and issubclass(item, BaseModel):
+            outline.append(f"{path}: list[object]")
+            outline.extend(generate_field_outline(item, f"{path}."))
+        else:
+            outline.append(f"{path}: {describe_annotation(annotation)}")
+
+    return outline
+
+
 if __name__ == '__main__':
     
     # contract_schema = generate_contract_schema(EmploymentContract)
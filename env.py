@@ -41,6 +41,10 @@ def load_secrets(env: str):
             "GOOGLE_CLOUD_FIRESTORE_DATABASE": get_secret("GOOGLE_CLOUD_FIRESTORE_DATABASE_PROD"),
         }
         
+    # only needed for stateless signed session tokens
+    if os.environ.get("SESSION_MODE") == "signed":
+        secrets["SESSION_TOKEN_SECRET"] = get_secret("SESSION_TOKEN_SECRET")
+
     for key, value in secrets.items():
         os.environ.setdefault(key, value)
 
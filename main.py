@@ -1,10 +1,21 @@
 from contextlib import asynccontextmanager
 from config import log_config
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from api import contract_router, user_router, agent_router
-from connectors import firestore_connector, gcs_connector
-
+from api import contract_router, user_router, agent_router, admin_router
+from connectors import firestore_connector, gcs_connector, chromadb_connector
+from usage import io_ledger, utils as usage_utils
+from agent.writer import message_writer
+from agent.streams import stream_registry
+from sessions import tokens as session_tokens
+from sessions import sweeper as session_sweeper
+from connectors.google_certs import google_certs
+from connectors import cache_coherence, cache_tier
+from contracts.cache import contract_cache
+from sessions.cache import session_cache
+from agent.answer_cache import answer_cache
+
+import asyncio
 import logging
 import uvicorn
 import os
@@ -20,10 +31,45 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.firestore = firestore_connector.get_firestore_connection()
+    # handlers await the async DALs on this client; background jobs and worker
+    # threads keep the sync client
+    app.state.firestore_async = firestore_connector.get_async_firestore_connection()
     app.state.bucket = gcs_connector.get_storage_bucket()
-    # app.state.chromadb = chromadb_connector.get_chroma_client()
+    app.state.chromadb = chromadb_connector.get_persistent_chroma_client()
+    # shared L2 of the in-process caches, when more than one instance serves
+    app.state.cache_tier = cache_tier.create_cache_tier()
+    if app.state.cache_tier is not None:
+        for cache in (session_cache, contract_cache, answer_cache):
+            cache.use_tier(app.state.cache_tier)
+    usage_flusher = asyncio.create_task(usage_utils.recorder.run_flusher(app.state.firestore))
+    message_writer.start(app.state.firestore)
+    background_tasks = [asyncio.create_task(google_certs.run_refresher())]
+    if session_tokens.signed_sessions_enabled():
+        background_tasks.append(
+            asyncio.create_task(session_tokens.run_revocation_sync(app.state.firestore))
+        )
+    if cache_coherence.CACHE_COHERENCE_ENABLED:
+        coherence = cache_coherence.start_cache_coherence(app.state.firestore)
+        background_tasks.append(asyncio.create_task(coherence.run()))
+    if session_sweeper.SESSION_SWEEP_ENABLED:
+        background_tasks.append(
+            asyncio.create_task(session_sweeper.run_sweeper(app.state.firestore))
+        )
     yield
-    # optional cleanup
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # stop running agent streams, then persist their queued messages
+    await stream_registry.close()
+    await message_writer.close()
+    if app.state.cache_tier is not None:
+        await asyncio.to_thread(app.state.cache_tier.close)
+    # flush buffered usage records before shutting down
+    usage_flusher.cancel()
+    try:
+        await usage_flusher
+    except asyncio.CancelledError:
+        pass
 
 
 app = FastAPI(lifespan=lifespan)
@@ -38,9 +84,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[io_ledger.IO_LEDGER_HEADER],
 )
 
 
+@app.middleware("http")
+async def record_io(request: Request, call_next):
+    """Counts the Firestore, GCS and LLM I/O of each request, see usage.io_ledger."""
+    if not io_ledger.IO_LEDGER_ENABLED:
+        return await call_next(request)
+
+    with io_ledger.measure() as ledger:
+        response = await call_next(request)
+    # the header covers the I/O until the response started, the log line the
+    # whole request including a streamed body
+    response.headers[io_ledger.IO_LEDGER_HEADER] = ledger.header_value()
+    body = response.body_iterator
+
+    async def body_then_log():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            io_ledger.log_request(request.method, request.url.path, ledger)
+
+    response.body_iterator = body_then_log()
+    return response
+
+
 @app.get("/")
 def home():
     return {"message": f"Hello from contract-intelligence-platform! {os.environ.get('ENV', "dev")}"}
@@ -49,6 +120,7 @@ def home():
 app.include_router(contract_router.router)
 app.include_router(user_router.router)
 app.include_router(agent_router.router)
+app.include_router(admin_router.router)
 
 def main():
 
@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 from openai import OpenAI
 from google import genai
 from google.genai import types
+from usage import utils as usage_utils
+
+import time
 
 # Configure OpenAI API
 openai.api_key = os.getenv("OPEN_AI_API_KEY")
@@ -62,10 +65,20 @@ def open_ai_extractor(pdf_path: str) -> str:
     try:
         client = OpenAI()
         
+        started = time.perf_counter()
         response = client.responses.create(
             model="gpt-5.1",
             input=messages,
         )
+        usage = response.usage
+        usage_utils.record_usage(
+            "model.extract",
+            "gpt-5.1",
+            started,
+            input_tokens=usage.input_tokens if usage else 0,
+            output_tokens=usage.output_tokens if usage else 0,
+            cached_tokens=usage.input_tokens_details.cached_tokens if usage else 0,
+        )
         extracted_text = response.output_text
 
     except Exception as e:
@@ -110,10 +123,12 @@ def gemini_extractor(pdf_path: str, dest_path: str):
         ]
     )
     try:
+        started = time.perf_counter()
         response = client.models.generate_content(
             model="gemini-2.5-flash",
             contents=[contents],
         )
+        usage_utils.record_genai_response("model.extract", "gemini-2.5-flash", response, started)
         extracted_text = response.candidates[0].content.parts[0].text # type: ignore
 
     except Exception as e:
@@ -3,8 +3,10 @@ from contracts import schemas
 from google import genai
 from google.genai import types
 from pprint import pprint
+from usage import utils as usage_utils
 
 import json
+import time
 
 def fill_schema(contract_path: str, contract_cls: schemas.Contract.__class__) -> schemas.Contract:
     """
@@ -33,6 +35,7 @@ def fill_schema(contract_path: str, contract_cls: schemas.Contract.__class__) ->
     
     # ignore contract_id, md_uri, pdf_uri, contract_name, contract_type fields
     
+    started = time.perf_counter()
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents={"parts": [{"text": prompt}], "role": "user"},
@@ -42,6 +45,7 @@ def fill_schema(contract_path: str, contract_cls: schemas.Contract.__class__) ->
             response_mime_type="application/json"             
         ),
     )
+    usage_utils.record_genai_response("model.fill", "gemini-2.5-flash", response, started)
     5
     if not response or not response.candidates or not response.candidates[0].content or not response.candidates[0].content.parts or not response.candidates[0].content.parts[0].text:
         raise RuntimeError("No response received from the API")
@@ -7,31 +7,20 @@ from contracts import schemas
 from pydantic import BaseModel
 from contracts.schemas import Contract
 from model import fill
+from usage import utils as usage_utils
 
-def validate(contract_path: str, contract: Contract) -> schemas.ValidationReport:
-    """
-    Validate the contract against the given schema and legal requirements.
+import time
 
-    Args:
-        contract_path (str): Path to the markdown pfile containing the contract text.
-        contract_schema (BaseModel.__class__): The Pydantic schema class for the contract type.
+VALIDATION_MODEL = "gemini-2.5-flash"
 
-    Returns:
-        schemas.ValidationReport: A detailed validation report.
-    """
-    
-    try:
-        with open(contract_path, "r", encoding="utf-8") as f:
-            contract_text = f.read()
-    except FileNotFoundError:
-        raise FileNotFoundError(f"The file {contract_path} was not found.")
 
-    client = genai.Client()
+def build_validation_prompt(contract_text: str, contract: Contract) -> str:
+    """Builds the validation prompt from the contract text and its filled schema."""
 
     # Generate a description of the schema to help the model understand what to look for
     schema_description = contract.model_dump_json()
 
-    prompt = f"""
+    return f"""
     You are a legal expert assistant. Your task is to validate the following contract text against the provided schema requirements and general legal standards.
 
     Contract Text:
@@ -49,16 +38,15 @@ def validate(contract_path: str, contract: Contract) -> schemas.ValidationReport
     For each check, provide a score from 1 to 10 (10 being perfect) and list any validation errors found.
     """
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=schemas.ValidationReport,
-            system_instruction="You are a helpful legal assistant that validates contracts and outputs the result in JSON format."
-        ),
-    )
 
+VALIDATION_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=schemas.ValidationReport,
+    system_instruction="You are a helpful legal assistant that validates contracts and outputs the result in JSON format."
+)
+
+
+def parse_validation_report(response, contract: Contract) -> schemas.ValidationReport:
     if not response.text:
         raise RuntimeError("No response received from the API")
 
@@ -70,6 +58,63 @@ def validate(contract_path: str, contract: Contract) -> schemas.ValidationReport
     
     return validation_report
 
+
+def validate(contract_path: str, contract: Contract) -> schemas.ValidationReport:
+    """
+    Validate the contract against the given schema and legal requirements.
+
+    Args:
+        contract_path (str): Path to the markdown pfile containing the contract text.
+        contract_schema (BaseModel.__class__): The Pydantic schema class for the contract type.
+
+    Returns:
+        schemas.ValidationReport: A detailed validation report.
+    """
+    
+    try:
+        with open(contract_path, "r", encoding="utf-8") as f:
+            contract_text = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"The file {contract_path} was not found.")
+
+    client = genai.Client()
+
+    started = time.perf_counter()
+    response = client.models.generate_content(
+        model=VALIDATION_MODEL,
+        contents=build_validation_prompt(contract_text, contract),
+        config=VALIDATION_CONFIG,
+    )
+    usage_utils.record_genai_response("model.validate", VALIDATION_MODEL, response, started)
+
+    return parse_validation_report(response, contract)
+
+
+async def avalidate(contract_text: str, contract: Contract) -> schemas.ValidationReport:
+    """
+    Validate the contract text against the given schema and legal requirements
+    without blocking the event loop.
+
+    Args:
+        contract_text (str): The markdown of the contract.
+        contract (Contract): The filled contract.
+
+    Returns:
+        schemas.ValidationReport: A detailed validation report.
+    """
+    client = genai.Client()
+
+    started = time.perf_counter()
+    response = await client.aio.models.generate_content(
+        model=VALIDATION_MODEL,
+        contents=build_validation_prompt(contract_text, contract),
+        config=VALIDATION_CONFIG,
+    )
+    usage_utils.record_genai_response("model.validate", VALIDATION_MODEL, response, started)
+
+    return parse_validation_report(response, contract)
+
+
 if __name__ == "__main__":
     # Example usage
     try:
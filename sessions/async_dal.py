@@ -0,0 +1,165 @@
+"""Data Access Layer methods for sessions on the async Firestore client.
+
+Mirrors sessions.dal for handlers running on the event loop, which await
+these directly instead of calling the sync functions in a thread.
+"""
+
+from typing import Optional, Union
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import AsyncClient, DocumentSnapshot
+from sessions.dal import session_to_dict
+from sessions.schemas import Session
+from usage import io_ledger
+from datetime import datetime, timezone
+
+
+async def write_session(db: AsyncClient, session: Session) -> str:
+    """
+    Write a session to the sessions collection in Firestore.
+
+    Args:
+        db: Async Firestore client instance
+        session: Session object to write
+
+    Returns:
+        str: The document ID of the created session
+    """
+    doc_ref = db.collection("sessions").document(str(session.session_id))
+    try:
+        await doc_ref.create(session_to_dict(session))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
+        raise ValueError(f"Session with ID {session.session_id} already exists.")
+    return doc_ref.id
+
+
+async def get_session(db: AsyncClient, session_id: str) -> Optional[Session]:
+    """
+    Read a session from the sessions collection by session ID.
+
+    Args:
+        db: Async Firestore client instance
+        session_id: The session ID to retrieve
+
+    Returns:
+        Optional[Session]: The session object if found, None otherwise
+    """
+    doc = await db.collection("sessions").document(session_id).get()
+    io_ledger.record_firestore_reads("sessions", session_id)
+    if not doc.exists:
+        return None
+    return Session(**doc.to_dict())  # type: ignore
+
+
+async def get_active_sessions_by_user(db: AsyncClient, user_id: str) -> list[Session]:
+    """
+    Get all active sessions for a specific user.
+
+    Args:
+        db: Async Firestore client instance
+        user_id: The user ID to get sessions for
+
+    Returns:
+        list[Session]: List of active sessions for the user
+    """
+    query = db.collection("sessions").where("user_id", "==", user_id).where(
+        "expires_at", ">", datetime.now(timezone.utc)
+    )
+    sessions = [Session(**doc.to_dict()) async for doc in query.stream()]  # type: ignore
+    io_ledger.record_firestore_reads("sessions", count=len(sessions))
+    return sessions
+
+
+async def delete_session(db: AsyncClient, session_id: str):
+    """
+    Delete a session from the sessions collection by session ID.
+
+    Args:
+        db: Async Firestore client instance
+        session_id: The session ID to delete
+    """
+    await db.collection("sessions").document(session_id).delete()
+    io_ledger.record_firestore_writes()
+
+
+async def revoke_session(db: AsyncClient, session_id: str, expires_at: datetime):
+    """
+    Record a revoked signed session token in the revoked_sessions collection.
+
+    Args:
+        db: Async Firestore client instance
+        session_id: The session ID of the token
+        expires_at: When the token expires, the revocation is not needed after it
+    """
+    await db.collection("revoked_sessions").document(session_id).set(
+        {"session_id": session_id, "expires_at": expires_at}
+    )
+    io_ledger.record_firestore_writes()
+
+
+async def get_revoked_sessions(db: AsyncClient) -> list[tuple[str, datetime]]:
+    """
+    Get the revoked signed session tokens that have not expired yet.
+
+    Args:
+        db: Async Firestore client instance
+
+    Returns:
+        list[tuple[str, datetime]]: Session IDs and expiry of the revoked tokens
+    """
+    query = db.collection("revoked_sessions").where(
+        "expires_at", ">", datetime.now(timezone.utc)
+    )
+    revoked = [
+        (doc.get("session_id"), doc.get("expires_at")) async for doc in query.stream()
+    ]
+    io_ledger.record_firestore_reads("revoked_sessions", count=len(revoked))
+    return revoked
+
+
+async def get_expired_session_refs(
+    db: AsyncClient,
+    expired_before: Union[datetime, str],
+    page_size: int,
+    start_after: Optional[DocumentSnapshot] = None,
+) -> list[DocumentSnapshot]:
+    """
+    Get a page of expired sessions, oldest first. A string expired_before,
+    see sessions.dal.legacy_expired_before, matches sessions with a string expires_at.
+
+    Args:
+        db: Async Firestore client instance
+        expired_before: Sessions that expired before this time are returned
+        page_size: Maximum number of sessions in the page
+        start_after: Last session of the previous page
+
+    Returns:
+        list[DocumentSnapshot]: The sessions of the page, only their expiry is read
+    """
+    query = (
+        db.collection("sessions")
+        .where("expires_at", "<", expired_before)
+        .order_by("expires_at")
+        .select(["expires_at"])
+        .limit(page_size)
+    )
+    if start_after is not None:
+        query = query.start_after(start_after)
+    page = await query.get()
+    io_ledger.record_firestore_reads("sessions", count=len(page))
+    return page
+
+
+async def count_sessions(db: AsyncClient) -> int:
+    """
+    Count the documents of the sessions collection with an aggregation query.
+
+    Args:
+        db: Async Firestore client instance
+
+    Returns:
+        int: Number of sessions, expired ones included
+    """
+    result = await db.collection("sessions").count().get()
+    io_ledger.record_firestore_reads("sessions")
+    return int(result[0][0].value)
@@ -0,0 +1,181 @@
+"""In-process cache of sessions for validate_session.
+
+Every authenticated request validates its session, which used to be a
+Firestore read per API call. Sessions are cached in a bounded LRU with a TTL,
+unknown session ids are cached negatively for a shorter time, and an entry
+never outlives the session's expires_at. /user/logout invalidates the entry
+of this instance right away; other instances drop it within the TTL, or
+right away with the shared tier of connectors.cache_tier.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+from connectors.cache_tier import CacheTier
+from sessions.schemas import Session
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_ENABLED = os.environ.get("SESSION_CACHE_ENABLED", "true").lower() == "true"
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL", 60))
+SESSION_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_NEGATIVE_TTL", 5))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", 10000))
+
+# namespace of session_cache in the shared tier
+TIER_NAMESPACE = "sessions"
+
+
+class SessionCache:
+    """Bounded TTL/LRU cache of sessions by session id."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = SESSION_CACHE_TTL_SECONDS,
+        negative_ttl_seconds: float = SESSION_CACHE_NEGATIVE_TTL_SECONDS,
+        max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+        enabled: bool = SESSION_CACHE_ENABLED,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Session]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # called with every session id that misses or enters the cache, see connectors.cache_coherence
+        self.on_key: Optional[Callable[[str], None]] = None
+        # the shared tier does network I/O, so callers on the event loop use a thread when it is set
+        self.tier: Optional[CacheTier] = None
+
+    def use_tier(self, tier: CacheTier):
+        """Reads through the shared tier on a miss and takes invalidations from other instances."""
+        self.tier = tier
+        tier.on_invalidate(TIER_NAMESPACE, self._drop)
+
+    def _drop(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def get(self, session_id: str) -> Tuple[bool, Optional[Session]]:
+        """
+        Looks up a session.
+
+        Returns:
+            Whether the id was cached, and the session, None for an id cached as unknown.
+        """
+        if not self.enabled:
+            return False, None
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return True, entry[1]
+
+            if entry is not None:
+                del self._entries[session_id]
+            self.misses += 1
+
+        if self.on_key is not None:
+            self.on_key(session_id)
+
+        if self.tier is not None:
+            raw = self.tier.get(TIER_NAMESPACE, session_id)
+            if raw is not None:
+                try:
+                    session = Session.model_validate_json(raw)
+                except ValueError:
+                    logger.warning("Dropping undecodable shared session cache entry")
+                else:
+                    self._put_local(session_id, session)
+                    return True, session
+        return False, None
+
+    def put(self, session_id: str, session: Optional[Session]):
+        """Caches a session, or None for an unknown session id."""
+        ttl = self._put_local(session_id, session)
+        # unknown ids stay local, a session created on another instance must not be hidden
+        if ttl and session is not None and self.tier is not None:
+            self.tier.set(TIER_NAMESPACE, session_id, session.model_dump_json().encode("utf-8"), ttl)
+
+    def _put_local(self, session_id: str, session: Optional[Session]) -> float:
+        if not self.enabled:
+            return 0
+
+        if session is None:
+            ttl = self.negative_ttl_seconds
+        else:
+            # an entry never outlives the session itself
+            remaining = (session.expires_at - datetime.now(timezone.utc)).total_seconds()
+            ttl = min(self.ttl_seconds, remaining)
+            if ttl <= 0:
+                return 0
+
+        with self._lock:
+            self._entries[session_id] = (time.monotonic() + ttl, session)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        if self.on_key is not None:
+            self.on_key(session_id)
+        return ttl
+
+    def invalidate(self, session_id: str):
+        """Drops a session, e.g. on logout."""
+        self._drop(session_id)
+        if self.tier is not None:
+            self.tier.invalidate(TIER_NAMESPACE, [session_id])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+session_cache = SessionCache()
+
+
+if __name__ == "__main__":
+    # Benchmark of validate_session with and without the cache against the
+    # configured Firestore, e.g. python -m sessions.cache <session_id> <csrf_token>
+    import asyncio
+    import sys
+
+    from dotenv import load_dotenv
+
+    from api.utils import check_session
+    from connectors import firestore_connector
+
+    # under python -m this module is __main__, check_session uses the instance of sessions.cache
+    from sessions.cache import session_cache
+
+    load_dotenv()
+
+    session_id, csrf_token = sys.argv[1], sys.argv[2]
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    async def benchmark(enabled: bool) -> float:
+        session_cache.enabled = enabled
+        session_cache.clear()
+        started = time.perf_counter()
+        for _ in range(requests):
+            await check_session(firestore_client, session_id, csrf_token)
+        return requests / (time.perf_counter() - started)
+
+    async def main():
+        # the async client is bound to the loop it is first used on
+        return await benchmark(False), await benchmark(True)
+
+    firestore_client = firestore_connector.get_async_firestore_connection()
+    without_cache, with_cache = asyncio.run(main())
+    print(f"validate_session without cache: {without_cache:.1f} requests/s")
+    print(f"validate_session with cache:    {with_cache:.1f} requests/s")
+    print(f"cache hits: {session_cache.hits}, misses: {session_cache.misses}")
@@ -1,11 +1,35 @@
 """Data Access Layer methods for sessions"""
 
-from typing import Optional
-from google.cloud.firestore import Client
+from typing import Optional, Union
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import Client, DocumentSnapshot
 from sessions.schemas import Session
+from usage import io_ledger
 from datetime import datetime, timezone
 
 
+def legacy_expired_before(value: datetime) -> str:
+    """
+    The cutoff of a range query on expires_at as it was stored before it
+    became a timestamp, the JSON dump of the session, e.g.
+    2024-05-01T12:00:00.5Z. The cutoff is cut to whole seconds and drops the
+    Z, so it compares as a string like the stored times: "<" matches the
+    times before the cutoff second.
+    """
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def session_to_dict(session: Session) -> dict:
+    """
+    Serialize a session for Firestore. created_at and expires_at are kept as
+    timestamps, so expires_at can be range queried and used as the TTL field.
+    """
+    session_dict = session.model_dump(mode="json")
+    session_dict["created_at"] = session.created_at
+    session_dict["expires_at"] = session.expires_at
+    return session_dict
+
+
 def write_session(db: Client, session: Session) -> str:
     """
     Write a session to the sessions collection in Firestore.
@@ -18,10 +42,11 @@ def write_session(db: Client, session: Session) -> str:
         str: The document ID of the created session
     """
     doc_ref = db.collection("sessions").document(str(session.session_id))
-    if doc_ref.get().exists:
+    try:
+        doc_ref.create(session_to_dict(session))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
         raise ValueError(f"Session with ID {session.session_id} already exists.")
-
-    doc_ref.set(session.model_dump(mode="json"))
     return doc_ref.id
 
 
@@ -39,6 +64,7 @@ def get_session(db: Client, session_id: str) -> Optional[Session]:
 
     doc_ref = db.collection("sessions").document(session_id)
     doc = doc_ref.get()
+    io_ledger.record_firestore_reads("sessions", session_id)
     if not doc.exists:
         return None
     return Session(**doc.to_dict())  # type: ignore
@@ -55,13 +81,14 @@ def get_active_sessions_by_user(db: Client, user_id: str) -> list[Session]:
     Returns:
         list[Session]: List of active sessions for the user
     """
+    # served by the (user_id, expires_at) composite index in firestore.indexes.json
     sessions_ref = db.collection("sessions")
     query = sessions_ref.where("user_id", "==", user_id).where(
-        "expires_at", "<", datetime.now(timezone.utc)
+        "expires_at", ">", datetime.now(timezone.utc)
     )
-    docs = query.stream()
-
-    return [Session(**doc.to_dict()) for doc in docs]  # type: ignore
+    sessions = [Session(**doc.to_dict()) for doc in query.stream()]  # type: ignore
+    io_ledger.record_firestore_reads("sessions", count=len(sessions))
+    return sessions
 
 
 def delete_session(db: Client, session_id: str):
@@ -75,7 +102,94 @@ def delete_session(db: Client, session_id: str):
     """
     doc_ref = db.collection("sessions").document(session_id)
     doc_ref.delete()
+    io_ledger.record_firestore_writes()
+
+
+
+def revoke_session(db: Client, session_id: str, expires_at: datetime):
+    """
+    Record a revoked signed session token in the revoked_sessions collection.
+
+    Args:
+        db: Firestore client instance
+        session_id: The session ID of the token
+        expires_at: When the token expires, the revocation is not needed after it
+    """
+    db.collection("revoked_sessions").document(session_id).set(
+        {"session_id": session_id, "expires_at": expires_at}
+    )
+    io_ledger.record_firestore_writes()
+
+
+def get_revoked_sessions(db: Client) -> list[tuple[str, datetime]]:
+    """
+    Get the revoked signed session tokens that have not expired yet.
+
+    Args:
+        db: Firestore client instance
+
+    Returns:
+        list[tuple[str, datetime]]: Session IDs and expiry of the revoked tokens
+    """
+    query = db.collection("revoked_sessions").where(
+        "expires_at", ">", datetime.now(timezone.utc)
+    )
+    revoked = [
+        (doc.get("session_id"), doc.get("expires_at")) for doc in query.stream()
+    ]
+    io_ledger.record_firestore_reads("revoked_sessions", count=len(revoked))
+    return revoked
+
+
+def get_expired_session_refs(
+    db: Client,
+    expired_before: Union[datetime, str],
+    page_size: int,
+    start_after: Optional[DocumentSnapshot] = None,
+) -> list[DocumentSnapshot]:
+    """
+    Get a page of expired sessions, oldest first.
+
+    Firestore only compares values of the same type, so a datetime matches the
+    sessions whose expires_at is a timestamp, and a string from
+    legacy_expired_before those stored with a string expires_at.
+
+    Args:
+        db: Firestore client instance
+        expired_before: Sessions that expired before this time are returned
+        page_size: Maximum number of sessions in the page
+        start_after: Last session of the previous page
 
+    Returns:
+        list[DocumentSnapshot]: The sessions of the page, only their expiry is read
+    """
+    query = (
+        db.collection("sessions")
+        .where("expires_at", "<", expired_before)
+        .order_by("expires_at")
+        .select(["expires_at"])
+        .limit(page_size)
+    )
+    if start_after is not None:
+        query = query.start_after(start_after)
+    page = list(query.stream())
+    io_ledger.record_firestore_reads("sessions", count=len(page))
+    return page
+
+
+def count_sessions(db: Client) -> int:
+    """
+    Count the documents of the sessions collection with an aggregation query.
+
+    Args:
+        db: Firestore client instance
+
+    Returns:
+        int: Number of sessions, expired ones included
+    """
+    result = db.collection("sessions").count().get()
+    io_ledger.record_firestore_reads("sessions")
+    return int(result[0][0].value)
 
 
 if __name__ == "__main__":
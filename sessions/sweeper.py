@@ -0,0 +1,137 @@
+"""Background removal of expired sessions.
+
+Sessions used to be deleted only on logout, so the collection grew without
+bound. The sweeper pages through expired sessions, oldest first, and deletes
+them with a BulkWriter. The BulkWriter sends the deletes in parallel batches,
+throttled to ``SESSION_SWEEP_MAX_OPS_PER_SECOND`` so a large backlog does not
+compete with user traffic.
+
+expires_at is stored as a timestamp, so a native Firestore TTL policy on it
+can do the same job without the sweeper:
+
+    gcloud firestore fields ttls update expires_at --collection-group=sessions --enable-ttl
+
+The sweeper stays useful where TTL deletion, which can lag by a day, is too slow.
+It also deletes sessions written before expires_at became a timestamp. Their
+expires_at is an ISO string, which neither the TTL policy nor a timestamp
+range query matches.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.cloud.firestore import Client
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+from sessions import dal as session_dal
+
+logger = logging.getLogger(__name__)
+
+SESSION_SWEEP_ENABLED = os.environ.get("SESSION_SWEEP_ENABLED", "true").lower() == "true"
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.environ.get("SESSION_SWEEP_INTERVAL", 3600))
+SESSION_SWEEP_PAGE_SIZE = int(os.environ.get("SESSION_SWEEP_PAGE_SIZE", 500))
+SESSION_SWEEP_MAX_OPS_PER_SECOND = int(os.environ.get("SESSION_SWEEP_MAX_OPS_PER_SECOND", 200))
+
+
+@dataclass
+class SweepStats:
+    """Metrics of the session sweeper on this instance."""
+    sweeps: int = 0
+    deleted_total: int = 0
+    failed_total: int = 0
+    last_sweep_at: Optional[datetime] = None
+    last_deleted: int = 0
+    last_duration_seconds: float = 0.0
+    last_deletes_per_second: float = 0.0
+    collection_size: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+sweep_stats = SweepStats()
+
+
+def sweep_expired_sessions(
+    db: Client,
+    page_size: int = SESSION_SWEEP_PAGE_SIZE,
+    max_ops_per_second: int = SESSION_SWEEP_MAX_OPS_PER_SECOND,
+) -> int:
+    """
+    Deletes every session that expired before the sweep started.
+
+    Returns:
+        int: Number of deleted sessions
+    """
+    started = time.perf_counter()
+    expired_before = datetime.now(timezone.utc)
+    deleted = 0
+    failed = 0
+
+    writer = db.bulk_writer(
+        options=BulkWriterOptions(
+            initial_ops_per_second=min(max_ops_per_second, page_size),
+            max_ops_per_second=max_ops_per_second,
+        )
+    )
+
+    def on_failure(error, bulk_writer) -> bool:
+        nonlocal failed
+        failed += 1
+        logger.warning("Deleting expired session failed: %s", error.message)
+        # the session is picked up again by the next sweep
+        return False
+
+    writer.on_write_error(on_failure)
+
+    cutoffs = (expired_before, session_dal.legacy_expired_before(expired_before))
+    try:
+        for cutoff in cutoffs:
+            last = None
+            while True:
+                page = session_dal.get_expired_session_refs(db, cutoff, page_size, last)
+                for snapshot in page:
+                    writer.delete(snapshot.reference)
+                writer.flush()
+                deleted += len(page)
+                if len(page) < page_size:
+                    break
+                last = page[-1]
+    finally:
+        writer.close()
+
+    deleted -= failed
+    duration = time.perf_counter() - started
+
+    sweep_stats.sweeps += 1
+    sweep_stats.deleted_total += deleted
+    sweep_stats.failed_total += failed
+    sweep_stats.last_sweep_at = expired_before
+    sweep_stats.last_deleted = deleted
+    sweep_stats.last_duration_seconds = duration
+    sweep_stats.last_deletes_per_second = deleted / duration if duration > 0 else 0.0
+    sweep_stats.collection_size = session_dal.count_sessions(db)
+
+    logger.info(
+        "Swept %d expired sessions in %.1fs, %d sessions left",
+        deleted,
+        duration,
+        sweep_stats.collection_size,
+    )
+    return deleted
+
+
+async def run_sweeper(db: Client, interval: float = SESSION_SWEEP_INTERVAL_SECONDS):
+    """Sweeps expired sessions on an interval until cancelled."""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_expired_sessions, db)
+        except Exception as exc:
+            logger.warning("Sweeping expired sessions failed", exc_info=exc)
+        await asyncio.sleep(interval)
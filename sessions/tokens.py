@@ -0,0 +1,225 @@
+"""Stateless signed session tokens.
+
+With SESSION_MODE=signed the session cookie carries an expiring token,
+``<payload>.<signature>``, instead of a session id. The payload holds the
+session id, user id, expiry and a hash of the CSRF token. The signature is
+an HMAC-SHA256 with SESSION_TOKEN_SECRET. Tokens are verified locally, so
+authenticating a request takes no I/O.
+
+Logged out tokens are revoked. Revocations are written to the
+``revoked_sessions`` collection and kept in memory as a Bloom filter plus
+the exact set. Unrevoked tokens, almost every request, are rejected by the
+filter in constant time. Every instance re-syncs the revocations from
+Firestore periodically.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Tuple
+
+from google.cloud.firestore import AsyncClient, Client
+
+from sessions import async_dal as session_async_dal, dal as session_dal
+from sessions.schemas import Session
+
+logger = logging.getLogger(__name__)
+
+SESSION_MODE = os.environ.get("SESSION_MODE", "server")
+REVOCATION_SYNC_INTERVAL_SECONDS = float(os.environ.get("SESSION_REVOCATION_SYNC_INTERVAL", 30))
+
+# sized for ~10k revoked unexpired sessions at a ~1% false positive rate
+BLOOM_FILTER_BITS = 1 << 17
+BLOOM_FILTER_HASHES = 7
+
+
+def signed_sessions_enabled() -> bool:
+    return SESSION_MODE == "signed"
+
+
+def _secret() -> bytes:
+    secret = os.environ.get("SESSION_TOKEN_SECRET")
+    if not secret:
+        raise RuntimeError("SESSION_TOKEN_SECRET is required for signed sessions")
+    return secret.encode("utf-8")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _csrf_hash(csrf_token: str) -> str:
+    return _b64encode(hashlib.sha256(csrf_token.encode("utf-8")).digest())
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(session: Session) -> str:
+    """Signs a session into a token for the session cookie."""
+    payload = _b64encode(
+        json.dumps(
+            {
+                "sid": str(session.session_id),
+                "uid": session.user_id,
+                "csrf": _csrf_hash(session.csrf_token),
+                "iat": int(session.created_at.timestamp()),
+                "exp": int(session.expires_at.timestamp()),
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+    )
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token: str, csrf_token: str) -> Session:
+    """
+    Verifies the signature, expiry, CSRF binding and revocation of a token.
+
+    Returns:
+        The session of the token.
+
+    Raises:
+        ValueError: If the token is malformed, forged, expired, revoked or
+            the CSRF token does not match.
+    """
+    payload, _, signature = token.partition(".")
+    if not payload or not signature:
+        raise ValueError("malformed session token")
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("invalid session token signature")
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise ValueError("malformed session token")
+
+    expires_at = datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+    if expires_at < datetime.now(timezone.utc):
+        raise ValueError("session expired")
+
+    if not csrf_token or not hmac.compare_digest(claims["csrf"], _csrf_hash(csrf_token)):
+        raise ValueError("csrf token mismatch")
+
+    if revocations.is_revoked(claims["sid"]):
+        raise ValueError("session revoked")
+
+    return Session(
+        session_id=claims["sid"],
+        user_id=claims["uid"],
+        csrf_token=csrf_token,
+        created_at=datetime.fromtimestamp(claims["iat"], tz=timezone.utc),
+        expires_at=expires_at,
+    )
+
+
+def token_session_id(token: str) -> Tuple[str, datetime]:
+    """
+    Reads the session id and expiry of a correctly signed token, expired or not.
+
+    Raises:
+        ValueError: If the token is malformed or forged.
+    """
+    payload, _, signature = token.partition(".")
+    if not payload or not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("invalid session token")
+    claims = json.loads(_b64decode(payload))
+    return claims["sid"], datetime.fromtimestamp(claims["exp"], tz=timezone.utc)
+
+
+class RevocationFilter:
+    """Revoked session ids, as a Bloom filter in front of the exact set."""
+
+    def __init__(self, bits: int = BLOOM_FILTER_BITS, hashes: int = BLOOM_FILTER_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._bloom = bytearray(bits // 8)
+        self._revoked: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def _positions(self, session_id: str) -> Iterable[int]:
+        digest = hashlib.sha256(session_id.encode("utf-8")).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        # double hashing derives the k positions from two hashes
+        return ((first + i * second) % self.bits for i in range(self.hashes))
+
+    def _add_to_bloom(self, bloom: bytearray, session_id: str):
+        for position in self._positions(session_id):
+            bloom[position // 8] |= 1 << (position % 8)
+
+    def add(self, session_id: str, expires_at: datetime):
+        with self._lock:
+            self._revoked[session_id] = expires_at
+            self._add_to_bloom(self._bloom, session_id)
+
+    def is_revoked(self, session_id: str) -> bool:
+        bloom = self._bloom
+        if not all(bloom[position // 8] & (1 << (position % 8)) for position in self._positions(session_id)):
+            return False
+        with self._lock:
+            return session_id in self._revoked
+
+    def replace(self, revoked: Dict[str, datetime]):
+        """Rebuilds the filter from the full set, dropping revocations of expired tokens."""
+        now = datetime.now(timezone.utc)
+        bloom = bytearray(self.bits // 8)
+        current = {sid: exp for sid, exp in revoked.items() if exp > now}
+        for session_id in current:
+            self._add_to_bloom(bloom, session_id)
+        with self._lock:
+            # revocations made on this instance since the read are kept
+            for session_id, expires_at in self._revoked.items():
+                if session_id not in current and expires_at > now:
+                    current[session_id] = expires_at
+                    self._add_to_bloom(bloom, session_id)
+            self._revoked = current
+            self._bloom = bloom
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+revocations = RevocationFilter()
+
+
+def revoke_token(db: Client, token: str):
+    """Revokes a token on this instance right away and for every instance through Firestore."""
+    session_id, expires_at = token_session_id(token)
+    revocations.add(session_id, expires_at)
+    session_dal.revoke_session(db, session_id, expires_at)
+
+
+async def revoke_token_async(db: AsyncClient, token: str):
+    """revoke_token on the async client."""
+    session_id, expires_at = token_session_id(token)
+    revocations.add(session_id, expires_at)
+    await session_async_dal.revoke_session(db, session_id, expires_at)
+
+
+def sync_revocations(db: Client):
+    revocations.replace(dict(session_dal.get_revoked_sessions(db)))
+    logger.debug(f"synced {len(revocations)} session revocations")
+
+
+async def run_revocation_sync(db: Client, interval: float = REVOCATION_SYNC_INTERVAL_SECONDS):
+    """Re-syncs the revocations from Firestore until cancelled."""
+    while True:
+        try:
+            await asyncio.to_thread(sync_revocations, db)
+        except Exception as exc:
+            logger.warning("Syncing session revocations failed", exc_info=exc)
+        await asyncio.sleep(interval)
@@ -0,0 +1,264 @@
+"""Fixtures for the API tests.
+
+The app is built from the routers without main.py, which loads secrets and
+connects to GCP. Firestore is replaced by an in-memory stand-in for the
+subset of the async client the DALs use, so the DALs, the caches and their
+io_ledger recording run unchanged. Every request runs in its own
+io_ledger.measure block; ``client.ledger`` is the ledger of the last request,
+to be checked against an io_ledger.IOBudget.
+"""
+
+import uuid
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+from api import agent_router, contract_router, user_router
+from contracts.cache import contract_cache
+from sessions.cache import session_cache
+from sessions.dal import session_to_dict
+from sessions.schemas import Session
+from usage import io_ledger
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocument", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class FakeDocument:
+    """A document reference. Every awaited method is one round trip; the
+    underscored ones apply a write to a store and are shared with FakeWriteBatch."""
+
+    def __init__(self, db: "FakeAsyncFirestore", path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "FakeCollection":
+        return FakeCollection(self._db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    async def get(self, field_paths: Optional[List[str]] = None) -> FakeSnapshot:
+        self._db.round_trips += 1
+        return self._snapshot(field_paths)
+
+    def _snapshot(self, field_paths: Optional[List[str]] = None) -> FakeSnapshot:
+        data = self._db.store.get(self.path)
+        if data is not None and field_paths is not None:
+            data = {key: value for key, value in data.items() if key in field_paths}
+        return FakeSnapshot(self, data)
+
+    async def create(self, data: Dict[str, Any]):
+        self._db.round_trips += 1
+        self._create(self._db.store, data)
+
+    async def set(self, data: Dict[str, Any], merge: bool = False):
+        self._db.round_trips += 1
+        self._set(self._db.store, data, merge)
+
+    async def update(self, data: Dict[str, Any]):
+        self._db.round_trips += 1
+        self._update(self._db.store, data)
+
+    async def delete(self, option: Any = None):
+        self._db.round_trips += 1
+        self._delete(self._db.store, option)
+
+    def _create(self, store: Dict[str, Dict[str, Any]], data: Dict[str, Any]):
+        if self.path in store:
+            raise AlreadyExists(self.path)
+        store[self.path] = dict(data)
+
+    def _set(self, store: Dict[str, Dict[str, Any]], data: Dict[str, Any], merge: bool = False):
+        if merge and self.path in store:
+            store[self.path] = {**store[self.path], **data}
+        else:
+            store[self.path] = dict(data)
+
+    def _update(self, store: Dict[str, Dict[str, Any]], data: Dict[str, Any]):
+        if self.path not in store:
+            raise NotFound(self.path)
+        store[self.path] = {**store[self.path], **data}
+
+    def _delete(self, store: Dict[str, Dict[str, Any]], option: Any = None):
+        if option is not None and option.exists and self.path not in store:
+            raise NotFound(self.path)
+        store.pop(self.path, None)
+
+
+class FakeWriteBatch:
+    """Writes committed atomically in one round trip."""
+
+    def __init__(self, db: "FakeAsyncFirestore"):
+        self._db = db
+        self._writes: List[Callable[[Dict[str, Dict[str, Any]]], None]] = []
+
+    def create(self, reference: FakeDocument, data: Dict[str, Any]):
+        self._writes.append(lambda store: reference._create(store, data))
+
+    def set(self, reference: FakeDocument, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(lambda store: reference._set(store, data, merge))
+
+    def update(self, reference: FakeDocument, data: Dict[str, Any]):
+        self._writes.append(lambda store: reference._update(store, data))
+
+    def delete(self, reference: FakeDocument, option: Any = None):
+        self._writes.append(lambda store: reference._delete(store, option))
+
+    async def commit(self):
+        self._db.round_trips += 1
+        # applied to a copy, so a failed precondition leaves the store unchanged
+        store = dict(self._db.store)
+        for write in self._writes:
+            write(store)
+        self._db.store.clear()
+        self._db.store.update(store)
+
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "<": lambda a, b: a is not None and a < b,
+    ">": lambda a, b: a is not None and a > b,
+    "in": lambda a, b: a in b,
+}
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeAsyncFirestore", path: str, filters=()):
+        self._db = db
+        self._path = path
+        self._filters = tuple(filters)
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return FakeQuery(self._db, self._path, self._filters + ((field, op, value),))
+
+    async def stream(self):
+        self._db.round_trips += 1
+        prefix = f"{self._path}/"
+        for path, data in list(self._db.store.items()):
+            if not path.startswith(prefix) or "/" in path[len(prefix):]:
+                continue
+            if all(OPERATORS[op](data.get(field), value) for field, op, value in self._filters):
+                yield FakeSnapshot(FakeDocument(self._db, path), data)
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self._db, f"{self._path}/{doc_id or uuid.uuid4().hex}")
+
+
+class FakeAsyncFirestore:
+    """In-memory stand-in for the parts of firestore.AsyncClient used by the async DALs.
+
+    ``round_trips`` counts the RPCs made: a document get or write, a query,
+    a get_all and a batch commit are one each.
+    """
+
+    def __init__(self):
+        # document path -> fields
+        self.store: Dict[str, Dict[str, Any]] = {}
+        self.round_trips = 0
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    @staticmethod
+    def write_option(**kwargs) -> SimpleNamespace:
+        return SimpleNamespace(**kwargs)
+
+    async def get_all(self, refs: List[FakeDocument]):
+        self.round_trips += 1
+        for ref in refs:
+            yield ref._snapshot()
+
+
+class MeasuredClient(TestClient):
+    """TestClient keeping the I/O ledger of its last request."""
+
+    ledger: Optional[io_ledger.IOLedger] = None
+
+
+@pytest.fixture
+def firestore() -> FakeAsyncFirestore:
+    return FakeAsyncFirestore()
+
+
+@pytest.fixture
+def app(firestore: FakeAsyncFirestore) -> FastAPI:
+    app = FastAPI()
+    app.state.firestore_async = firestore
+    app.include_router(contract_router.router)
+    app.include_router(user_router.router)
+    app.include_router(agent_router.router)
+    return app
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    session_cache.clear()
+    contract_cache.clear()
+    yield
+    session_cache.clear()
+    contract_cache.clear()
+
+
+@pytest.fixture
+def session(firestore: FakeAsyncFirestore) -> Session:
+    session = Session(
+        user_id="user@example.com",
+        csrf_token="csrf-token",
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+    )
+    firestore.store[f"sessions/{session.session_id}"] = session_to_dict(session)
+    firestore.store["users/user@example.com"] = {
+        "username": "user",
+        "email": "user@example.com",
+    }
+    return session
+
+
+@pytest.fixture
+def client(app: FastAPI, session: Session):
+    """A signed in client whose requests are measured by io_ledger."""
+    client = MeasuredClient(app)
+
+    @app.middleware("http")
+    async def measure_io(request: Request, call_next):
+        with io_ledger.measure() as ledger:
+            client.ledger = ledger
+            return await call_next(request)
+
+    client.cookies.set("session_id", str(session.session_id))
+    client.headers["X-CSRF-Token"] = session.csrf_token
+    with client:
+        yield client
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from agent.answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache(monkeypatch) -> AnswerCache:
+    cache = AnswerCache(max_invalidations=2)
+    # every question embeds to the same vector, so any stored answer matches
+    monkeypatch.setattr(cache, "embed", lambda text: np.ones(4, dtype=np.float32) / 2)
+    return cache
+
+
+def test_answer_started_before_an_invalidation_is_dropped(cache):
+    generation = cache.generation("c1")
+    cache.invalidate("c1")
+
+    cache.store("c1", "When does it end?", "stale", generation)
+    assert cache.lookup("c1", "When does it end?") is None
+
+    cache.store("c1", "When does it end?", "fresh", cache.generation("c1"))
+    assert cache.lookup("c1", "When does it end?") == "fresh"
+
+
+def test_invalidations_of_other_contracts_keep_the_answer(cache):
+    generation = cache.generation("c1")
+    cache.invalidate("c2")
+
+    cache.store("c1", "When does it end?", "answer", generation)
+    assert cache.lookup("c1", "When does it end?") == "answer"
+
+
+def test_remembered_invalidations_are_bounded(cache):
+    generation = cache.generation("c1")
+    for contract_id in ["c1", "c2", "c3", "c4"]:
+        cache.invalidate(contract_id)
+
+    assert len(cache._invalidations) == 2
+    # the invalidation of c1 is forgotten, its answer is still dropped
+    cache.store("c1", "When does it end?", "stale", generation)
+    assert cache.lookup("c1", "When does it end?") is None
@@ -0,0 +1,107 @@
+"""Listener driven cache coherence, on the FakeSubscriber listeners."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pydantic import BaseModel
+
+from connectors.cache_coherence import CacheCoherence, FakeSubscriber
+from contracts import dal as contracts_dal
+from contracts.cache import contract_cache
+from sessions.cache import session_cache
+from sessions.schemas import Session
+
+
+class Doc(BaseModel):
+    contract_id: str
+
+
+@pytest.fixture
+def fake() -> FakeSubscriber:
+    return FakeSubscriber()
+
+
+@pytest.fixture
+def coherence(fake, monkeypatch):
+    # start() raises the TTLs of the shared caches, restored after the test
+    monkeypatch.setattr(session_cache, "ttl_seconds", session_cache.ttl_seconds)
+    monkeypatch.setattr(contract_cache, "ttl_seconds", contract_cache.ttl_seconds)
+    coherence = CacheCoherence(fake, max_listeners=2)
+    coherence.start()
+    yield coherence
+    coherence.close()
+
+
+def cache_session() -> str:
+    """Caches a session after a miss, as check_session does."""
+    session = Session(
+        user_id="user@example.com",
+        csrf_token="csrf-token",
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+    )
+    session_id = str(session.session_id)
+    assert session_cache.get(session_id) == (False, None)
+    session_cache.put(session_id, session)
+    return session_id
+
+
+def is_cached(session_id: str) -> bool:
+    return session_cache.get(session_id)[0]
+
+
+def unchanged_since_miss(*doc_ids: str):
+    return {doc_id: datetime.now(timezone.utc) - timedelta(minutes=1) for doc_id in doc_ids}
+
+
+def test_remote_change_drops_the_cached_session(coherence, fake):
+    session_id = cache_session()
+    coherence.flush()
+    fake.initial_snapshot(unchanged_since_miss(session_id))
+    assert is_cached(session_id)
+
+    # e.g. a logout on another instance
+    fake.emit("sessions", session_id, "REMOVED")
+
+    assert not is_cached(session_id)
+    assert coherence.invalidations == 1
+
+
+def test_remote_change_drops_the_cached_contract(coherence, fake):
+    contract_cache.get_or_load(contracts_dal.CONTRACT, "c1", lambda: Doc(contract_id="c1"))
+    coherence.flush()
+    fake.initial_snapshot(unchanged_since_miss("c1"))
+
+    fake.emit("contracts", "c1")
+
+    assert contract_cache.stats()["entries"] == 0
+
+
+def test_initial_snapshot_drops_only_entries_changed_since_the_miss(coherence, fake):
+    unchanged, changed = cache_session(), cache_session()
+    coherence.flush()
+
+    fake.initial_snapshot({
+        **unchanged_since_miss(unchanged),
+        changed: datetime.now(timezone.utc) + timedelta(seconds=1),
+    })
+
+    assert is_cached(unchanged)
+    assert not is_cached(changed)
+    # later snapshots drop the entry whatever its update time
+    fake.emit("sessions", unchanged, update_time=datetime.now(timezone.utc) - timedelta(hours=1))
+    assert not is_cached(unchanged)
+
+
+def test_oldest_listener_beyond_max_listeners_is_closed(coherence, fake):
+    session_ids = []
+    for _ in range(3):
+        session_ids.append(cache_session())
+        coherence.flush()
+
+    assert coherence.stats()["listeners"] == 2
+    assert coherence.closed_listeners == 1
+    assert len(fake.subscriptions) == 2
+    # the keys of the closed listener are no longer kept coherent
+    assert not is_cached(session_ids[0])
+    assert is_cached(session_ids[1]) and is_cached(session_ids[2])
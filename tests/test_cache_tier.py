@@ -0,0 +1,157 @@
+"""The shared cache tier on a Redis protocol server, emulated by fakeredis.
+
+Each instance is a ContractCache with its own CacheTier and Redis client on
+the same fakeredis server.
+"""
+
+import time
+
+import fakeredis
+import pytest
+
+from pydantic import BaseModel
+
+from connectors import cache_tier, redis_connector
+from connectors.cache_tier import CacheTier, LocalBackend, RedisBackend
+from contracts.cache import TIER_NAMESPACE, ContractCache
+
+KIND = "contract"
+
+
+class Doc(BaseModel):
+    contract_id: str
+    name: str
+
+
+def unreachable(*args):
+    raise AssertionError("read from Firestore instead of the cache")
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server() -> fakeredis.FakeServer:
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def instances(server):
+    """Creates instances sharing the server, closed after the test."""
+    tiers = []
+
+    def create() -> ContractCache:
+        tier = CacheTier(RedisBackend(fakeredis.FakeRedis(server=server)))
+        tiers.append(tier)
+        cache = ContractCache()
+        cache.use_tier(tier)
+        return cache
+
+    yield create
+    for tier in tiers:
+        tier.close()
+
+
+def test_miss_reads_through_the_shared_tier(instances):
+    first, second = instances(), instances()
+    doc = Doc(contract_id="c1", name="Supply agreement")
+
+    assert first.get_or_load(KIND, "c1", lambda: doc, Doc.model_validate_json) == doc
+    # the load of the first instance is served to the second from L2, then from its L1
+    assert second.get_or_load(KIND, "c1", unreachable, Doc.model_validate_json) == doc
+    assert second.get_or_load(KIND, "c1", unreachable, Doc.model_validate_json) == doc
+    assert second.tier.hits == 1
+    assert second.hits == 1
+
+
+def test_get_many_reads_the_shared_tier_in_one_round_trip(instances, monkeypatch):
+    first, second = instances(), instances()
+    docs = {contract_id: Doc(contract_id=contract_id, name=contract_id) for contract_id in ["c1", "c2", "c3"]}
+    first.get_many_or_load(KIND, ["c1", "c2"], lambda ids: {i: docs[i] for i in ids}, Doc.model_validate_json)
+
+    client = second.tier.backend.client
+    mget_calls = []
+    mget = client.mget
+    monkeypatch.setattr(client, "mget", lambda keys: mget_calls.append(keys) or mget(keys))
+    loads = []
+
+    def load_many(ids):
+        loads.append(ids)
+        return {i: docs[i] for i in ids}
+
+    found = second.get_many_or_load(KIND, ["c1", "c2", "c3"], load_many, Doc.model_validate_json)
+
+    assert found == docs
+    assert len(mget_calls) == 1 and len(mget_calls[0]) == 3
+    # only the key missing from L2 is loaded
+    assert loads == [["c3"]]
+
+
+def test_invalidation_reaches_other_instances(instances, server):
+    first, second = instances(), instances()
+    doc = Doc(contract_id="c1", name="Supply agreement")
+    first.get_or_load(KIND, "c1", lambda: doc, Doc.model_validate_json)
+    second.get_or_load(KIND, "c1", unreachable, Doc.model_validate_json)
+    assert second.stats()["entries"] == 1
+
+    first.invalidate("c1", KIND)
+
+    wait_for(lambda: second.stats()["entries"] == 0)
+    assert second.tier.remote_invalidations == 1
+    assert fakeredis.FakeRedis(server=server).get(f"cip:{TIER_NAMESPACE}:{KIND}/c1") is None
+    # the writing instance does not apply its own invalidation twice
+    assert first.tier.remote_invalidations == 0
+
+
+def test_unavailable_server_falls_back_to_firestore(instances, server):
+    cache = instances()
+    doc = Doc(contract_id="c1", name="Supply agreement")
+    server.connected = False
+
+    assert cache.get_or_load(KIND, "c1", lambda: doc, Doc.model_validate_json) == doc
+    # L1 keeps working
+    assert cache.get_or_load(KIND, "c1", unreachable, Doc.model_validate_json) == doc
+    assert cache.get_many_or_load(KIND, ["c2"], lambda ids: {}, Doc.model_validate_json) == {}
+    cache.invalidate("c1")
+    # the read, the write of the load, the second read and the invalidation
+    assert cache.tier.errors == 4
+
+
+def test_no_tier_when_the_server_is_down_at_startup(server, monkeypatch):
+    server.connected = False
+    monkeypatch.setattr(redis_connector, "get_redis_connection", lambda: fakeredis.FakeRedis(server=server))
+
+    assert cache_tier.create_cache_tier("redis") is None
+
+
+def test_local_backend_expires_and_evicts():
+    backend = LocalBackend(max_entries=2)
+    backend.set_many({"a": b"1"}, ttl_seconds=0)
+    backend.set_many({"b": b"2", "c": b"3"}, ttl_seconds=60)
+    assert backend.get_many(["a", "b", "c"]) == {"b": b"2", "c": b"3"}
+
+    # "b" was read last, so "c" is the least recently used
+    backend.get_many(["b"])
+    backend.set_many({"d": b"4"}, ttl_seconds=60)
+    assert backend.get_many(["b", "c", "d"]) == {"b": b"2", "d": b"4"}
+
+    backend.delete_many(["b"])
+    assert backend.get_many(["b"]) == {}
+
+
+def test_local_backend_delivers_invalidations():
+    backend = LocalBackend()
+    first, second = CacheTier(backend), CacheTier(backend)
+    dropped = {"first": [], "second": []}
+    first.on_invalidate("sessions", dropped["first"].append)
+    second.on_invalidate("sessions", dropped["second"].append)
+    first.set("sessions", "s1", b"session")
+
+    first.invalidate("sessions", ["s1"])
+
+    assert dropped == {"first": [], "second": ["s1"]}
+    assert second.get("sessions", "s1") is None
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from pydantic import BaseModel
+
+from contracts.cache import ContractCache
+
+KIND = "contract"
+
+
+class Doc(BaseModel):
+    contract_id: str
+
+
+def test_invalidation_during_a_load_is_not_cached():
+    cache = ContractCache()
+
+    def load():
+        # e.g. a write of the contract while it is read
+        cache.invalidate("c1")
+        return Doc(contract_id="c1")
+
+    assert cache.get_or_load(KIND, "c1", load) == Doc(contract_id="c1")
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidation_during_an_async_load_is_not_cached():
+    cache = ContractCache()
+
+    async def load_many(contract_ids):
+        cache.invalidate("c1")
+        return {contract_id: Doc(contract_id=contract_id) for contract_id in contract_ids}
+
+    found = asyncio.run(cache.get_many_or_load_async(KIND, ["c1", "c2"], load_many))
+
+    assert set(found) == {"c1", "c2"}
+    assert cache.get_or_load(KIND, "c2", lambda: None) == Doc(contract_id="c2")
+    assert cache.get_or_load(KIND, "c1", lambda: None) is None
+
+
+def test_generations_are_only_kept_for_outstanding_loads():
+    cache = ContractCache()
+    for i in range(100):
+        cache.invalidate(f"c{i}")
+    assert cache._generations == {}
+
+    def load():
+        cache.invalidate("c1")
+        assert cache._generations == {"c1": 1}
+        return Doc(contract_id="c1")
+
+    cache.get_or_load(KIND, "c1", load)
+    assert cache._generations == {}
+    assert cache._loads == {}
+
+
+def test_failed_loads_are_released():
+    cache = ContractCache()
+
+    def load_many(contract_ids):
+        cache.invalidate("c1")
+        raise ConnectionError("Firestore unavailable")
+
+    with pytest.raises(ConnectionError):
+        cache.get_many_or_load(KIND, ["c1", "c1", "c2"], load_many)
+
+    assert cache._generations == {}
+    assert cache._loads == {}
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from contracts import async_dal as contracts_dal
+from contracts.schemas import Contract, ContractType
+
+
+def make_contract() -> Contract:
+    return Contract(
+        user_id="user@example.com",
+        contract_name="Supply agreement",
+        contract_type=ContractType.SUPPLIER_CONTRACT,
+        pdf_uri="pdfs/contract.pdf",
+        md_uri="mds/contract.md",
+    )
+
+
+def test_update_replaces_the_document(firestore):
+    contract = make_contract()
+    path = f"contracts/{contract.contract_id}"
+    # filled as an NDA before
+    firestore.store[path] = {**contract.model_dump(mode="json"), "confidentiality_clause": "Terms of the NDA"}
+    contract.contract_name = "Renamed agreement"
+
+    firestore.round_trips = 0
+    asyncio.run(contracts_dal.update_contract(firestore, contract))
+
+    assert firestore.store[path] == contract.model_dump(mode="json")
+    assert firestore.round_trips == 1
+
+
+def test_update_of_a_missing_contract_fails(firestore):
+    contract = make_contract()
+
+    with pytest.raises(ValueError, match="does not exist"):
+        asyncio.run(contracts_dal.update_contract(firestore, contract))
+
+    assert f"contracts/{contract.contract_id}" not in firestore.store
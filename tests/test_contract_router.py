@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from api import contract_router
+from connectors import chromadb_connector, gcs_connector
+from model import extract
+
+
+@pytest.fixture
+def temp_paths(monkeypatch, tmp_path):
+    """Temp files of the route go to tmp_path; returns the ones created."""
+    monkeypatch.setattr(contract_router.tempfile, "gettempdir", lambda: str(tmp_path))
+    return lambda: sorted(os.listdir(tmp_path))
+
+
+@pytest.fixture
+def upload(client, app, monkeypatch):
+    """Uploads a contract with extraction and GCS stubbed out."""
+    app.state.bucket = None
+    app.state.chromadb = None
+
+    def extract_markdown(pdf_path: str, md_path: str):
+        with open(md_path, "w") as f:
+            f.write("# Contract")
+
+    monkeypatch.setattr(extract, "extract", extract_markdown)
+    monkeypatch.setattr(gcs_connector, "upload_file", lambda bucket, path, uri: None)
+
+    def upload(filename: str = "contract.pdf"):
+        return client.post(
+            "/contract/upload",
+            data={"contract_name": "Supply agreement", "contract_type": "SUPPLIER_CONTRACT"},
+            files={"file": (filename, b"%PDF-1.4", "application/pdf")},
+        )
+
+    return upload
+
+
+def test_failed_indexing_keeps_the_upload(upload, firestore, temp_paths, monkeypatch):
+    def unavailable(*args):
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(chromadb_connector, "write_to_chroma", unavailable)
+
+    response = upload()
+
+    assert response.status_code == 200
+    assert f"contracts/{response.json()['contract_id']}" in firestore.store
+    assert temp_paths() == []
+
+
+def test_failed_upload_removes_the_temp_files(upload, temp_paths, monkeypatch):
+    def unavailable(*args):
+        raise RuntimeError("GCS unavailable")
+
+    monkeypatch.setattr(gcs_connector, "upload_file", unavailable)
+
+    response = upload()
+
+    assert response.status_code == 400
+    assert temp_paths() == []
+
+
+def test_uploaded_file_name_is_not_used_on_disk(upload, temp_paths, monkeypatch):
+    written = []
+    monkeypatch.setattr(chromadb_connector, "chunk_document", lambda path: written.append(path) or [])
+    monkeypatch.setattr(chromadb_connector, "write_to_chroma", lambda *args: None)
+
+    response = upload("../../contract")
+
+    assert response.status_code == 200
+    assert os.path.dirname(written[0]) == contract_router.tempfile.gettempdir()
+    assert temp_paths() == []
@@ -0,0 +1,133 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from contracts.dates import add_months, contract_date_facts, months_between, next_on_schedule
+from contracts.schemas import PaymentFrequency, RenewalType
+
+
+def make_contract(**fields):
+    values = {
+        "effective_date": None,
+        "expiration_date": None,
+        "contract_term": None,
+        "renewal_type": RenewalType.NON_RENEWABLE,
+        "payment_term": None,
+    }
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert add_months(date(2024, 11, 15), 3) == date(2025, 2, 15)
+
+
+def test_months_between_counts_whole_months():
+    assert months_between(date(2024, 1, 31), date(2024, 2, 29)) == 1
+    assert months_between(date(2024, 5, 1), date(2024, 5, 10)) == 0
+
+
+def test_next_on_schedule():
+    assert next_on_schedule(date(2024, 1, 1), 12, date(2023, 6, 1)) == date(2024, 1, 1)
+    assert next_on_schedule(date(2024, 1, 1), 3, date(2024, 4, 2)) == date(2024, 7, 1)
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_next_on_schedule_rejects_non_positive_interval(interval):
+    with pytest.raises(ValueError):
+        next_on_schedule(date(2024, 1, 1), interval, date(2025, 1, 1))
+
+
+def test_active_contract():
+    contract = make_contract(effective_date=date(2024, 1, 1), contract_term=12)
+    facts = contract_date_facts(contract, date(2024, 6, 1))
+
+    assert facts["end_date"] == "2025-01-01"
+    assert facts["end_date_source"] == "effective_date + contract_term"
+    assert facts["status"] == "ACTIVE"
+    assert facts["days_until_end"] == 214
+
+
+def test_automatic_renewal_rolls_forward():
+    contract = make_contract(
+        effective_date=date(2023, 1, 1),
+        expiration_date=date(2024, 1, 1),
+        renewal_type=RenewalType.AUTOMATIC,
+    )
+    facts = contract_date_facts(contract, date(2024, 6, 1))
+
+    assert facts["contract_term_months"] == 12
+    assert facts["status"] == "RENEWED"
+    assert facts["next_renewal_date"] == "2025-01-01"
+    assert facts["days_until_renewal"] == 214
+
+
+def test_automatic_renewal_of_term_under_a_month_is_unknown():
+    contract = make_contract(
+        effective_date=date(2024, 5, 1),
+        expiration_date=date(2024, 5, 10),
+        renewal_type=RenewalType.AUTOMATIC,
+    )
+    facts = contract_date_facts(contract, date(2026, 10, 19))
+
+    assert facts["contract_term_months"] == 0
+    assert facts["next_renewal_date"] is None
+    assert facts["days_until_renewal"] is None
+
+
+def test_automatic_renewal_of_term_under_a_month_before_it_ends():
+    contract = make_contract(
+        effective_date=date(2024, 5, 1),
+        expiration_date=date(2024, 5, 10),
+        renewal_type=RenewalType.AUTOMATIC,
+    )
+    facts = contract_date_facts(contract, date(2024, 5, 5))
+
+    assert facts["next_renewal_date"] == "2024-05-10"
+    assert facts["days_until_renewal"] == 5
+
+
+def test_end_before_effective_date_is_rejected():
+    contract = make_contract(
+        effective_date=date(2024, 5, 10),
+        expiration_date=date(2024, 5, 1),
+        renewal_type=RenewalType.AUTOMATIC,
+    )
+    with pytest.raises(ValueError):
+        contract_date_facts(contract, date(2026, 10, 19))
+
+
+def test_negative_contract_term_is_rejected():
+    contract = make_contract(
+        effective_date=date(2024, 5, 1),
+        contract_term=-12,
+        renewal_type=RenewalType.AUTOMATIC,
+    )
+    with pytest.raises(ValueError):
+        contract_date_facts(contract, date(2026, 10, 19))
+
+
+def test_payment_dates():
+    contract = make_contract(
+        effective_date=date(2024, 1, 15),
+        contract_term=12,
+        payment_term=SimpleNamespace(due_period=30, payment_freq=PaymentFrequency.QUARTERLY),
+    )
+    facts = contract_date_facts(contract, date(2024, 5, 1), invoice_date=date(2024, 4, 20))
+
+    assert facts["next_billing_date"] == "2024-07-15"
+    assert facts["next_payment_due_date"] == "2024-08-14"
+    assert facts["invoice_payment_due_date"] == "2024-05-20"
+
+
+def test_one_time_payment_has_no_schedule():
+    contract = make_contract(
+        effective_date=date(2024, 1, 15),
+        payment_term=SimpleNamespace(due_period=30, payment_freq=PaymentFrequency.ONE_TIME),
+    )
+    facts = contract_date_facts(contract, date(2024, 5, 1))
+
+    assert "next_billing_date" not in facts
+    assert facts["payment_frequency"] == "ONE_TIME"
@@ -0,0 +1,114 @@
+"""I/O budgets of the hot read endpoints, see usage.io_ledger."""
+
+import uuid
+
+from datetime import datetime, timezone
+
+import pytest
+
+from agent.dal import message_to_dict
+from langchain.messages import AIMessage, HumanMessage
+from usage.io_ledger import IOBudget
+
+USER_ID = "user@example.com"
+
+
+def add_contract(firestore, user_id: str = USER_ID) -> str:
+    contract_id = str(uuid.uuid4())
+    firestore.store[f"contracts/{contract_id}"] = {
+        "user_id": user_id,
+        "contract_id": contract_id,
+        "contract_name": "Supply agreement",
+        "contract_type": "SUPPLIER_CONTRACT",
+        "pdf_uri": f"pdfs/{contract_id}.pdf",
+        "md_uri": f"mds/{contract_id}.md",
+    }
+    return contract_id
+
+
+def add_agent(firestore, contract_id: str, messages: int = 0, user_id: str = USER_ID) -> str:
+    agent_id = str(uuid.uuid4())
+    firestore.store[f"agents/{agent_id}"] = {
+        "agent_id": agent_id,
+        "name": "Agent",
+        "user_id": user_id,
+        "selected_contract": contract_id,
+    }
+    created_at = datetime.now(timezone.utc).timestamp()
+    for i in range(messages):
+        cls = HumanMessage if i % 2 == 0 else AIMessage
+        message = cls(content=f"message {i}", additional_kwargs={"created_at": created_at + i})
+        firestore.store[f"agents/{agent_id}/messages/{i}"] = message_to_dict(message)
+    return agent_id
+
+
+# nothing on these paths calls GCS or an LLM or writes
+READ_ONLY = dict(firestore_writes=0, gcs_ops=0, llm_calls=0)
+
+
+def test_get_user(client):
+    response = client.get("/user/get_user")
+
+    assert response.status_code == 200
+    # the session and the user
+    IOBudget(firestore_reads=2, **READ_ONLY).check(client.ledger)
+
+
+def test_session_is_read_once_per_request_and_then_cached(client, firestore):
+    contract_id = add_contract(firestore)
+
+    client.get(f"/contract/get_unval/{contract_id}")
+    IOBudget(firestore_reads=2, **READ_ONLY).check(client.ledger)
+
+    # the session and the contract are served from their caches
+    response = client.get(f"/contract/get_unval/{contract_id}")
+    assert response.status_code == 200
+    assert response.json()["contract_id"] == contract_id
+    IOBudget(firestore_reads=0, **READ_ONLY).check(client.ledger)
+
+
+def test_get_all_contracts_reads_each_contract_once(client, firestore):
+    for _ in range(5):
+        add_contract(firestore)
+    add_contract(firestore, user_id="someone@example.com")
+
+    response = client.get("/contract/get_all")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+    # one query, no read per contract on top of it
+    IOBudget(firestore_reads=1 + 5, **READ_ONLY).check(client.ledger)
+
+
+def test_get_all_agents(client, firestore):
+    contract_id = add_contract(firestore)
+    for _ in range(3):
+        add_agent(firestore, contract_id, messages=4)
+
+    response = client.get("/agent/get_all")
+
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    # the list does not load the messages of the agents
+    IOBudget(firestore_reads=1 + 3, **READ_ONLY).check(client.ledger)
+
+
+@pytest.mark.parametrize("messages", [0, 6])
+def test_get_agent(client, firestore, messages):
+    agent_id = add_agent(firestore, add_contract(firestore), messages=messages)
+
+    response = client.get(f"/agent/{agent_id}")
+
+    assert response.status_code == 200
+    assert len(response.json()["messages"]) == messages
+    # session, agent and its messages; an empty query is billed as one read
+    IOBudget(firestore_reads=2 + max(messages, 1), **READ_ONLY).check(client.ledger)
+
+
+def test_budget_catches_duplicate_reads(client, firestore):
+    contract_id = add_contract(firestore)
+    client.get(f"/contract/get_unval/{contract_id}")
+
+    client.ledger.documents[f"contracts/{contract_id}"] += 1
+    with pytest.raises(AssertionError, match="read 2 times"):
+        IOBudget().check(client.ledger)
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sessions.dal import legacy_expired_before
+from sessions.schemas import Session
+
+CUTOFF = datetime(2024, 5, 1, 12, 0, 0, 250000, tzinfo=timezone.utc)
+
+
+def stored_expires_at(expires_at: datetime) -> str:
+    """expires_at as sessions stored it before it became a timestamp."""
+    session = Session(user_id="user@example.com", csrf_token="csrf-token", expires_at=expires_at)
+    return session.model_dump(mode="json")["expires_at"]
+
+
+@pytest.mark.parametrize(
+    "expires_at",
+    [
+        datetime(2023, 1, 1, tzinfo=timezone.utc),
+        datetime(2024, 5, 1, 11, 59, 59, tzinfo=timezone.utc),
+        datetime(2024, 5, 1, 11, 59, 59, 999999, tzinfo=timezone.utc),
+    ],
+)
+def test_legacy_cutoff_matches_expired_sessions(expires_at):
+    assert stored_expires_at(expires_at) < legacy_expired_before(CUTOFF)
+
+
+@pytest.mark.parametrize(
+    "expires_at",
+    [
+        datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc),
+        datetime(2024, 5, 1, 12, 0, 0, 500000, tzinfo=timezone.utc),
+        datetime(2024, 5, 2, tzinfo=timezone.utc),
+    ],
+)
+def test_legacy_cutoff_keeps_sessions_expiring_later(expires_at):
+    assert stored_expires_at(expires_at) > legacy_expired_before(CUTOFF)
+
+
+def test_legacy_cutoff_is_in_utc():
+    local = CUTOFF.astimezone(timezone(timedelta(hours=5, minutes=30)))
+    assert legacy_expired_before(local) == legacy_expired_before(CUTOFF) == "2024-05-01T12:00:00"
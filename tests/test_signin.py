@@ -0,0 +1,80 @@
+"""Round trips of /user/signin, one test per branch."""
+
+import pytest
+
+from api import user_router
+
+USER_ID = "user@example.com"
+
+# reading the session and the users, then creating the session and a new user
+MAX_ROUND_TRIPS = 2
+
+
+def profile(email: str) -> dict:
+    return {"sub": email, "email": email, "name": email.split("@")[0]}
+
+
+@pytest.fixture(autouse=True)
+def google_token(monkeypatch):
+    """Token verification without Google: the token is the email of the profile."""
+    monkeypatch.setenv("GOOGLE_AUTH_CLIENT_ID", "client-id")
+    monkeypatch.setattr(
+        user_router, "verify_google_id_token", lambda token, client_id: profile(token)
+    )
+
+
+def signin(client, firestore, **body):
+    firestore.round_trips = 0
+    return client.post("/user/signin", json={"token": "", **body})
+
+
+def test_valid_session_with_token(client, firestore, session):
+    response = signin(client, firestore, token=USER_ID, csrf_token=session.csrf_token)
+
+    assert response.status_code == 200
+    assert response.json()["csrf_token"] == session.csrf_token
+    assert firestore.round_trips <= MAX_ROUND_TRIPS
+
+
+def test_valid_session_without_token(client, firestore, session):
+    response = signin(client, firestore, csrf_token=session.csrf_token)
+
+    assert response.status_code == 200
+    assert response.json()["email"] == USER_ID
+    assert firestore.round_trips <= MAX_ROUND_TRIPS
+
+
+def test_valid_session_when_token_verification_fails(client, firestore, session, monkeypatch):
+    def unreachable(token, client_id):
+        raise ConnectionError("certificates unavailable")
+
+    monkeypatch.setattr(user_router, "verify_google_id_token", unreachable)
+
+    response = signin(client, firestore, token=USER_ID, csrf_token=session.csrf_token)
+
+    assert response.status_code == 200
+    assert response.json()["csrf_token"] == session.csrf_token
+
+
+def test_known_user(client, firestore):
+    client.cookies.clear()
+    sessions_before = [path for path in firestore.store if path.startswith("sessions/")]
+
+    response = signin(client, firestore, token=USER_ID)
+
+    assert response.status_code == 200
+    assert response.json()["username"] == "user"
+    sessions = [path for path in firestore.store if path.startswith("sessions/")]
+    assert len(sessions) == len(sessions_before) + 1
+    assert firestore.round_trips <= MAX_ROUND_TRIPS
+
+
+def test_new_user(client, firestore):
+    client.cookies.clear()
+
+    response = signin(client, firestore, token="new@example.com")
+
+    assert response.status_code == 200
+    assert response.json()["email"] == "new@example.com"
+    assert firestore.store["users/new@example.com"]["username"] == "new"
+    assert firestore.round_trips <= MAX_ROUND_TRIPS
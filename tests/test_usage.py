@@ -0,0 +1,73 @@
+import asyncio
+
+from usage import dal as usage_dal
+from usage.schemas import UsageRecord
+from usage.utils import UsageRecorder
+
+
+class FlakyFirestore:
+    """Sync client whose batch commits fail on the given attempts."""
+
+    def __init__(self, failing_commits=()):
+        self.documents = {}
+        self.commits = 0
+        self.failing_commits = set(failing_commits)
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return doc_id
+
+    def batch(self):
+        return FlakyBatch(self)
+
+
+class FlakyBatch:
+    def __init__(self, db: FlakyFirestore):
+        self.db = db
+        self.writes = []
+
+    def set(self, doc_id, data):
+        self.writes.append((doc_id, data))
+
+    def commit(self):
+        self.db.commits += 1
+        if self.db.commits in self.db.failing_commits:
+            raise ConnectionError("commit failed")
+        self.db.documents.update(self.writes)
+
+
+def record(recorder: UsageRecorder, count: int):
+    for _ in range(count):
+        recorder.record(UsageRecord(operation="agent.stream", model_name="gemini-2.5-flash", latency_ms=10))
+
+
+def test_retried_flush_does_not_duplicate_committed_records(monkeypatch):
+    monkeypatch.setattr(usage_dal, "MAX_BATCH_SIZE", 2)
+    recorder = UsageRecorder()
+    record(recorder, 5)
+    # the first batch lands, the second fails
+    db = FlakyFirestore(failing_commits={2})
+
+    asyncio.run(recorder.flush(db))
+    assert len(db.documents) == 2
+
+    asyncio.run(recorder.flush(db))
+    assert len(db.documents) == 5
+    assert recorder.drain() == []
+
+
+def test_buffer_drops_the_oldest_records_beyond_max_pending():
+    recorder = UsageRecorder(max_pending=3)
+    record(recorder, 2)
+    oldest = recorder._pending[0].record_id
+
+    # the failed flush puts its records back in the buffer
+    asyncio.run(recorder.flush(FlakyFirestore(failing_commits={1})))
+    record(recorder, 2)
+
+    pending = recorder.drain()
+    assert len(pending) == 3
+    assert recorder.dropped_records == 1
+    assert oldest not in [record.record_id for record in pending]
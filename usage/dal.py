@@ -0,0 +1,26 @@
+"""Data Access Layer methods for usage records"""
+
+from typing import List
+from google.cloud.firestore import Client
+from usage.schemas import UsageRecord
+
+# Firestore limits a batched write to 500 operations
+MAX_BATCH_SIZE = 500
+
+
+def add_usage_records(db: Client, records: List[UsageRecord]):
+    """
+    Writes usage records to the usage collection in batched writes.
+    Records are set by their record_id, so writing them again after a
+    partly committed call does not duplicate the ones that landed.
+
+    Args:
+        db: Firestore client instance
+        records: Usage records to write
+    """
+    collection = db.collection("usage")
+    for start in range(0, len(records), MAX_BATCH_SIZE):
+        batch = db.batch()
+        for record in records[start : start + MAX_BATCH_SIZE]:
+            batch.set(collection.document(str(record.record_id)), record.model_dump(mode="json"))
+        batch.commit()
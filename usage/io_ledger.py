@@ -0,0 +1,177 @@
+"""Request-scoped accounting of Firestore, GCS and LLM I/O.
+
+Every request runs with an IOLedger bound to a context variable. The DALs,
+gcs_connector and the usage recorder add the I/O they actually do to it:
+documents read and written, GCS operations and bytes, and LLM calls. Cache
+hits do no I/O and are not counted. Like the usage context,
+``asyncio.to_thread`` copies the binding, so I/O made in worker threads is
+counted too.
+
+With IO_LEDGER_ENABLED, on by default in dev, the middleware in main.py
+sets the ``X-IO-Ledger`` response header to the I/O done before the
+response started, and logs the I/O of the whole request once its body is
+sent. A document read more than once by a request is logged as a warning,
+the usual sign of an N+1 access pattern.
+
+``measure`` and ``IOBudget`` check the I/O of a block of code against a
+budget, e.g. of an endpoint called through the test client of tests/conftest.py.
+"""
+
+import logging
+import os
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+IO_LEDGER_ENABLED = os.environ.get(
+    "IO_LEDGER_ENABLED", str(os.environ.get("ENV", "dev") == "dev")
+).lower() == "true"
+IO_LEDGER_HEADER = "X-IO-Ledger"
+
+
+@dataclass
+class IOLedger:
+    """I/O counters of one request."""
+    firestore_reads: int = 0
+    firestore_writes: int = 0
+    gcs_ops: int = 0
+    gcs_bytes: int = 0
+    llm_calls: int = 0
+    # reads by document path, for duplicate detection
+    documents: Counter = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "firestore_reads": self.firestore_reads,
+                "firestore_writes": self.firestore_writes,
+                "gcs_ops": self.gcs_ops,
+                "gcs_bytes": self.gcs_bytes,
+                "llm_calls": self.llm_calls,
+            }
+
+    def header_value(self) -> str:
+        return ", ".join(f"{name}={value}" for name, value in self.to_dict().items())
+
+    def duplicate_reads(self) -> Dict[str, int]:
+        """Documents read more than once, with their read counts."""
+        with self.lock:
+            return {path: count for path, count in self.documents.items() if count > 1}
+
+
+_io_ledger: ContextVar[Optional[IOLedger]] = ContextVar("io_ledger", default=None)
+
+
+def current() -> Optional[IOLedger]:
+    return _io_ledger.get()
+
+
+@contextmanager
+def measure() -> Iterator[IOLedger]:
+    """Binds a new ledger for the I/O done in the block."""
+    ledger = IOLedger()
+    token = _io_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _io_ledger.reset(token)
+
+
+def record_firestore_reads(collection: str, *doc_ids: str, count: Optional[int] = None):
+    """
+    Records reads of documents of a collection. Reads that return no
+    document, e.g. an empty query or a missing document, are billed as one.
+    """
+    ledger = _io_ledger.get()
+    if ledger is None:
+        return
+    with ledger.lock:
+        ledger.firestore_reads += max(count if count is not None else len(doc_ids), 1)
+        for doc_id in doc_ids:
+            ledger.documents[f"{collection}/{doc_id}"] += 1
+
+
+def record_firestore_writes(count: int = 1):
+    ledger = _io_ledger.get()
+    if ledger is None:
+        return
+    with ledger.lock:
+        ledger.firestore_writes += count
+
+
+def record_gcs(num_bytes: int = 0):
+    """Records a GCS operation transferring the given bytes."""
+    ledger = _io_ledger.get()
+    if ledger is None:
+        return
+    with ledger.lock:
+        ledger.gcs_ops += 1
+        ledger.gcs_bytes += num_bytes
+
+
+def record_llm_calls(count: int = 1):
+    ledger = _io_ledger.get()
+    if ledger is None:
+        return
+    with ledger.lock:
+        ledger.llm_calls += count
+
+
+@dataclass
+class IOBudget:
+    """Upper bounds on the I/O of a request; None is unbounded."""
+    firestore_reads: Optional[int] = None
+    firestore_writes: Optional[int] = None
+    gcs_ops: Optional[int] = None
+    gcs_bytes: Optional[int] = None
+    llm_calls: Optional[int] = None
+    # whether a document may be read more than once
+    duplicate_reads: bool = False
+
+    def violations(self, ledger: IOLedger) -> List[str]:
+        spent = ledger.to_dict()
+        found = [
+            f"{budget.name}: {spent[budget.name]} > {getattr(self, budget.name)}"
+            for budget in fields(self)
+            if budget.name in spent
+            and getattr(self, budget.name) is not None
+            and spent[budget.name] > getattr(self, budget.name)
+        ]
+        if not self.duplicate_reads:
+            found.extend(
+                f"{path} read {count} times" for path, count in ledger.duplicate_reads().items()
+            )
+        return found
+
+    def check(self, ledger: IOLedger):
+        """Raises AssertionError listing the exceeded bounds."""
+        violations = self.violations(ledger)
+        if violations:
+            raise AssertionError("I/O budget exceeded: " + "; ".join(violations))
+
+
+def log_request(method: str, path: str, ledger: IOLedger):
+    logger.info(f"{method} {path} I/O: {ledger.header_value()}")
+    duplicates = ledger.duplicate_reads()
+    if duplicates:
+        logger.warning(f"{method} {path} read documents more than once: {duplicates}")
+
+
+if __name__ == "__main__":
+    # A request reading the same contract twice, checked against its budget
+    with measure() as ledger:
+        record_firestore_reads("sessions", "session-1")
+        record_firestore_reads("contracts", "contract-1")
+        record_firestore_reads("contracts", "contract-1")
+        record_gcs(2048)
+        record_llm_calls()
+
+    print(ledger.header_value())
+    print(IOBudget(firestore_reads=2, gcs_ops=1, llm_calls=1).violations(ledger))
@@ -0,0 +1,64 @@
+"""Pydantic schemas for LLM usage accounting."""
+
+from pydantic import BaseModel, Field, ConfigDict
+from typing import Optional
+from datetime import datetime, timezone
+from enum import Enum
+import uuid
+
+
+class UsageDimension(str, Enum):
+    """Dimensions usage is aggregated by."""
+    USER = "user"
+    AGENT = "agent"
+    CONTRACT = "contract"
+    OPERATION = "operation"
+
+
+class UsageRecord(BaseModel):
+    """Token, latency and cost figures of a single LLM call or agent turn."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    record_id: uuid.UUID = Field(
+        default_factory=uuid.uuid4, description="Unique identifier of the record, the ID of its document."
+    )
+    operation: str = Field(..., description="The operation that made the call, e.g. 'agent.stream', 'model.fill'.")
+    model_name: str = Field(..., description="The name of the model that served the call.")
+    user_id: Optional[str] = Field(None, description="The user the call was made for.")
+    agent_id: Optional[str] = Field(None, description="The agent the call was made for.")
+    contract_id: Optional[str] = Field(None, description="The contract the call was made for.")
+
+    input_tokens: int = Field(0, description="Prompt tokens, including cached tokens.")
+    output_tokens: int = Field(0, description="Generated tokens, including thinking tokens.")
+    cached_tokens: int = Field(0, description="Prompt tokens served from a context cache.")
+    tool_calls: int = Field(0, description="Number of tool calls made by the model.")
+
+    ttft_ms: Optional[float] = Field(None, description="Time to the first generated token in milliseconds.")
+    latency_ms: float = Field(..., description="Total latency of the call in milliseconds.")
+    cost_usd: float = Field(0.0, description="Estimated cost of the call in USD.")
+
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        description="When the call completed.",
+    )
+
+
+class UsageSummary(BaseModel):
+    """Aggregated usage of one key of a dimension."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    dimension: UsageDimension = Field(..., description="The dimension the usage is aggregated by.")
+    key: str = Field(..., description="The user, agent, contract or operation the usage belongs to.")
+    calls: int = Field(..., description="Number of recorded calls.")
+    input_tokens: int = Field(..., description="Total prompt tokens.")
+    output_tokens: int = Field(..., description="Total generated tokens.")
+    cached_tokens: int = Field(..., description="Total prompt tokens served from a context cache.")
+    tool_calls: int = Field(..., description="Total tool calls.")
+    cost_usd: float = Field(..., description="Total estimated cost in USD.")
+    latency_p50_ms: Optional[float] = Field(None, description="Median latency of recent calls.")
+    latency_p90_ms: Optional[float] = Field(None, description="90th percentile latency of recent calls.")
+    latency_p99_ms: Optional[float] = Field(None, description="99th percentile latency of recent calls.")
+    ttft_p50_ms: Optional[float] = Field(None, description="Median time to first token of recent calls.")
+    ttft_p99_ms: Optional[float] = Field(None, description="99th percentile time to first token of recent calls.")
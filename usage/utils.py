@@ -0,0 +1,334 @@
+"""In-memory accounting of LLM usage.
+
+Every LLM call records a UsageRecord. Records are aggregated per user, agent,
+contract and operation in memory and flushed to Firestore in batches by a
+background task started from the FastAPI lifespan. At most
+USAGE_MAX_AGGREGATES aggregates are kept, the least recently updated ones
+are dropped first. A failed flush keeps its records for the next one, up to
+USAGE_MAX_PENDING buffered records; beyond it the oldest are dropped.
+
+The user, agent and contract of a call are taken from a context variable
+bound by the routers, so the model functions do not need to know about them.
+``asyncio.to_thread`` copies the context, so bindings reach calls made in
+worker threads.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from google.cloud.firestore import Client
+from langchain.messages import AIMessage, AnyMessage
+
+from usage import dal as usage_dal, io_ledger
+from usage.schemas import UsageDimension, UsageRecord, UsageSummary
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("USAGE_FLUSH_INTERVAL", 60))
+USAGE_FLUSH_BATCH_SIZE = int(os.environ.get("USAGE_FLUSH_BATCH_SIZE", 200))
+
+# latency samples kept per aggregate for percentiles
+USAGE_LATENCY_SAMPLES = 1000
+
+# aggregates kept in memory, the least recently updated are dropped beyond it;
+# every record is flushed to Firestore regardless
+USAGE_MAX_AGGREGATES = int(os.environ.get("USAGE_MAX_AGGREGATES", 10000))
+
+# records buffered for Firestore, the oldest are dropped beyond it while flushes fail
+USAGE_MAX_PENDING = int(os.environ.get("USAGE_MAX_PENDING", 10000))
+
+# USD per million tokens: (input, output, cached input)
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gemini-2.5-flash": (0.30, 2.50, 0.03),
+    "gemini-2.5-flash-lite": (0.10, 0.40, 0.01),
+    "gemini-2.5-pro": (1.25, 10.00, 0.125),
+}
+
+_usage_context: ContextVar[Dict[str, Optional[str]]] = ContextVar(
+    "usage_context", default={}
+)
+
+
+def bind_usage_context(
+    user_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    contract_id: Optional[str] = None,
+):
+    """Binds the user, agent and contract that LLM calls in this context are made for."""
+    bound = dict(_usage_context.get())
+    for key, value in (
+        ("user_id", user_id),
+        ("agent_id", agent_id),
+        ("contract_id", contract_id),
+    ):
+        if value is not None:
+            bound[key] = value
+    _usage_context.set(bound)
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int) -> float:
+    """Estimates the cost of a call in USD, 0 for models without a known price."""
+    prices = MODEL_PRICES.get(model_name.removeprefix("models/"))
+    if prices is None:
+        return 0.0
+    input_price, output_price, cached_price = prices
+    return (
+        (input_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of the values, None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class UsageAggregate:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    tool_calls: int = 0
+    cost_usd: float = 0.0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=USAGE_LATENCY_SAMPLES))
+    ttfts: Deque[float] = field(default_factory=lambda: deque(maxlen=USAGE_LATENCY_SAMPLES))
+
+    def add(self, record: UsageRecord):
+        self.calls += 1
+        self.input_tokens += record.input_tokens
+        self.output_tokens += record.output_tokens
+        self.cached_tokens += record.cached_tokens
+        self.tool_calls += record.tool_calls
+        self.cost_usd += record.cost_usd
+        self.latencies.append(record.latency_ms)
+        if record.ttft_ms is not None:
+            self.ttfts.append(record.ttft_ms)
+
+
+class UsageRecorder:
+    """Aggregates usage records in memory and buffers them for batched flushes."""
+
+    def __init__(
+        self,
+        batch_size: int = USAGE_FLUSH_BATCH_SIZE,
+        max_aggregates: int = USAGE_MAX_AGGREGATES,
+        max_pending: int = USAGE_MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.max_aggregates = max_aggregates
+        self.max_pending = max_pending
+        self.evicted_aggregates = 0
+        self.dropped_records = 0
+        self._pending: List[UsageRecord] = []
+        self._aggregates: "OrderedDict[Tuple[UsageDimension, str], UsageAggregate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def record(self, record: UsageRecord):
+        keys = [
+            (UsageDimension.OPERATION, record.operation),
+            (UsageDimension.USER, record.user_id),
+            (UsageDimension.AGENT, record.agent_id),
+            (UsageDimension.CONTRACT, record.contract_id),
+        ]
+        with self._lock:
+            for dimension, key in keys:
+                if key is None:
+                    continue
+                self._aggregates.setdefault((dimension, key), UsageAggregate()).add(record)
+                self._aggregates.move_to_end((dimension, key))
+            while len(self._aggregates) > self.max_aggregates:
+                self._aggregates.popitem(last=False)
+                self.evicted_aggregates += 1
+            self._pending.append(record)
+            self._trim_pending()
+            full = len(self._pending) >= self.batch_size
+
+        if full and self._flush_requested is not None and self._loop is not None:
+            # records may come from worker threads
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+
+    def summary(self, dimension: UsageDimension) -> List[UsageSummary]:
+        """Returns the aggregated usage of every key of the dimension, most expensive first."""
+        with self._lock:
+            items = [
+                (key, aggregate, list(aggregate.latencies), list(aggregate.ttfts))
+                for (dim, key), aggregate in self._aggregates.items()
+                if dim == dimension
+            ]
+
+        summaries = [
+            UsageSummary(
+                dimension=dimension,
+                key=key,
+                calls=aggregate.calls,
+                input_tokens=aggregate.input_tokens,
+                output_tokens=aggregate.output_tokens,
+                cached_tokens=aggregate.cached_tokens,
+                tool_calls=aggregate.tool_calls,
+                cost_usd=round(aggregate.cost_usd, 6),
+                latency_p50_ms=percentile(latencies, 50),
+                latency_p90_ms=percentile(latencies, 90),
+                latency_p99_ms=percentile(latencies, 99),
+                ttft_p50_ms=percentile(ttfts, 50),
+                ttft_p99_ms=percentile(ttfts, 99),
+            )
+            for key, aggregate, latencies, ttfts in items
+        ]
+        summaries.sort(key=lambda summary: summary.cost_usd, reverse=True)
+        return summaries
+
+    def _trim_pending(self):
+        # caller holds self._lock
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            del self._pending[:excess]
+            self.dropped_records += excess
+
+    def drain(self) -> List[UsageRecord]:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    async def flush(self, db: Client):
+        """
+        Writes the buffered records to Firestore, keeping them buffered on
+        failure. Records are written by their record_id, so the ones a failed
+        flush committed are not duplicated by the next one.
+        """
+        pending = self.drain()
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(usage_dal.add_usage_records, db, pending)
+            logger.debug(f"flushed {len(pending)} usage records")
+        except Exception as exc:
+            logger.error("Flushing usage records failed", exc_info=exc)
+            with self._lock:
+                self._pending = pending + self._pending
+                self._trim_pending()
+
+    async def run_flusher(self, db: Client, interval: float = USAGE_FLUSH_INTERVAL_SECONDS):
+        """Flushes every interval seconds or when a batch fills up, until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._flush_requested = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                await self.flush(db)
+        finally:
+            await self.flush(db)
+
+
+recorder = UsageRecorder()
+
+
+def record_usage(
+    operation: str,
+    model_name: str,
+    started: float,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cached_tokens: int = 0,
+    tool_calls: int = 0,
+    first_token_at: Optional[float] = None,
+    llm_calls: int = 1,
+    **context: Optional[str],
+):
+    """
+    Records a call that started at the given time.perf_counter() value, made
+    of llm_calls model calls. Keyword arguments override the user, agent and
+    contract bound to the context.
+    """
+    now = time.perf_counter()
+    io_ledger.record_llm_calls(llm_calls)
+    bound = {**_usage_context.get(), **{k: v for k, v in context.items() if v is not None}}
+    try:
+        recorder.record(
+            UsageRecord(
+                operation=operation,
+                model_name=model_name,
+                user_id=bound.get("user_id"),
+                agent_id=bound.get("agent_id"),
+                contract_id=bound.get("contract_id"),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=cached_tokens,
+                tool_calls=tool_calls,
+                ttft_ms=(first_token_at - started) * 1000 if first_token_at else None,
+                latency_ms=(now - started) * 1000,
+                cost_usd=estimate_cost(model_name, input_tokens, output_tokens, cached_tokens),
+            )
+        )
+    except Exception as exc:
+        # accounting must never fail the call it accounts for
+        logger.error("Recording usage failed", exc_info=exc)
+
+
+def record_genai_response(operation: str, model_name: str, response: Any, started: float):
+    """Records a google-genai generate_content response."""
+    metadata = getattr(response, "usage_metadata", None)
+    record_usage(
+        operation,
+        model_name,
+        started,
+        input_tokens=(getattr(metadata, "prompt_token_count", None) or 0),
+        output_tokens=(getattr(metadata, "candidates_token_count", None) or 0)
+        + (getattr(metadata, "thoughts_token_count", None) or 0),
+        cached_tokens=(getattr(metadata, "cached_content_token_count", None) or 0),
+    )
+
+
+def record_agent_messages(
+    operation: str,
+    messages: List[AnyMessage],
+    started: float,
+    first_token_at: Optional[float] = None,
+    agent_id: Optional[str] = None,
+):
+    """Records an agent turn from the AI messages it generated."""
+    input_tokens = output_tokens = cached_tokens = tool_calls = llm_calls = 0
+    model_name = "unknown"
+    for msg in messages:
+        if not isinstance(msg, AIMessage):
+            continue
+        llm_calls += 1
+        model_name = msg.response_metadata.get("model_name", model_name)
+        tool_calls += len(msg.tool_calls)
+        if msg.usage_metadata:
+            input_tokens += msg.usage_metadata.get("input_tokens", 0)
+            output_tokens += msg.usage_metadata.get("output_tokens", 0)
+            cached_tokens += (msg.usage_metadata.get("input_token_details") or {}).get("cache_read", 0)
+
+    record_usage(
+        operation,
+        model_name,
+        started,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cached_tokens=cached_tokens,
+        tool_calls=tool_calls,
+        first_token_at=first_token_at,
+        llm_calls=llm_calls,
+        agent_id=agent_id,
+    )
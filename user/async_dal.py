@@ -0,0 +1,141 @@
+"""Data Access Layer methods for users on the async Firestore client.
+
+Mirrors user.dal for handlers running on the event loop.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore import AsyncClient
+from user.schemas import User
+from sessions.schemas import Session
+from sessions.dal import session_to_dict
+from usage import io_ledger
+
+
+async def add_user(db: AsyncClient, user: User) -> str:
+    """
+    Add a user to the users collection in Firestore.
+
+    Args:
+        db: Async Firestore client instance
+        user: User object to add
+
+    Returns:
+        str: The document ID of the created user
+
+    Throws:
+        ValueError: If a user with the same email already exists
+    """
+    doc_ref = db.collection("users").document(str(user.email))
+    try:
+        await doc_ref.create(user.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
+        raise ValueError(f"User with email {user.email} already exists.")
+    return doc_ref.id
+
+
+async def get_user(db: AsyncClient, email: str) -> Optional[User]:
+    """
+    Get a user from the users collection by user ID.
+
+    Args:
+        db: Async Firestore client instance
+        email: The email ID to retrieve
+
+    Returns:
+        Optional[User]: The user object if found, None otherwise
+    """
+    doc = await db.collection("users").document(email).get()
+    io_ledger.record_firestore_reads("users", email)
+    if not doc.exists:
+        return None
+    return User(**doc.to_dict())  # type: ignore
+
+
+async def delete_user(db: AsyncClient, user_id: str) -> bool:
+    """
+    Delete a user from the users collection by user ID.
+
+    Args:
+        db: Async Firestore client instance
+        user_id: The user ID to delete
+
+    Returns:
+        bool: True if the user was deleted, False if the user was not found
+    """
+    doc_ref = db.collection("users").document(user_id)
+    try:
+        await doc_ref.delete(option=db.write_option(exists=True))
+    except NotFound:
+        return False
+    finally:
+        io_ledger.record_firestore_writes()
+    return True
+
+
+async def get_signin_documents(
+    db: AsyncClient, session_id: Optional[str], emails: List[str]
+) -> Tuple[Optional[Session], Dict[str, User]]:
+    """
+    Read the session and the users a sign-in needs in one batched round trip.
+
+    Args:
+        db: Async Firestore client instance
+        session_id: The session ID from the cookie, if any
+        emails: The user IDs to read
+
+    Returns:
+        Tuple[Optional[Session], Dict[str, User]]: The session if found, and the users found by email
+    """
+    refs = [db.collection("users").document(email) for email in dict.fromkeys(emails)]
+    if session_id:
+        refs.append(db.collection("sessions").document(session_id))
+    if not refs:
+        return None, {}
+
+    if emails:
+        io_ledger.record_firestore_reads("users", *dict.fromkeys(emails))
+    if session_id:
+        io_ledger.record_firestore_reads("sessions", session_id)
+
+    session = None
+    users: Dict[str, User] = {}
+    async for snapshot in db.get_all(refs):
+        if not snapshot.exists:
+            continue
+        if snapshot.reference.parent.id == "sessions":
+            session = Session(**snapshot.to_dict())  # type: ignore
+        else:
+            users[snapshot.id] = User(**snapshot.to_dict())  # type: ignore
+    return session, users
+
+
+async def create_signin(db: AsyncClient, session: Optional[Session], user: Optional[User]):
+    """
+    Create a new session and a new user in one round trip. Both are created
+    with the exists=False precondition, so an existing document is never
+    overwritten.
+
+    Args:
+        db: Async Firestore client instance
+        session: Session to create, if any
+        user: User to create, if any
+
+    Throws:
+        ValueError: If the session or the user already exists
+    """
+    batch = db.batch()
+    if user is not None:
+        batch.create(db.collection("users").document(str(user.email)), user.model_dump(mode="json"))
+    if session is not None:
+        batch.create(
+            db.collection("sessions").document(str(session.session_id)),
+            session_to_dict(session),
+        )
+
+    try:
+        await batch.commit()
+        io_ledger.record_firestore_writes((user is not None) + (session is not None))
+    except AlreadyExists as exc:
+        raise ValueError("Session or user already exists.") from exc
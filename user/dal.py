@@ -1,9 +1,12 @@
 """Data Access Layer methods for users"""
 
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from google.api_core.exceptions import AlreadyExists, NotFound
 from google.cloud.firestore import Client
 from user.schemas import User
-from google.cloud import firestore
+from sessions.schemas import Session
+from sessions import dal as session_dal
+from usage import io_ledger
 
 
 
@@ -21,19 +24,11 @@ def add_user(db: Client, user: User) -> str:
     Throws:
         ValueError: If a user with the same email already exists
     """
-    @firestore.transactional
-    def transaction_add_user(transaction, doc_ref, user):
-        snapshot = doc_ref.get(transaction=transaction)
-        if snapshot.exists:
-            return False
-        transaction.set(doc_ref, user.model_dump(mode="json"))
-        return True
-    
     doc_ref = db.collection("users").document(str(user.email))
-    txn = db.transaction()
-    is_success = transaction_add_user(txn, doc_ref, user)
-
-    if not is_success:
+    try:
+        doc_ref.create(user.model_dump(mode="json"))
+        io_ledger.record_firestore_writes()
+    except AlreadyExists:
         raise ValueError(f"User with email {user.email} already exists.")
     return doc_ref.id
 
@@ -50,6 +45,7 @@ def get_user(db: Client, email: str) -> Optional[User]:
     """
     doc_ref = db.collection("users").document(email)
     doc = doc_ref.get()
+    io_ledger.record_firestore_reads("users", email)
     if not doc.exists:
         return None
     return User(**doc.to_dict())  # type: ignore
@@ -67,13 +63,83 @@ def delete_user(db: Client, user_id: str) -> bool:
         bool: True if the user was deleted, False if the user was not found
     """
     doc_ref = db.collection("users").document(user_id)
-    doc = doc_ref.get()
-    if not doc.exists:
+    try:
+        # the exists=True precondition fails the delete of a missing user
+        doc_ref.delete(option=db.write_option(exists=True))
+    except NotFound:
         return False
-    doc_ref.delete()
+    finally:
+        io_ledger.record_firestore_writes()
     return True
 
 
+def get_signin_documents(
+    db: Client, session_id: Optional[str], emails: List[str]
+) -> Tuple[Optional[Session], Dict[str, User]]:
+    """
+    Read the session and the users a sign-in needs in one batched round trip.
+
+    Args:
+        db: Firestore client instance
+        session_id: The session ID from the cookie, if any
+        emails: The user IDs to read
+
+    Returns:
+        Tuple[Optional[Session], Dict[str, User]]: The session if found, and the users found by email
+    """
+    refs = [db.collection("users").document(email) for email in dict.fromkeys(emails)]
+    if session_id:
+        refs.append(db.collection("sessions").document(session_id))
+    if not refs:
+        return None, {}
+
+    if emails:
+        io_ledger.record_firestore_reads("users", *dict.fromkeys(emails))
+    if session_id:
+        io_ledger.record_firestore_reads("sessions", session_id)
+
+    session = None
+    users: Dict[str, User] = {}
+    for snapshot in db.get_all(refs):
+        if not snapshot.exists:
+            continue
+        if snapshot.reference.parent.id == "sessions":
+            session = Session(**snapshot.to_dict())  # type: ignore
+        else:
+            users[snapshot.id] = User(**snapshot.to_dict())  # type: ignore
+    return session, users
+
+
+def create_signin(db: Client, session: Optional[Session], user: Optional[User]):
+    """
+    Create a new session and a new user in one round trip. Both are created
+    with the exists=False precondition, so an existing document is never
+    overwritten.
+
+    Args:
+        db: Firestore client instance
+        session: Session to create, if any
+        user: User to create, if any
+
+    Throws:
+        ValueError: If the session or the user already exists
+    """
+    batch = db.batch()
+    if user is not None:
+        batch.create(db.collection("users").document(str(user.email)), user.model_dump(mode="json"))
+    if session is not None:
+        batch.create(
+            db.collection("sessions").document(str(session.session_id)),
+            session_dal.session_to_dict(session),
+        )
+
+    try:
+        batch.commit()
+        io_ledger.record_firestore_writes((user is not None) + (session is not None))
+    except AlreadyExists as exc:
+        raise ValueError("Session or user already exists.") from exc
+
+
 if __name__ == "__main__":
     from connectors import firestore_connector
     from dotenv import load_dotenv